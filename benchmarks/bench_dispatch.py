@@ -0,0 +1,107 @@
+"""Messages per second through the dashboard's MQTT message path.
+
+Compares the original decode/print/if-elif on_message with TopicDispatcher
+on a stream dominated by traffic/distance, as published by the violation ESP.
+
+    python -m benchmarks.bench_dispatch [--messages N]
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import time
+
+from mqtt_dispatch import TopicDispatcher
+
+# One UI tick (500 ms) worth of ESP traffic: distance every ~10 ms,
+# density once a second, the occasional phase change
+TICK_MESSAGES = 50
+
+
+def make_stream(n, seed=1):
+    rng = random.Random(seed)
+    stream = []
+    for i in range(n):
+        # Phase is tested first: every multiple of 500 is also one of 100
+        if i % 500 == 0:
+            stream.append(('traffic/phase', rng.choice([b'H_GREEN', b'H_YELLOW', b'V_GREEN', b'V_YELLOW'])))
+        elif i % 100 == 0:
+            stream.append(('traffic/density', json.dumps({'H': rng.randint(0, 2), 'V': rng.randint(0, 2)}).encode()))
+        else:
+            stream.append(('traffic/distance', json.dumps({'distance': rng.randint(5, 400)}).encode()))
+    return stream
+
+
+class LegacyHandler:
+    """Copy of the original TrafficSystemUI.on_message message path"""
+
+    def __init__(self):
+        self.traffic_phase = "Unknown"
+        self.h_density = 0
+        self.v_density = 0
+        self.last_distance = 0
+        self.crosswalk_status = "Clear"
+
+    def on_message(self, topic, raw):
+        payload = raw.decode()
+        print(f"Received: {topic} - {payload}")
+
+        if topic == 'traffic/phase':
+            self.traffic_phase = payload
+            if payload in ["H_GREEN", "H_YELLOW"]:
+                self.crosswalk_status = "Clear"
+            elif payload in ["V_GREEN", "V_YELLOW"]:
+                self.crosswalk_status = "Not Clear"
+        elif topic == 'traffic/density':
+            density_data = json.loads(payload)
+            self.h_density = density_data.get('H', 0)
+            self.v_density = density_data.get('V', 0)
+        elif topic == 'traffic/distance':
+            distance_data = json.loads(payload)
+            self.last_distance = distance_data.get('distance', 0)
+
+
+def bench_legacy(stream):
+    handler = LegacyHandler()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        for topic, payload in stream:
+            handler.on_message(topic, payload)
+        return time.perf_counter() - start
+
+
+def bench_dispatcher(stream, stats):
+    state = {}
+    dispatcher = TopicDispatcher()
+    dispatcher.register('traffic/phase', lambda p: state.__setitem__('phase', p.decode()))
+    dispatcher.register('traffic/density', lambda p, s: state.__setitem__('density', json.loads(p)), coalesce=True)
+    dispatcher.register('traffic/distance', lambda p, s: state.__setitem__('distance', json.loads(p)),
+                        coalesce=True, stats_field='distance' if stats else None)
+    start = time.perf_counter()
+    for i, (topic, payload) in enumerate(stream):
+        dispatcher.dispatch(topic, payload)
+        if i % TICK_MESSAGES == 0:
+            dispatcher.drain()
+    dispatcher.drain()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200000)
+    args = parser.parse_args()
+
+    stream = make_stream(args.messages)
+    results = [
+        ("legacy on_message (print to /dev/null)", bench_legacy(stream)),
+        ("dispatcher, coalesced", bench_dispatcher(stream, stats=False)),
+        ("dispatcher, coalesced + distance stats", bench_dispatcher(stream, stats=True)),
+    ]
+    baseline = results[0][1]
+    for name, elapsed in results:
+        print(f"{name:42s} {len(stream) / elapsed:12,.0f} msg/s  ({baseline / elapsed:5.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
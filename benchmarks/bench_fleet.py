@@ -0,0 +1,114 @@
+"""Fleet ingest throughput and query cost by number of shard processes.
+
+A TrafficEngine (fake backend, no cameras) with fleet_shards set runs on
+a LocalBroker and receives the synthetic stream of N intersections on
+site/<id>/traffic/... topics (or a recording), published as fast as
+possible. Messages take the real path: broker, the engine's fleet
+connection and FleetIngest.submit() on its network thread, then the
+shards. A run is timed until every message has been applied; 0 shards
+keeps the state in-process (the baseline). Queries are timed on the
+merged state afterwards: the whole fleet (snapshot), one site and the
+fleet totals. Scaling needs as many free cores as shards plus the
+broker and network threads.
+
+    python -m benchmarks.bench_fleet [--intersections 100 1000] [--seconds 60] [--shards 0 1 2 4]
+                                     [--recording FILE]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import traffic_core
+from config import Config
+from local_broker import LocalBroker
+from mqtt_replay import SyntheticFleet, read_stream
+from violation_store import FakeBackend
+
+# Give up on a run if the shards have not caught up after this long
+DRAIN_TIMEOUT = 60.0
+QUERY_REPEATS = 200
+
+
+def run(messages, shards):
+    workdir = tempfile.mkdtemp(prefix="bench_fleet_")
+    broker = LocalBroker()
+    config = Config(overrides={'camera_sources': [], 'violations_dir': os.path.join(workdir, "violations"),
+                               'record_telemetry': False, 'fleet_shards': shards, 'fleet_report_interval': 0.05})
+    engine = traffic_core.TrafficEngine(FakeBackend(), config, mqtt_client=broker.client("dashboard"),
+                                        fleet_client=broker.client("fleet"))
+    engine.start()
+    broker.wait_for_subscriber('site/0/traffic/phase')
+    # The spawned shards import the modules first; keep that out of the timing
+    time.sleep(0.5 if shards else 0.0)
+    ingest = engine.fleet
+
+    publisher = broker.client("bench")
+    publisher.connect()
+    start = time.perf_counter()
+    for timestamp, topic, payload, qos, retain in messages:
+        # Retained messages would be re-delivered to later subscribers; not part of the load
+        publisher.publish(topic, payload, qos, False)
+    publish_time = time.perf_counter() - start
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    while ingest.processed < len(messages) and time.monotonic() < deadline:
+        time.sleep(0.005)
+        if not shards:
+            ingest.flush()
+    elapsed = time.perf_counter() - start
+    processed = ingest.processed
+    local_dropped = sum(engine.connection.inbound.dropped.values())
+
+    sites = ingest.sites()
+    timings = {}
+    for name, query in (('snapshot', ingest.snapshot), ('site', lambda: ingest.site(sites[len(sites) // 2])),
+                        ('totals', ingest.totals)):
+        query_start = time.perf_counter()
+        for _ in range(QUERY_REPEATS):
+            query()
+        timings[name] = (time.perf_counter() - query_start) / QUERY_REPEATS
+    engine.stop()
+    return {
+        'processed': processed,
+        'sites': len(sites),
+        'local_dropped': local_dropped,
+        'publish_rate': len(messages) / publish_time,
+        'throughput': processed / elapsed,
+        'snapshot_ms': timings['snapshot'] * 1000.0,
+        'site_us': timings['site'] * 1e6,
+        'totals_us': timings['totals'] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recording', help="Ingest this recording (site/<id>/... topics) instead")
+    parser.add_argument('--intersections', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--seconds', type=float, default=60.0, help="Simulated seconds of synthetic traffic")
+    parser.add_argument('--shards', type=int, nargs='+', default=[0, 1, 2, 4])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.recording:
+        sources = [(os.path.basename(args.recording), list(read_stream(args.recording)))]
+    else:
+        # Generated up front so generation cost does not count as ingest time
+        sources = [(f"synthetic x{n}",
+                    list(SyntheticFleet(n, seed=args.seed, topic_format="site/{site}/{topic}").stream(args.seconds)))
+                   for n in args.intersections]
+    print(f"{os.cpu_count()} CPUs")
+    print(f"{'source':18s} {'shards':>6s} {'messages':>9s} {'applied':>9s} {'sites':>6s} {'pub msg/s':>10s} "
+          f"{'msg/s':>10s} {'speedup':>8s} {'snapshot ms':>11s} {'site us':>8s} {'totals us':>9s} {'local drop':>10s}")
+    for name, messages in sources:
+        baseline = None
+        for shards in args.shards:
+            result = run(messages, shards)
+            baseline = baseline or result['throughput']
+            print(f"{name:18s} {shards:6d} {len(messages):9d} {result['processed']:9d} {result['sites']:6d} "
+                  f"{result['publish_rate']:10,.0f} {result['throughput']:10,.0f} "
+                  f"{result['throughput'] / baseline:7.1f}x {result['snapshot_ms']:11.3f} "
+                  f"{result['site_us']:8.1f} {result['totals_us']:9.1f} {result['local_dropped']:10d}")
+
+
+if __name__ == "__main__":
+    main()
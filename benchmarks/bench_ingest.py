@@ -0,0 +1,113 @@
+"""End-to-end MQTT ingest: throughput, delivery latency and drops.
+
+A TrafficEngine (fake backend, no cameras) runs on a LocalBroker and
+receives either a recording or the synthetic stream of N intersections
+(all on the shared topics, i.e. the aggregate load of N sites on one
+dashboard). Latency is measured from publish to the engine's message handler;
+drops are messages published but never handled; 'queue' counts the
+QoS 0 messages the engine's inbound queue shed under overload.
+
+    python -m benchmarks.bench_ingest [--recording FILE] [--intersections 1 100 500]
+                                      [--seconds 60] [--speed max|N] [--telemetry]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import traffic_core
+from config import Config
+from local_broker import LocalBroker
+from mqtt_replay import SyntheticFleet, parse_speed, read_stream, replay
+from violation_store import FakeBackend
+
+# Wait this long after the last publish for in-flight messages
+DRAIN_TIMEOUT = 10.0
+
+
+def run(messages, speed, telemetry):
+    workdir = tempfile.mkdtemp(prefix="bench_ingest_")
+    broker = LocalBroker()
+    config = Config(overrides={'camera_sources': [], 'violations_dir': os.path.join(workdir, "violations"),
+                               'telemetry_dir': os.path.join(workdir, "telemetry"), 'record_telemetry': telemetry})
+    engine = traffic_core.TrafficEngine(FakeBackend(), config, mqtt_client=broker.client("dashboard"))
+    engine.start()
+    broker.wait_for_subscriber('traffic/phase')
+
+    # Time every handled message; mids are matched to publish times afterwards
+    received = []
+    handle = engine.connection.handler
+
+    def on_message(msg):
+        received.append((msg.mid, time.perf_counter()))
+        handle(msg)
+
+    engine.connection.handler = on_message
+
+    sent = {}
+    publisher = broker.client("bench")
+    publisher.connect()
+
+    def publish(topic, payload, qos, retain):
+        # Retained messages would be re-delivered to later subscribers; not part of the load
+        info = publisher.publish(topic, payload, qos, False)
+        sent[info.mid] = time.perf_counter()
+
+    start = time.perf_counter()
+    count, late = replay(messages, publish, speed)
+    publish_time = time.perf_counter() - start
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    inbound = engine.connection.inbound
+    while len(received) + sum(inbound.dropped.values()) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    queue_dropped = sum(inbound.dropped.values())
+    engine.stop()
+
+    latencies = np.array([at - sent[mid] for mid, at in list(received) if mid in sent]) * 1000.0
+    return {
+        'published': count,
+        'delivered': len(received),
+        'dropped': count - len(received),
+        'queue_dropped': queue_dropped,
+        'publish_rate': count / publish_time if publish_time else 0.0,
+        'throughput': len(received) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+        'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        'max_ms': float(latencies.max()) if len(latencies) else 0.0,
+        'late_ms': late * 1000.0,
+    }
+
+
+def report(name, result):
+    print(f"{name:24s} {result['published']:9d} {result['delivered']:9d} {result['dropped']:7d} "
+          f"{result['queue_dropped']:7d} "
+          f"{result['publish_rate']:10,.0f} {result['throughput']:10,.0f} "
+          f"{result['p50_ms']:8.2f} {result['p99_ms']:8.2f} {result['max_ms']:8.1f} {result['late_ms']:8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recording', help="Replay this recording instead of the synthetic fleet")
+    parser.add_argument('--intersections', type=int, nargs='+', default=[1, 100, 500])
+    parser.add_argument('--seconds', type=float, default=60.0, help="Simulated seconds of synthetic traffic")
+    parser.add_argument('--speed', type=parse_speed, default=None, help="Pace multiplier or 'max' (default)")
+    parser.add_argument('--telemetry', action='store_true', help="Record telemetry history while ingesting")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'source':24s} {'published':>9s} {'delivered':>9s} {'dropped':>7s} {'queue':>7s} {'pub msg/s':>10s} "
+          f"{'msg/s':>10s} {'p50 ms':>8s} {'p99 ms':>8s} {'max ms':>8s} {'late ms':>8s}")
+    if args.recording:
+        report(os.path.basename(args.recording), run(read_stream(args.recording), args.speed, args.telemetry))
+        return
+    for n in args.intersections:
+        # Generate up front so generation cost does not count as ingest time
+        messages = list(SyntheticFleet(n, seed=args.seed).stream(args.seconds))
+        report(f"synthetic x{n}", run(messages, args.speed, args.telemetry))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Rule evaluations per second in the traffic_rules engine.
+
+Runs N rules (copies of the default white-line, pedestrian-wait and
+violation-burst rules with varied thresholds) over a simulated ESP stream,
+one distance reading every 10 ms, and compares the incremental RuleEngine
+with re-evaluating each rule over its window of history on every message.
+
+    python -m benchmarks.bench_rules [--seconds 600] [--rules 3 30 300]
+"""
+import argparse
+import bisect
+import collections
+import json
+import random
+import time
+
+from traffic_rules import RuleEngine, default_signals
+
+# Simulated seconds between engine ticks
+TICK = 0.2
+
+
+def make_stream(seconds, seed=1):
+    """[(t, topic, payload), ...] in simulated seconds"""
+    rng = random.Random(seed)
+    phases = [b'H_GREEN', b'H_YELLOW', b'V_GREEN', b'V_YELLOW']
+    stream = []
+    t = 0.0
+    while t < seconds:
+        step = int(round(t * 100))
+        if step % 1000 == 0:
+            stream.append((t, 'traffic/phase', phases[step // 1000 % 4]))
+        if step % 100 == 0:
+            stream.append((t, 'traffic/density', json.dumps({'H': rng.randint(0, 2), 'V': rng.randint(0, 2)}).encode()))
+        if rng.random() < 0.002:
+            stream.append((t, 'traffic/crosswalk', rng.choice([b'PEDESTRIAN_WAITING', b'CROSSWALK_CLEAR'])))
+        if rng.random() < 0.0005:
+            stream.append((t, 'traffic/violation', b'RED_VIOLATION'))
+        stream.append((t, 'traffic/distance', json.dumps({'distance': rng.randint(5, 400)}).encode()))
+        t += 0.01
+    return stream
+
+
+def make_rules(n):
+    templates = [
+        lambda i: {'type': "sustained", 'signal': "distance", 'above': 0, 'at_most': 10 + i % 50,
+                   'for_ms': 100 * (i % 10), 'clear_after_ms': 300, 'phases': ["H_GREEN", "H_YELLOW"]},
+        lambda i: {'type': "sustained", 'signal': "crosswalk", 'equals': "PEDESTRIAN_WAITING",
+                   'for_ms': 1000 * (30 + i % 60)},
+        lambda i: {'type': "count", 'signal': "violation", 'more_than': 1 + i % 5, 'window_s': 60 * (1 + i % 10)},
+    ]
+    return [dict(templates[i % len(templates)](i), name=f"rule{i}") for i in range(n)]
+
+
+class RescanEngine:
+    """Baseline: keeps per-signal history and rescans each rule's window on every message"""
+
+    def __init__(self, definitions):
+        self.signals = default_signals()
+        self.rules = definitions
+        self.history = collections.defaultdict(list)  # signal -> [(t, value), ...]
+        self.watchers = collections.defaultdict(list)
+        for rule in definitions:
+            self.watchers[rule['signal']].append(rule)
+            if rule.get('phases'):
+                self.watchers['phase'].append(rule)
+        self.active = {}
+        self.evaluations = 0
+
+    def on_message(self, topic, payload, now):
+        for signal, parse in self.signals.get(topic, ()):
+            value = parse(payload)
+            if value is None:
+                continue
+            self.history[signal].append((now, value))
+            for rule in self.watchers.get(signal, ()):
+                self.evaluations += 1
+                self.active[rule['name']] = self.evaluate(rule, now)
+
+    def tick(self, now):
+        for rule in self.rules:
+            self.evaluations += 1
+            self.active[rule['name']] = self.evaluate(rule, now)
+
+    def _window(self, signal, start):
+        history = self.history[signal]
+        return history[bisect.bisect_left(history, (start,)):]
+
+    def evaluate(self, rule, now):
+        if rule['type'] == 'count':
+            return len(self._window(rule['signal'], now - rule['window_s'])) > rule['more_than']
+        phases = self.history['phase']
+        if rule.get('phases') and (not phases or phases[-1][1] not in rule['phases']):
+            return False
+        samples = self.history[rule['signal']]
+        if not samples:
+            return False
+        window = self._window(rule['signal'], now - rule['for_ms'] / 1000.0) or samples[-1:]
+        if 'equals' in rule:
+            return all(value == rule['equals'] for _, value in window)
+        return all(rule['above'] < value <= rule['at_most'] for _, value in window)
+
+
+def run(engine, stream):
+    next_tick = TICK
+    start = time.perf_counter()
+    for t, topic, payload in stream:
+        engine.on_message(topic, payload, t)
+        if t >= next_tick:
+            engine.tick(t)
+            next_tick += TICK
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=600.0, help="Simulated stream length")
+    parser.add_argument('--rules', type=int, nargs='+', default=[3, 30, 300])
+    args = parser.parse_args()
+
+    stream = make_stream(args.seconds)
+    print(f"{len(stream)} messages over {args.seconds:.0f} simulated seconds")
+    print(f"{'rules':>6s} {'engine':12s} {'msg/s':>12s} {'evals/s':>14s} {'speedup':>8s}")
+    for n in args.rules:
+        definitions = make_rules(n)
+        baseline = None
+        for label, engine in (("rescan", RescanEngine(definitions)), ("incremental", RuleEngine(definitions))):
+            elapsed = run(engine, stream)
+            baseline = baseline or elapsed
+            print(f"{n:6d} {label:12s} {len(stream) / elapsed:12,.0f} {engine.evaluations / elapsed:14,.0f} "
+                  f"{baseline / elapsed:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
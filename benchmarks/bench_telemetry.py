@@ -0,0 +1,54 @@
+"""Write and query throughput of the telemetry store.
+
+Records several days of synthetic distance telemetry at 10 Hz, then times
+the range and aggregate queries a chart would issue (last minute, hour, day
+and the whole history, each at the automatically chosen resolution).
+
+    python -m benchmarks.bench_telemetry [--days N] [--rate HZ]
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from telemetry_store import TelemetryStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=float, default=3)
+    parser.add_argument('--rate', type=float, default=10.0, help="Samples per second")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="telemetry-bench-")
+    try:
+        store = TelemetryStore(root)
+        n = int(args.days * 86400 * args.rate)
+        end = time.time()
+        stamps = end - args.days * 86400 + np.arange(n) / args.rate
+        values = np.random.default_rng(0).integers(5, 400, n).astype(np.float32)
+
+        start = time.perf_counter()
+        for t, v in zip(stamps.tolist(), values.tolist()):
+            store.record('distance', v, t)
+        store.flush()
+        elapsed = time.perf_counter() - start
+        print(f"recorded {n:,} samples in {elapsed:.1f} s ({n / elapsed:,.0f} samples/s)")
+
+        for label, span in (("1 min", 60), ("1 hour", 3600), ("1 day", 86400), ("all", args.days * 86400)):
+            resolution = store.pick_resolution(end - span, end)
+            start = time.perf_counter()
+            for _ in range(20):
+                points = store.query('distance', end - span, end)
+                summary = store.aggregate('distance', end - span, end)
+            ms = (time.perf_counter() - start) * 1000.0 / 20
+            print(f"query {label:7s} resolution={str(resolution):4s} points={len(points['t']):7,d} "
+                  f"mean={summary['mean']:.1f}  {ms:.2f} ms")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
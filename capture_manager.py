@@ -0,0 +1,253 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+
+import cv2
+
+from frame_buffer import FrameRingBuffer, LatestFrame
+from metrics import REGISTRY
+
+# Seconds to wait before reopening a source that failed
+REOPEN_DELAY = 2.0
+
+READ_SECONDS = REGISTRY.histogram('traffic_camera_read_seconds', "Time to read (decode) one frame",
+                                  labels=('camera',))
+RESIZE_SECONDS = REGISTRY.histogram('traffic_camera_resize_seconds', "Time to resize one frame to the capture resolution",
+                                    labels=('camera',))
+READ_ERRORS = REGISTRY.counter('traffic_camera_read_errors_total', "Failed frame reads", labels=('camera',))
+
+
+def parse_source(uri):
+    """Device indexes may be given as strings ("0"); anything else is a path or URL"""
+    if isinstance(uri, str) and uri.strip().isdigit():
+        return int(uri)
+    return uri
+
+
+class CameraSource:
+    """One camera stream with its own frame rate, resolution and buffers.
+
+    uri is a device index, a video file or a stream URL (e.g. rtsp://...).
+    Frames are only decoded while the source is visible in the UI or is
+    recording for violation capture; otherwise the stream is just grabbed
+    so it stays current.
+    """
+
+    def __init__(self, name, uri, fps=30, resolution=None, buffer_frames=64, buffer_max_bytes=None, loop=None):
+        self.name = name
+        self.uri = parse_source(uri)
+        self.fps = fps
+        self.resolution = tuple(resolution) if resolution else None
+        self.frame_buffer = FrameRingBuffer(buffer_frames, max_bytes=buffer_max_bytes)
+        self.display = LatestFrame()
+        self.visible = True
+        self.record = True
+        # Video files are replayed from the start when they end
+        self.loop = loop if loop is not None else (isinstance(self.uri, str) and os.path.isfile(self.uri))
+        self.cap = None
+        self.frames_read = 0
+        self.read_errors = 0
+        self.removed = False
+        self._reopen_at = 0.0
+        self._rewound = False  # The last read failed and a looping file was rewound
+        self._pending = None  # Settings from reconfigure(), applied by the worker
+
+    @property
+    def interval(self):
+        return 1.0 / self.fps if self.fps > 0 else 0.0
+
+    def is_open(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def open(self):
+        """Open the underlying capture; returns False (and backs off) on failure"""
+        self.release()
+        cap = cv2.VideoCapture(self.uri)
+        if not cap.isOpened():
+            cap.release()
+            self._reopen_at = time.monotonic() + REOPEN_DELAY
+            print(f"Could not open camera {self.name} ({self.uri})")
+            return False
+        if self.resolution and not isinstance(self.uri, str):
+            # Ask the device for the target size; frames are still resized if it ignores this
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.resolution[0])
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.resolution[1])
+        self.cap = cap
+        print(f"Camera {self.name} ({self.uri}) opened successfully.")
+        return True
+
+    def reconfigure(self, uri=None, fps=None, resolution=None):
+        """Switch to new settings; applied by the capture worker before its next read"""
+        self._pending = {'uri': uri, 'fps': fps, 'resolution': resolution}
+
+    def _apply_pending(self):
+        pending, self._pending = self._pending, None
+        if pending['fps'] is not None:
+            self.fps = pending['fps']
+        if pending['resolution'] is not None:
+            self.resolution = tuple(pending['resolution']) or None
+        if pending['uri'] is not None and parse_source(pending['uri']) != self.uri:
+            self.uri = parse_source(pending['uri'])
+            self.loop = isinstance(self.uri, str) and os.path.isfile(self.uri)
+            # Frames from the old source are no longer relevant
+            self.frame_buffer.clear()
+        self.release()
+        self._reopen_at = 0.0
+
+    def read_once(self):
+        """Read (or just grab) one frame; called by one capture worker at a time"""
+        if self._pending is not None:
+            self._apply_pending()
+        if not self.is_open():
+            if time.monotonic() < self._reopen_at or not self.open():
+                return
+
+        if not (self.visible or self.record):
+            # Nobody needs the pixels; skip decoding entirely
+            self.cap.grab()
+            return
+
+        start = time.perf_counter() if REGISTRY.enabled else None
+        ret, frame = self.cap.read()
+        if start is not None:
+            READ_SECONDS.observe(time.perf_counter() - start, self.name)
+        if not ret:
+            # Rewind a looping file once; a read that fails right after a rewind
+            # (corrupt or empty file) backs off like any other failure
+            if self.loop and not self._rewound and self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0):
+                self._rewound = True
+                return
+            self._rewound = False
+            self.read_errors += 1
+            if REGISTRY.enabled:
+                READ_ERRORS.inc(self.name)
+            print(f"Failed to read frame from camera {self.name}.")
+            self.release()
+            self._reopen_at = time.monotonic() + REOPEN_DELAY
+            return
+
+        self._rewound = False
+        timestamp = time.time()
+        if self.resolution and (frame.shape[1], frame.shape[0]) != self.resolution:
+            start = time.perf_counter() if REGISTRY.enabled else None
+            frame = cv2.resize(frame, self.resolution, interpolation=cv2.INTER_AREA)
+            if start is not None:
+                RESIZE_SECONDS.observe(time.perf_counter() - start, self.name)
+        self.frames_read += 1
+        if self.record:
+            self.frame_buffer.push(frame, timestamp)
+        if self.visible:
+            self.display.publish(frame)
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class CaptureManager:
+    """Runs any number of camera sources on a bounded pool of worker threads.
+
+    A shared schedule hands each source to a worker whenever its next frame
+    is due, so a source is only ever read by one worker at a time. Blocking
+    device reads hold a worker for up to one frame period; size the pool to
+    the number of live cameras that must run at full rate.
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._sources = {}
+        self._schedule = []  # Heap of (due, seq, source)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._workers = []
+
+    def add_source(self, name, uri, **options):
+        """Create and schedule a CameraSource"""
+        source = CameraSource(name, uri, **options)
+        with self._cond:
+            if name in self._sources:
+                raise ValueError(f"Camera {name} already exists")
+            self._sources[name] = source
+            heapq.heappush(self._schedule, (time.monotonic(), next(self._seq), source))
+            self._cond.notify()
+        return source
+
+    def remove_source(self, name):
+        with self._cond:
+            source = self._sources.pop(name, None)
+            if source is not None:
+                # Released by the worker that next picks it up
+                source.removed = True
+                self._cond.notify()
+
+    def get(self, name):
+        return self._sources.get(name)
+
+    def names(self):
+        return list(self._sources)
+
+    def sources(self):
+        return list(self._sources.values())
+
+    def start(self):
+        self._stop.clear()
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._worker_loop, daemon=True, name=f"capture-{i}")
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self, timeout=1.5):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout=timeout)
+        self._workers = []
+        for source in list(self._sources.values()):
+            source.release()
+        for _, _, source in self._schedule:
+            if source.removed:
+                source.release()
+
+    def _next_due(self):
+        """Pop the next source whose frame is due, waiting as needed; None on stop"""
+        with self._cond:
+            while not self._stop.is_set():
+                if not self._schedule:
+                    self._cond.wait()
+                    continue
+                due, _, source = self._schedule[0]
+                if source.removed:
+                    heapq.heappop(self._schedule)
+                    source.release()
+                    continue
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._schedule)
+                return due, source
+        return None
+
+    def _worker_loop(self):
+        while True:
+            item = self._next_due()
+            if item is None:
+                return
+            due, source = item
+            try:
+                source.read_once()
+            except Exception as e:
+                print(f"Camera {source.name} error: {str(e)}")
+            with self._cond:
+                if source.removed:
+                    source.release()
+                    continue
+                # Keep the source's own cadence, but never try to catch up on missed frames
+                next_due = max(due + source.interval, time.monotonic())
+                heapq.heappush(self._schedule, (next_due, next(self._seq), source))
+                self._cond.notify()
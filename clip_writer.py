@@ -0,0 +1,123 @@
+"""Short video clips around violations, encoded off the capture path."""
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+from metrics import REGISTRY
+
+# Bounds on the frame rate written to the container; the actual rate is
+# measured from the frame timestamps
+MIN_CLIP_FPS = 1.0
+MAX_CLIP_FPS = 60.0
+
+CLIP_ENCODE_SECONDS = REGISTRY.histogram('traffic_clip_encode_seconds', "Time to encode and write one violation clip",
+                                         buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+
+def clip_size(width, height, scale):
+    """Frame size after downscaling, rounded to even dimensions for the encoders"""
+    scale = min(max(scale, 0.0), 1.0) or 1.0
+    return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+
+class ClipWriter:
+    """Records a few seconds of video around each violation.
+
+    record() only schedules the clip: once its end has been captured, a
+    timer thread copies the frames out of the camera's ring buffer one at a
+    time (downscaling each copy), so capture is held up by at most one
+    frame copy. A single encoder thread writes the clips with
+    cv2.VideoWriter. At most queue_size collected clips wait for the
+    encoder; further clips are dropped rather than growing memory.
+    """
+
+    def __init__(self, codec='mp4v', scale=0.5, queue_size=4):
+        self.codec = codec
+        self.scale = scale
+        self._jobs = queue.Queue(maxsize=queue_size)
+        self._timers = set()
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._encoder = threading.Thread(target=self._encode_loop, daemon=True, name="clip-encoder")
+        self._encoder.start()
+
+    def record(self, source, filename, start, end):
+        """Write source's frames between start and end (epoch seconds) to filename"""
+        timer = threading.Timer(max(0.0, end - time.time()), self._collect, args=(source, filename, start, end))
+        timer.daemon = True
+        with self._lock:
+            self._timers.add(timer)
+        timer.start()
+
+    def queue_depth(self):
+        return self._jobs.qsize()
+
+    def _collect(self, source, filename, start, end):
+        with self._lock:
+            self._timers.discard(threading.current_thread())
+        frames = list(source.frame_buffer.iter_window(start, end, transform=self._downscale))
+        if len(frames) < 2:
+            print(f"Not enough buffered frames for violation clip {filename}")
+            self.failed += 1
+            return
+        try:
+            self._jobs.put_nowait((filename, frames))
+        except queue.Full:
+            self.dropped += 1
+            print(f"Clip queue full, dropped violation clip {filename}")
+
+    def _downscale(self, frame):
+        size = clip_size(frame.shape[1], frame.shape[0], self.scale)
+        if size == (frame.shape[1], frame.shape[0]):
+            return frame
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    def _encode_loop(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            filename, frames = job
+            start = time.perf_counter() if REGISTRY.enabled else None
+            try:
+                self._write(filename, frames)
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Failed to write violation clip {filename}: {str(e)}")
+            if start is not None:
+                CLIP_ENCODE_SECONDS.observe(time.perf_counter() - start)
+
+    def _write(self, filename, frames):
+        span = frames[-1][0] - frames[0][0]
+        fps = min(max((len(frames) - 1) / span, MIN_CLIP_FPS), MAX_CLIP_FPS) if span > 0 else MAX_CLIP_FPS
+        height, width = frames[0][1].shape[:2]
+        # Written under a temporary name so a half-written clip is never picked up
+        root, ext = os.path.splitext(filename)
+        partial = f"{root}.part{ext}"
+        writer = cv2.VideoWriter(partial, cv2.VideoWriter_fourcc(*self.codec), fps, (width, height))
+        if not writer.isOpened():
+            raise RuntimeError(f"cannot open a {self.codec} writer for {ext} files")
+        try:
+            for _, frame in frames:
+                writer.write(frame)
+        finally:
+            writer.release()
+        os.replace(partial, filename)
+        print(f"Saved {len(frames)}-frame violation clip {filename}")
+
+    def stop(self, timeout=5.0):
+        """Write the clips already collected; clips still waiting for frames are abandoned"""
+        with self._lock:
+            timers, self._timers = self._timers, set()
+        for timer in timers:
+            timer.cancel()
+        if timers:
+            print(f"Abandoned {len(timers)} violation clip(s) still being recorded")
+        self._jobs.put(None)
+        self._encoder.join(timeout=timeout)
@@ -0,0 +1,506 @@
+"""Typed settings for the monitoring engine and dashboard.
+
+Each setting has a type, a default and a flag saying whether it may
+change while running ("hot"). Values are resolved in increasing priority
+from:
+
+  1. the defaults below
+  2. the JSON config file (traffic_config.json, --config or TRAFFIC_CONFIG)
+  3. the file's profile for this intersection: "profiles": {"<site>": {...}}
+     selected with --site or TRAFFIC_SITE
+  4. environment variables, TRAFFIC_<NAME> (e.g. TRAFFIC_MQTT_BROKER)
+  5. command line options
+
+ConfigWatcher reloads the file when it changes. Hot settings take effect
+at once; other changes are reported and wait for a restart.
+"""
+import json
+import os
+import threading
+
+from signal_timing import STRATEGIES
+
+# Config file used when neither --config nor TRAFFIC_CONFIG names one
+DEFAULT_CONFIG_PATH = "traffic_config.json"
+ENV_PREFIX = "TRAFFIC_"
+
+# Seconds between checks of the config file for changes
+RELOAD_INTERVAL = 2.0
+
+FALSE_WORDS = ('0', 'false', 'no', 'off')
+TRUE_WORDS = ('1', 'true', 'yes', 'on')
+
+
+class ConfigError(ValueError):
+    """A config file, profile or value that cannot be used"""
+
+
+# Kinds: convert a value from JSON, the environment (a string) or the
+# command line to the setting's type, raising ValueError when it does not fit
+
+def string(value):
+    if not isinstance(value, str):
+        raise ValueError("expected a string")
+    return value
+
+
+def topic_level(value):
+    """A string usable as one MQTT topic level"""
+    value = string(value)
+    if not value or any(c in value for c in '/+#'):
+        raise ValueError("expected a non-empty name without '/', '+' or '#'")
+    return value
+
+
+def integer(value):
+    if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+        raise ValueError("expected an integer")
+    return int(value)
+
+
+def number(value):
+    if isinstance(value, bool):
+        raise ValueError("expected a number")
+    return float(value)
+
+
+def boolean(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in TRUE_WORDS + FALSE_WORDS:
+        return value.strip().lower() in TRUE_WORDS
+    raise ValueError("expected true or false")
+
+
+def size(value):
+    """(width, height) from [w, h] or "WxH" """
+    if isinstance(value, str):
+        value = value.lower().split('x')
+    width, height = (integer(v) for v in value)
+    if width <= 0 or height <= 0:
+        raise ValueError("expected a positive width and height")
+    return width, height
+
+
+def optional(kind):
+    def convert(value):
+        if value is None or isinstance(value, str) and value.strip().lower() in ('', 'none', 'null'):
+            return None
+        return kind(value)
+    convert.__name__ = f"optional {kind.__name__}"
+    return convert
+
+
+def one_of(*choices):
+    def convert(value):
+        if value not in choices:
+            raise ValueError(f"expected one of {', '.join(choices)}")
+        return value
+    convert.__name__ = "choice"
+    return convert
+
+
+def structure(cls):
+    """A JSON list or object; environment values are JSON text"""
+    def convert(value):
+        if isinstance(value, str):
+            value = json.loads(value)
+        if not isinstance(value, cls):
+            raise ValueError(f"expected a JSON {'list' if cls is list else 'object'}")
+        return value
+    convert.__name__ = cls.__name__
+    return convert
+
+
+def cameras(value):
+    """[{name, uri, fps?, resolution?}, ...]"""
+    result = []
+    for camera in structure(list)(value):
+        if not isinstance(camera, dict) or 'name' not in camera or 'uri' not in camera:
+            raise ValueError("each camera needs a name and a uri")
+        camera = dict(camera, name=string(camera['name']))
+        if camera.get('fps') is not None:
+            camera['fps'] = number(camera['fps'])
+        if camera.get('resolution') is not None:
+            camera['resolution'] = size(camera['resolution'])
+        result.append(camera)
+    if len({camera['name'] for camera in result}) != len(result):
+        raise ValueError("camera names must be unique")
+    return result
+
+
+def topic_qos(value):
+    """{topic: QoS} with QoS 0, 1 or 2"""
+    result = {}
+    for topic, qos in structure(dict)(value).items():
+        if isinstance(qos, bool) or qos not in (0, 1, 2):
+            raise ValueError(f"QoS of {topic} must be 0, 1 or 2")
+        result[topic] = int(qos)
+    return result
+
+
+def fraction(value):
+    value = number(value)
+    if not 0.0 <= value <= 1.0:
+        raise ValueError("expected a fraction between 0 and 1")
+    return value
+
+
+# Options of a stop-line zone (violation_verify.StopLineVerifier arguments) and their kinds
+ZONE_OPTIONS = {
+    'roi': None,  # Checked below
+    'line': fraction,
+    'direction': one_of('up', 'down', 'left', 'right'),
+    'approach': one_of('H', 'V'),
+    'width': integer,
+    'diff_threshold': integer,
+    'min_motion': fraction,
+}
+
+
+def stop_line_zones(value):
+    """{camera: {roi: [x0, y0, x1, y1] frame fractions, line?, direction?, approach?, ...}}"""
+    result = {}
+    for camera, zone in structure(dict)(value).items():
+        if not isinstance(zone, dict) or 'roi' not in zone:
+            raise ValueError(f"zone of {camera} needs a roi")
+        unknown = set(zone) - set(ZONE_OPTIONS)
+        if unknown:
+            raise ValueError(f"zone of {camera} has unknown options {', '.join(sorted(unknown))}")
+        roi = zone['roi']
+        try:
+            roi = [fraction(v) for v in roi]
+        except (TypeError, ValueError):
+            roi = None
+        if roi is None or len(roi) != 4 or roi[0] >= roi[2] or roi[1] >= roi[3]:
+            raise ValueError(f"roi of {camera} must be [x0, y0, x1, y1] fractions with x0 < x1 and y0 < y1")
+        try:
+            zone = {key: ZONE_OPTIONS[key](v) if key != 'roi' else roi for key, v in zone.items()}
+        except ValueError as e:
+            raise ValueError(f"zone of {camera}: {str(e)}") from None
+        result[camera] = zone
+    return result
+
+
+def rules(value):
+    """[{name, type, ...options}, ...]; the options are checked when the rules are built"""
+    result = structure(list)(value)
+    for rule in result:
+        if not isinstance(rule, dict) or not isinstance(rule.get('name'), str) or not isinstance(rule.get('type'), str):
+            raise ValueError("each rule needs a name and a type")
+    if len({rule['name'] for rule in result}) != len(result):
+        raise ValueError("rule names must be unique")
+    return result
+
+
+class Setting:
+    """One setting: its kind, default, whether it may change while running, and a description"""
+
+    __slots__ = ('name', 'kind', 'default', 'hot', 'help')
+
+    def __init__(self, name, kind, default, hot=False, help=""):
+        self.name = name
+        self.kind = kind
+        self.default = default
+        self.hot = hot
+        self.help = help
+
+    @property
+    def env_name(self):
+        return ENV_PREFIX + self.name.upper()
+
+
+SETTINGS = (
+    # Firebase credentials, loaded by init_firebase()
+    Setting('firebase_credentials', string, "traffic-light-system-23d76-firebase-adminsdk-fbsvc-8e9cd5da24.json",
+            help="Firebase credentials JSON"),
+
+    # MQTT broker connection
+    Setting('mqtt_broker', string, '172.20.10.4'),
+    Setting('mqtt_port', integer, 1883),
+    Setting('mqtt_keepalive', integer, 60),
+    Setting('mqtt_reconnect_min_delay', number, 1.0, help="Seconds; doubles after every failed attempt"),
+    Setting('mqtt_reconnect_max_delay', number, 60.0),
+    Setting('mqtt_inbound_queue', integer, 1000, help="Received messages waiting for their handler"),
+    # Subscription and publish QoS per topic (0 when not listed). Violation
+    # topics are also subscribed at QoS 1; the broker delivers at the lower of
+    # the publisher's and the subscriber's QoS.
+    Setting('topic_qos', topic_qos, {'traffic/violation': 1, 'traffic/override': 1}),
+    # A redelivered violation (dup flag) with the packet id of one accepted within
+    # this many seconds is the same event; retained violations are ignored
+    Setting('violation_redelivery_window', number, 30.0, hot=True),
+
+    # Intersection id on a shared broker: every topic becomes site/<site_id>/traffic/...
+    # (the intersection's own broker bridges the ESP's plain topics with that
+    # prefix). Null keeps the plain topics of a single intersection.
+    Setting('site_id', optional(topic_level), None),
+    # Fleet overview of every site/<id>/traffic/... message on the broker,
+    # ingested by this many shard processes (0 keeps it in-process, null off)
+    Setting('fleet_shards', optional(integer), None),
+    Setting('fleet_report_interval', number, 0.5, help="Seconds between shard reports; bounds fleet state age"),
+    Setting('fleet_rate_window_s', number, 3600.0, help="Window of the per-site violation rate"),
+
+    # Violation images, the local upload spool and the index
+    Setting('violations_dir', string, "violations"),
+    Setting('violation_sync_interval', number, 30.0, hot=True, help="Seconds between incremental index syncs"),
+
+    # Evidence retention in violations_dir (null turns a rule off). Older
+    # images are recompressed in place and near-identical burst frames
+    # (perceptual hashes within storage_dedupe_distance of 64 bits) removed;
+    # past the age limit, or while over quota or short of free disk, the
+    # oldest evidence is deleted, already uploaded first.
+    Setting('storage_quota_mb', optional(integer), 2048, hot=True),
+    Setting('storage_min_free_mb', optional(integer), 512, hot=True, help="Free disk to keep on the volume"),
+    Setting('storage_max_age_days', optional(number), 90, hot=True, help="Only applies to uploaded evidence"),
+    Setting('storage_recompress_after_days', optional(number), 7, hot=True),
+    Setting('storage_recompress_quality', integer, 60, hot=True, help="JPEG quality of recompressed images"),
+    Setting('storage_recompress_max_width', optional(integer), 960, hot=True),
+    Setting('storage_dedupe_distance', optional(integer), 4, hot=True),
+    Setting('storage_interval', number, 60.0, hot=True, help="Seconds between maintenance passes"),
+
+    # Violation capture window around the RED_VIOLATION event. Windows longer
+    # than the ring buffers (sized at startup) get fewer frames.
+    Setting('pre_event_ms', integer, 500, hot=True),
+    Setting('post_event_ms', integer, 150, hot=True, help="Also the delay before the burst is collected"),
+    Setting('ring_buffer_frames', integer, 64, help="Minimum ring buffer size per camera"),
+    # Upper bound on each camera's ring buffer memory. Buffers hold the longest
+    # capture window (clip or JPEG burst) at the camera's frame rate, or fewer
+    # frames when that would not fit: a 640x480 camera at 30 FPS needs ~140 MB
+    # for a 5 s clip, so 1080p clips are cut short unless this is raised.
+    Setting('ring_buffer_max_mb', integer, 256),
+
+    # Video clip around each violation, encoded in the background; a codec of
+    # null saves only the JPEG burst
+    Setting('clip_codec', optional(string), 'mp4v', help="FourCC passed to cv2.VideoWriter ('avc1', 'MJPG', ...)"),
+    Setting('clip_extension', string, '.mp4', hot=True, help="Container; must suit the codec ('.avi' for MJPG)"),
+    Setting('clip_pre_event_s', number, 3.0, hot=True),
+    Setting('clip_post_event_s', number, 2.0, hot=True),
+    Setting('clip_scale', number, 0.5, hot=True, help="Frame size factor applied before encoding"),
+    Setting('clip_queue_size', integer, 4, help="Collected clips waiting for the encoder; more are dropped"),
+
+    # Camera sources: device index, video file or stream URL, each with its own
+    # frame rate and (optional) capture resolution. Sources are added, removed
+    # or switched when this changes.
+    Setting('camera_sources', cameras, [{'name': "cam0", 'uri': 0, 'fps': 30, 'resolution': None}], hot=True),
+    Setting('capture_workers', integer, 4),
+
+    # Cameras that record the frames for each violation topic
+    Setting('violation_cameras', structure(dict), {'traffic/violation': ["cam0"]}),
+
+    # Optional on-host check that a vehicle actually crossed the stop line on red.
+    # Zones are per camera: roi is (x0, y0, x1, y1) as frame fractions, line is the
+    # stop line position inside the roi along the direction of travel. diff_threshold
+    # (gray levels) and min_motion (fraction of each side's pixels) tune the motion
+    # test; raise min_motion for noisy cameras (see benchmarks/bench_verify.py).
+    Setting('verify_violations', boolean, False),
+    Setting('stop_line_zones', stop_line_zones,
+            {"cam0": {'roi': [0.25, 0.4, 0.75, 1.0], 'line': 0.5, 'direction': 'up', 'approach': 'H'}}),
+    Setting('verify_budget_ms', number, 2.0),
+
+    # Camera-based density per camera: lane rois per approach as (x0, y0, x1, y1)
+    # frame fractions. Counts are published as {"H": .., "V": ..} on density_topic.
+    # density_source picks what the engine's density (dashboard and host-side
+    # signal timing) follows: the controller's IR counts on traffic/density
+    # ('sensor'), the cameras ('camera', highest count over cameras per
+    # approach) or the higher of the two ('max', camera counts clamped to the
+    # IR scale of 0..2 per approach). Camera estimates older than four
+    # density_intervals are ignored, so a stalled camera falls back to the IR counts.
+    Setting('density_cameras', structure(dict), {}),
+    Setting('density_topic', string, 'traffic/density/camera'),
+    Setting('density_interval', number, 0.5, hot=True, help="Seconds between sampled frames per camera"),
+    Setting('density_workers', integer, 2),
+    Setting('density_source', one_of('sensor', 'camera', 'max'), 'max', hot=True),
+
+    # Telemetry history (phase, density, distance, crosswalk, violations)
+    Setting('record_telemetry', boolean, True),
+    Setting('telemetry_dir', string, "telemetry"),
+    # How often coalesced telemetry (distance, density) is applied to the state
+    Setting('telemetry_tick', number, 0.2, hot=True),
+
+    # Host-side signal timing strategy driving traffic/override, or 'esp' to
+    # leave the timing to the controller
+    Setting('signal_timing', one_of(*STRATEGIES), 'esp'),
+
+    # Local port serving Prometheus metrics on /metrics; null leaves collection
+    # off (it can still be switched on from the dashboard's diagnostics panel)
+    Setting('metrics_port', optional(integer), None),
+
+    # Derived events (see traffic_rules.py), each published on traffic/rules/<name>.
+    # white_line drives the dashboard's white-line warning: a car within
+    # at_most cm of the line while the vertical lane is red, shown for at
+    # least clear_after_ms.
+    Setting('rules', rules, [
+        {'name': "white_line", 'type': "sustained", 'signal': "distance", 'above': 0, 'at_most': 15,
+         'clear_after_ms': 300, 'phases': ["H_GREEN", "H_YELLOW"]},
+        {'name': "pedestrian_wait", 'type': "sustained", 'signal': "crosswalk", 'equals': "PEDESTRIAN_WAITING",
+         'for_ms': 60000},
+        {'name': "violation_burst", 'type': "count", 'signal': "violation", 'more_than': 3, 'window_s': 600},
+    ], hot=True),
+    Setting('rule_plugins', structure(list), [], help="Modules imported to register extra rule types"),
+
+    # Dashboard camera preview area, tile layout and refresh rates
+    Setting('display_size', size, (640, 480), hot=True),
+    Setting('display_fps', number, 30, hot=True),
+    Setting('tile_columns', integer, 2, hot=True),
+    Setting('tiles_per_page', integer, 4, hot=True),
+    Setting('render_interval_ms', integer, 100, hot=True,
+            help="Minimum time between UI refreshes; refreshes are only scheduled when new state arrives"),
+)
+
+SETTINGS_BY_NAME = {setting.name: setting for setting in SETTINGS}
+
+
+def convert(name, value, origin):
+    """Value converted to the setting's kind; ConfigError names where it came from"""
+    setting = SETTINGS_BY_NAME.get(name)
+    if setting is None:
+        raise ConfigError(f"Unknown setting {name!r} in {origin}")
+    try:
+        return setting.kind(value)
+    except (ValueError, TypeError) as e:
+        raise ConfigError(f"Invalid {name} in {origin}: {str(e)}") from None
+
+
+def default_path(env=None):
+    """Config file named by TRAFFIC_CONFIG, else DEFAULT_CONFIG_PATH if it exists"""
+    env = os.environ if env is None else env
+    path = env.get(ENV_PREFIX + "CONFIG")
+    if path:
+        return path
+    return DEFAULT_CONFIG_PATH if os.path.exists(DEFAULT_CONFIG_PATH) else None
+
+
+class Config:
+    """Resolved settings, read as attributes (config.mqtt_broker).
+
+    Values are replaced all at once on reload, so a reader sees either the
+    old or the new set, never a mix. Cold settings keep their startup value
+    until restart; their pending file values are listed in `pending`.
+    """
+
+    def __init__(self, path=None, site=None, env=None, overrides=None):
+        self.path = path
+        self.env = os.environ if env is None else env
+        self.site = site if site is not None else self.env.get(ENV_PREFIX + "SITE") or None
+        self.overrides = {name: convert(name, value, "overrides") for name, value in (overrides or {}).items()}
+        self.pending = {}
+        self._mtime = self._file_mtime()
+        self._values = self._resolve()
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['_values'][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def values(self):
+        return dict(self._values)
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime if self.path else None
+        except OSError:
+            return None
+
+    def _load_file(self):
+        """Settings from the file and the site's profile, in that order"""
+        if not self.path:
+            if self.site:
+                raise ConfigError(f"Site {self.site!r} given but there is no config file")
+            return {}
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise ConfigError(f"Cannot read config file {self.path}: {str(e)}") from None
+        if not isinstance(data, dict):
+            raise ConfigError(f"Config file {self.path} must hold a JSON object")
+        profiles = data.pop('profiles', {})
+        values = {name: convert(name, value, self.path) for name, value in data.items()}
+        if self.site:
+            profile = profiles.get(self.site)
+            if not isinstance(profile, dict):
+                raise ConfigError(f"No profile for site {self.site!r} in {self.path}")
+            origin = f"{self.path} (profile {self.site})"
+            values.update({name: convert(name, value, origin) for name, value in profile.items()})
+        return values
+
+    def _resolve(self):
+        values = {setting.name: setting.default for setting in SETTINGS}
+        values.update(self._load_file())
+        for setting in SETTINGS:
+            if setting.env_name in self.env:
+                values[setting.name] = convert(setting.name, self.env[setting.env_name], setting.env_name)
+        values.update(self.overrides)
+        return values
+
+    def changed_on_disk(self):
+        return self._file_mtime() != self._mtime
+
+    def reload(self):
+        """Re-read the file; returns the names of the hot settings that changed.
+
+        An unreadable or invalid file keeps the current values (ConfigError).
+        """
+        self._mtime = self._file_mtime()
+        new = self._resolve()
+        current = self._values
+        changed = []
+        pending = {}
+        for setting in SETTINGS:
+            if new[setting.name] == current[setting.name]:
+                continue
+            if setting.hot:
+                changed.append(setting.name)
+            else:
+                pending[setting.name] = new[setting.name]
+                new[setting.name] = current[setting.name]
+        self._values = new
+        self.pending = pending
+        return changed
+
+
+class ConfigWatcher:
+    """Polls the config file and applies changes: on_change(names) gets the hot settings that changed"""
+
+    def __init__(self, config, on_change, interval=RELOAD_INTERVAL):
+        self.config = config
+        self.on_change = on_change
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="config-watcher")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.5)
+            self._thread = None
+
+    def check(self):
+        """Reload if the file changed; returns the hot settings applied"""
+        if not self.config.changed_on_disk():
+            return []
+        pending_before = dict(self.config.pending)
+        try:
+            changed = self.config.reload()
+        except ConfigError as e:
+            print(f"Config not reloaded: {str(e)}")
+            return []
+        if changed:
+            print(f"Config reloaded: {', '.join(changed)}")
+            self.on_change(changed)
+        if self.config.pending and self.config.pending != pending_before:
+            print(f"Restart to apply: {', '.join(sorted(self.config.pending))}")
+        return changed
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Config reload failed: {str(e)}")
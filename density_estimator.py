@@ -0,0 +1,177 @@
+import json
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+# Lane masks per (rois, frame size), built once in each worker process
+_mask_cache = {}
+
+
+def _lane_masks(lane_rois, shape):
+    key = (repr(lane_rois), shape)
+    masks = _mask_cache.get(key)
+    if masks is None:
+        height, width = shape
+        masks = {}
+        for approach, rois in lane_rois.items():
+            mask = np.zeros(shape, dtype=np.uint8)
+            for x0, y0, x1, y1 in rois:
+                mask[int(y0 * height):int(y1 * height), int(x0 * width):int(x1 * width)] = 1
+            masks[approach] = mask
+        _mask_cache[key] = masks
+    return masks
+
+
+def estimate_density(gray, background, lane_rois, threshold=30, min_blob_area=40):
+    """Count vehicles per approach from one downscaled gray frame.
+
+    Runs in a worker process. Returns {approach: (blob_count, occupancy)}
+    where occupancy is the foreground fraction of the approach's lanes.
+    """
+    foreground = cv2.absdiff(gray, background) > threshold
+    foreground = cv2.morphologyEx(foreground.view(np.uint8), cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+    results = {}
+    for approach, mask in _lane_masks(lane_rois, gray.shape).items():
+        lane = foreground & mask
+        area = int(mask.sum())
+        occupancy = float(lane.sum()) / area if area else 0.0
+        n, _, stats, _ = cv2.connectedComponentsWithStats(lane, connectivity=8)
+        # Label 0 is the background
+        blobs = int(np.count_nonzero(stats[1:, cv2.CC_STAT_AREA] >= min_blob_area)) if n > 1 else 0
+        results[approach] = (blobs, occupancy)
+    return results
+
+
+class DensityEstimator:
+    """Camera-based vehicle density for one camera, published like the IR counts.
+
+    A sampler thread takes the newest frame from the camera's ring buffer at
+    `interval` seconds, shrinks it to a small gray image and keeps a running
+    background model (cheap at this size). Foreground extraction and blob
+    counting run in a shared process pool so they never hold the UI's GIL.
+    Results are passed to publish(payload) as {"H": .., "V": ..} JSON.
+    """
+
+    def __init__(self, source, lane_rois, pool, publish, interval=0.5, width=160,
+                 learning_rate=0.02, max_in_flight=2):
+        self.source = source
+        self.lane_rois = lane_rois
+        self.pool = pool
+        self.publish = publish
+        self.interval = interval
+        self.width = width
+        self.learning_rate = learning_rate
+        self.max_in_flight = max_in_flight
+        self.latest = None
+        self._background = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_timestamp = 0.0
+        # Metrics
+        self.frames_submitted = 0
+        self.frames_processed = 0
+        self.frames_skipped = 0
+        self.latencies_ms = deque(maxlen=200)
+        self._started = None
+
+    def start(self):
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._sample_loop, daemon=True, name=f"density-{self.source.name}")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.5)
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            latest = self.source.frame_buffer.latest()
+            if latest is None or latest[0] == self._last_timestamp:
+                continue
+            self._last_timestamp = latest[0]
+            self.submit(latest[1])
+
+    def submit(self, frame):
+        """Queue one frame for estimation; skipped if the pool is behind"""
+        height, width = frame.shape[:2]
+        size = (self.width, max(1, round(self.width * height / width)))
+        gray = cv2.cvtColor(cv2.resize(frame, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray.astype(np.float32)
+            return
+        background = cv2.convertScaleAbs(self._background)
+        cv2.accumulateWeighted(gray, self._background, self.learning_rate)
+
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                self.frames_skipped += 1
+                return
+            self._in_flight += 1
+        self.frames_submitted += 1
+        submitted = time.perf_counter()
+        future = self.pool.submit(estimate_density, gray, background, self.lane_rois)
+        future.add_done_callback(lambda f: self._on_result(f, submitted))
+
+    def _on_result(self, future, submitted):
+        with self._lock:
+            self._in_flight -= 1
+            self._idle.notify_all()
+        try:
+            results = future.result()
+        except Exception as e:
+            print(f"Density estimation failed for camera {self.source.name}: {str(e)}")
+            return
+        self.latencies_ms.append((time.perf_counter() - submitted) * 1000.0)
+        self.frames_processed += 1
+        self.latest = results
+        payload = json.dumps({approach: count for approach, (count, _) in results.items()})
+        try:
+            self.publish(payload)
+        except Exception as e:
+            print(f"Failed to publish camera density: {str(e)}")
+
+    @property
+    def in_flight(self):
+        """Frames submitted to the pool and not yet estimated"""
+        return self._in_flight
+
+    def wait_idle(self, timeout=None):
+        """Wait until every submitted frame has been estimated; False on timeout"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._in_flight == 0, timeout)
+
+    def reset_metrics(self):
+        """Start counting throughput and latency afresh (e.g. after a warm-up)"""
+        self.frames_submitted = 0
+        self.frames_processed = 0
+        self.frames_skipped = 0
+        self.latencies_ms.clear()
+        self._started = time.monotonic()
+
+    def metrics(self):
+        """Throughput and per-frame latency of the estimator"""
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        latencies = np.array(self.latencies_ms) if self.latencies_ms else np.zeros(1)
+        return {
+            'frames_submitted': self.frames_submitted,
+            'frames_processed': self.frames_processed,
+            'frames_skipped': self.frames_skipped,
+            'fps': self.frames_processed / elapsed if elapsed > 0 else 0.0,
+            'latency_ms_mean': float(latencies.mean()),
+            'latency_ms_p95': float(np.percentile(latencies, 95)),
+        }
+
+
+def create_pool(workers=2):
+    """Process pool for density estimation; spawned so workers never inherit UI threads"""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
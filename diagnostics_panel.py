@@ -0,0 +1,95 @@
+import tkinter as tk
+from tkinter import ttk
+
+from metrics import PROFILER, REGISTRY
+
+# How often the open panel refreshes
+REFRESH_MS = 1000
+
+
+class DiagnosticsPanel:
+    """Window with live metrics, queue depths and the sampling profiler toggle"""
+
+    def __init__(self, root):
+        self.window = tk.Toplevel(root)
+        self.window.title("Diagnostics")
+        self.window.geometry("760x620")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        self._after = None
+
+        controls = ttk.Frame(self.window, padding="10")
+        controls.pack(fill=tk.X)
+        self.collect_var = tk.BooleanVar(value=REGISTRY.enabled)
+        ttk.Checkbutton(controls, text="Collect metrics", variable=self.collect_var,
+                        command=self.toggle_metrics).pack(side=tk.LEFT, padx=(0, 10))
+        self.profile_var = tk.BooleanVar(value=PROFILER.running)
+        ttk.Checkbutton(controls, text="Sampling profiler", variable=self.profile_var,
+                        command=self.toggle_profiler).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(controls, text="Reset profile", command=PROFILER.reset).pack(side=tk.LEFT)
+
+        # Latency histograms
+        latency_frame = ttk.LabelFrame(self.window, text="Latency", padding="5")
+        latency_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        columns = ('metric', 'labels', 'count', 'mean', 'p95')
+        self.latency_tree = ttk.Treeview(latency_frame, columns=columns, show="headings", height=10)
+        for column, heading, width in zip(columns, ('metric', 'labels', 'count', 'mean ms', 'p95 ms'),
+                                          (300, 140, 80, 90, 90)):
+            self.latency_tree.heading(column, text=heading)
+            self.latency_tree.column(column, width=width, anchor=tk.W)
+        self.latency_tree.pack(fill=tk.BOTH, expand=True)
+
+        # Counters and queue depths
+        values_frame = ttk.LabelFrame(self.window, text="Counters and queues", padding="5")
+        values_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.values_tree = ttk.Treeview(values_frame, columns=('metric', 'labels', 'value'), show="headings", height=6)
+        for column, width in zip(('metric', 'labels', 'value'), (300, 200, 100)):
+            self.values_tree.heading(column, text=column)
+            self.values_tree.column(column, width=width, anchor=tk.W)
+        self.values_tree.pack(fill=tk.BOTH, expand=True)
+
+        # Busiest functions while profiling
+        profile_frame = ttk.LabelFrame(self.window, text="Profile (share of samples)", padding="5")
+        profile_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.profile_text = tk.Text(profile_frame, height=8)
+        self.profile_text.pack(fill=tk.BOTH, expand=True)
+
+        self.refresh()
+
+    def toggle_metrics(self):
+        REGISTRY.enabled = self.collect_var.get()
+
+    def toggle_profiler(self):
+        if self.profile_var.get():
+            PROFILER.start()
+        else:
+            PROFILER.stop()
+
+    @staticmethod
+    def _fill(tree, rows):
+        items = tree.get_children()
+        for i, row in enumerate(rows):
+            if i < len(items):
+                tree.item(items[i], values=row)
+            else:
+                tree.insert("", tk.END, values=row)
+        for item in items[len(rows):]:
+            tree.delete(item)
+
+    def refresh(self):
+        histograms, values = REGISTRY.summary()
+        self._fill(self.latency_tree, [(name, labels, count, f"{mean * 1000:.3f}", f"{p95 * 1000:.3f}")
+                                       for name, labels, count, mean, p95 in histograms])
+        self._fill(self.values_tree, [(name, labels, f"{value:g}") for name, labels, value in values])
+
+        self.profile_text.delete(1.0, tk.END)
+        if PROFILER.samples:
+            lines = [f"{share * 100:5.1f}%  {name}" for name, share in PROFILER.top()]
+            self.profile_text.insert(tk.END, f"{PROFILER.samples} samples\n" + "\n".join(lines))
+        else:
+            self.profile_text.insert(tk.END, "Profiler is off." if not PROFILER.running else "Collecting samples...")
+        self._after = self.window.after(REFRESH_MS, self.refresh)
+
+    def close(self):
+        if self._after is not None:
+            self.window.after_cancel(self._after)
+        self.window.destroy()
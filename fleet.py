@@ -0,0 +1,336 @@
+"""Fleet state for many intersections on namespaced topics.
+
+Each intersection publishes under site/<id>/traffic/... (typically through
+a bridge from its local broker that adds the prefix). FleetIngest routes
+every message by site to one of N shard processes, so parsing and state
+keeping scale across cores. Each shard periodically sends a summary of
+the sites that changed plus its totals. The parent only merges those
+reports, so reading the fleet state never touches the message stream.
+
+With shards=0 the same state is kept in-process, which is enough for a
+handful of sites and is the baseline for benchmarks/bench_fleet.py.
+"""
+import collections
+import multiprocessing
+import queue
+import threading
+import time
+import zlib
+
+from traffic_rules import number_field
+
+SITE_TOPIC_PREFIX = "site/"
+FLEET_SUBSCRIPTION = "site/+/traffic/#"
+
+# Messages per batch sent to a shard, and the longest a partial batch waits
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 0.05
+
+# A site that has sent nothing for this long is shown as offline
+STALE_SECONDS = 30.0
+
+_distance = number_field('distance')
+_h_density = number_field('H')
+_v_density = number_field('V')
+
+
+def site_topic(site, topic):
+    """Topic of an intersection: site/<id>/<topic>, or the plain topic when site is None"""
+    return f"{SITE_TOPIC_PREFIX}{site}/{topic}" if site else topic
+
+
+def split_site_topic(topic):
+    """(site, topic) from site/<id>/<topic>; (None, topic) for plain topics"""
+    if not topic.startswith(SITE_TOPIC_PREFIX):
+        return None, topic
+    site, _, rest = topic[len(SITE_TOPIC_PREFIX):].partition('/')
+    return site, rest
+
+
+def shard_of(site, shards):
+    """Stable shard index for a site (the same in every process and run)"""
+    return zlib.crc32(site.encode()) % shards
+
+
+class IntersectionState:
+    """Latest known state of one intersection, kept by its shard"""
+
+    __slots__ = ('site', 'phase', 'phase_since', 'h_density', 'v_density', 'distance', 'crosswalk',
+                 'violations', 'recent_violations', 'last_seen', 'messages')
+
+    def __init__(self, site):
+        self.site = site
+        self.phase = "Unknown"
+        self.phase_since = None
+        self.h_density = 0
+        self.v_density = 0
+        self.distance = None
+        self.crosswalk = "Unknown"
+        self.violations = 0
+        self.recent_violations = collections.deque()  # Timestamps within the rate window
+        self.last_seen = None
+        self.messages = 0
+
+    def summary(self, rate_window):
+        return {
+            'site': self.site,
+            'phase': self.phase,
+            'phase_since': self.phase_since,
+            'h_density': self.h_density,
+            'v_density': self.v_density,
+            'distance': self.distance,
+            'crosswalk': self.crosswalk,
+            'violations': self.violations,
+            'violations_per_hour': len(self.recent_violations) * 3600.0 / rate_window,
+            'last_seen': self.last_seen,
+            'messages': self.messages,
+        }
+
+
+class FleetShard:
+    """State of the sites routed to one shard; fed batches of (topic, payload, timestamp, retain).
+
+    Retained messages are the broker's replay of old values on every
+    (re)subscribe: they fill in the phase, density and crosswalk state
+    but are not counted as violations and do not make a site look alive.
+    """
+
+    def __init__(self, rate_window=3600.0):
+        self.rate_window = rate_window
+        self.sites = {}
+        self.processed = 0
+        self.now = 0.0  # Newest message timestamp, so replays at any speed see their own clock
+        self._changed = set()
+
+    def apply(self, batch):
+        sites = self.sites
+        for topic, payload, timestamp, retain in batch:
+            site, topic = split_site_topic(topic)
+            state = sites.get(site)
+            if state is None:
+                state = sites[site] = IntersectionState(site)
+            if not retain:
+                state.messages += 1
+                state.last_seen = timestamp
+            if timestamp > self.now:
+                self.now = timestamp
+            if topic == 'traffic/distance':
+                distance = _distance(payload)
+                if distance is not None:
+                    state.distance = distance
+            elif topic == 'traffic/density':
+                h, v = _h_density(payload), _v_density(payload)
+                if h is not None and v is not None:
+                    state.h_density, state.v_density = int(h), int(v)
+            elif topic == 'traffic/phase':
+                phase = payload.decode(errors='replace')
+                if phase != state.phase:
+                    state.phase = phase
+                    state.phase_since = None if retain else timestamp
+            elif topic == 'traffic/crosswalk':
+                state.crosswalk = payload.decode(errors='replace')
+            elif topic == 'traffic/violation' and payload == b'RED_VIOLATION' and not retain:
+                state.violations += 1
+                state.recent_violations.append(timestamp)
+            self._changed.add(site)
+        self.processed += len(batch)
+
+    def report(self):
+        """(summaries of the sites changed since the last report, totals over all sites)"""
+        cutoff = self.now - self.rate_window
+        totals = {'sites': len(self.sites), 'phases': collections.Counter(), 'h_density': 0, 'v_density': 0,
+                  'violations': 0, 'recent_violations': 0, 'messages': 0}
+        for site, state in self.sites.items():
+            recent = state.recent_violations
+            if recent and recent[0] <= cutoff:
+                while recent and recent[0] <= cutoff:
+                    recent.popleft()
+                self._changed.add(site)
+            totals['phases'][state.phase] += 1
+            totals['h_density'] += state.h_density
+            totals['v_density'] += state.v_density
+            totals['violations'] += state.violations
+            totals['recent_violations'] += len(recent)
+            totals['messages'] += state.messages
+        changed = {site: self.sites[site].summary(self.rate_window) for site in self._changed}
+        self._changed.clear()
+        return changed, totals
+
+
+def _run_shard(inbox, outbox, index, rate_window, report_interval):
+    """Shard process: apply batches from inbox, send reports to outbox until a None batch"""
+    shard = FleetShard(rate_window)
+    next_report = time.monotonic() + report_interval
+    while True:
+        try:
+            batch = inbox.get(timeout=report_interval)
+        except queue.Empty:
+            batch = ()
+        if batch is None:
+            break
+        shard.apply(batch)
+        if time.monotonic() >= next_report:
+            outbox.put((index, shard.processed, *shard.report()))
+            next_report = time.monotonic() + report_interval
+    outbox.put((index, shard.processed, *shard.report()))
+
+
+class FleetIngest:
+    """Routes namespaced messages to shard processes and merges their reports.
+
+    submit() is cheap (a topic split and a list append under the shard's
+    batch lock) and is called straight from the fleet connection's network
+    thread, so fleet traffic never waits in the engine's inbound queue. snapshot(), site() and totals() read the merged
+    reports, so they cost O(sites) at most and never wait for the shards;
+    values are at most report_interval old.
+    """
+
+    def __init__(self, shards=2, report_interval=0.5, rate_window=3600.0):
+        self.shards = shards
+        self.report_interval = report_interval
+        self.rate_window = rate_window
+        self.submitted = 0
+        self.unrouted = 0
+        self._sites = {}
+        self._shard_totals = {}
+        self._processed = {}
+        self._lock = threading.Lock()  # Merged state
+        self._batch_locks = [threading.Lock() for _ in range(max(shards, 1))]  # One per shard batch
+        self._shard_index = {}  # site -> shard, cached
+        self._local = FleetShard(rate_window) if shards == 0 else None
+        self._batches = [[] for _ in range(shards)]
+        self._inboxes = []
+        self._processes = []
+        self._outbox = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        if self._local is None:
+            # Spawned so shard processes never inherit the UI or MQTT threads
+            context = multiprocessing.get_context('spawn')
+            self._outbox = context.Queue()
+            for index in range(self.shards):
+                inbox = context.Queue()
+                process = context.Process(target=_run_shard, daemon=True, name=f"fleet-shard-{index}",
+                                          args=(inbox, self._outbox, index, self.rate_window, self.report_interval))
+                process.start()
+                self._inboxes.append(inbox)
+                self._processes.append(process)
+            self._threads.append(threading.Thread(target=self._collect_loop, daemon=True, name="fleet-collect"))
+        self._threads.append(threading.Thread(target=self._flush_loop, daemon=True, name="fleet-flush"))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        for thread in self._threads:
+            if thread.name == "fleet-flush":
+                thread.join(timeout=timeout)
+        self.flush()
+        for inbox in self._inboxes:
+            inbox.put(None)
+        for process in self._processes:
+            process.join(timeout=timeout)
+            if process.is_alive():
+                process.terminate()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+        self._processes = []
+        self._inboxes = []
+
+    def submit(self, topic, payload, timestamp=None, retain=False):
+        """Queue one site/<id>/traffic/... message for its shard; pass the message's retain flag"""
+        site, _ = split_site_topic(topic)
+        if not site:
+            self.unrouted += 1
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        self.submitted += 1
+        if self._local is not None:
+            with self._batch_locks[0]:
+                self._local.apply(((topic, payload, timestamp, retain),))
+            return
+        index = self._shard_index.get(site)
+        if index is None:
+            index = self._shard_index[site] = shard_of(site, self.shards)
+        with self._batch_locks[index]:
+            batch = self._batches[index]
+            batch.append((topic, payload, timestamp, retain))
+            if len(batch) >= BATCH_SIZE:
+                self._batches[index] = []
+                self._inboxes[index].put(batch)
+
+    def flush(self):
+        """Send partial batches to the shards (the in-process shard reports instead)"""
+        if self._local is not None:
+            with self._batch_locks[0]:
+                report = self._local.processed, *self._local.report()
+            self._merge(0, *report)
+            return
+        for index, lock in enumerate(self._batch_locks):
+            with lock:
+                batch, self._batches[index] = self._batches[index], []
+            if batch:
+                self._inboxes[index].put(batch)
+
+    def _flush_loop(self):
+        interval = FLUSH_INTERVAL if self._local is None else self.report_interval
+        while not self._stop.wait(interval):
+            self.flush()
+
+    def _collect_loop(self):
+        while not (self._stop.is_set() and not any(p.is_alive() for p in self._processes)):
+            try:
+                report = self._outbox.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            self._merge(*report)
+
+    def _merge(self, index, processed, changed, totals):
+        with self._lock:
+            self._sites.update(changed)
+            self._shard_totals[index] = totals
+            self._processed[index] = processed
+
+    @property
+    def processed(self):
+        """Messages the shards have reported as applied"""
+        with self._lock:
+            return sum(self._processed.values())
+
+    def sites(self):
+        with self._lock:
+            return sorted(self._sites)
+
+    def site(self, site):
+        """Summary dict of one intersection, or None if it has not been heard from"""
+        with self._lock:
+            summary = self._sites.get(site)
+        return dict(summary) if summary is not None else None
+
+    def snapshot(self):
+        """Summary dicts of every intersection, by site id"""
+        with self._lock:
+            return sorted(self._sites.values(), key=lambda summary: summary['site'])
+
+    def totals(self):
+        """Fleet-wide counts: sites, sites per phase, summed density and violation rate"""
+        with self._lock:
+            shard_totals = list(self._shard_totals.values())
+        phases = collections.Counter()
+        for totals in shard_totals:
+            phases.update(totals['phases'])
+        recent = sum(totals['recent_violations'] for totals in shard_totals)
+        return {
+            'sites': sum(totals['sites'] for totals in shard_totals),
+            'phases': dict(phases),
+            'h_density': sum(totals['h_density'] for totals in shard_totals),
+            'v_density': sum(totals['v_density'] for totals in shard_totals),
+            'violations': sum(totals['violations'] for totals in shard_totals),
+            'violations_per_hour': recent * 3600.0 / self.rate_window,
+            'messages': sum(totals['messages'] for totals in shard_totals),
+        }
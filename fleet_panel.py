@@ -0,0 +1,78 @@
+import time
+import tkinter as tk
+from tkinter import ttk
+
+from fleet import STALE_SECONDS
+
+# How often the open panel refreshes
+REFRESH_MS = 1000
+
+COLUMNS = ('site', 'phase', 'H', 'V', 'distance', 'crosswalk', 'violations/h', 'last seen')
+
+
+class FleetPanel:
+    """Window listing every intersection in the fleet; double-click one to view it on the dashboard"""
+
+    def __init__(self, root, fleet, on_open):
+        self.fleet = fleet
+        self.on_open = on_open
+        self.window = tk.Toplevel(root)
+        self.window.title("Fleet")
+        self.window.geometry("820x560")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        self._after = None
+
+        self.totals_label = ttk.Label(self.window, text="", padding="10")
+        self.totals_label.pack(fill=tk.X)
+
+        sites_frame = ttk.LabelFrame(self.window, text="Intersections", padding="5")
+        sites_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.tree = ttk.Treeview(sites_frame, columns=COLUMNS, show="headings")
+        for column, width in zip(COLUMNS, (140, 90, 50, 50, 80, 150, 90, 90)):
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=width, anchor=tk.W)
+        scrollbar = ttk.Scrollbar(sites_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.bind("<Double-1>", self.open_selected)
+
+        self.refresh()
+
+    def open_selected(self, event=None):
+        selection = self.tree.selection()
+        if selection:
+            self.on_open(selection[0])
+
+    def refresh(self):
+        totals = self.fleet.totals()
+        phases = ", ".join(f"{phase} {count}" for phase, count in sorted(totals['phases'].items()))
+        self.totals_label.config(text=f"{totals['sites']} sites ({phases or 'none'})   "
+                                      f"density H {totals['h_density']} / V {totals['v_density']}   "
+                                      f"{totals['violations_per_hour']:.1f} violations/h")
+
+        # Rows are keyed by site id, so the selection survives refreshes
+        now = time.time()
+        rows = {}
+        for summary in self.fleet.snapshot():
+            age = now - summary['last_seen'] if summary['last_seen'] is not None else None
+            distance = summary['distance']
+            rows[summary['site']] = (
+                summary['site'], summary['phase'], summary['h_density'], summary['v_density'],
+                f"{distance:g} cm" if distance is not None else "-", summary['crosswalk'],
+                f"{summary['violations_per_hour']:.1f}",
+                "offline" if age is None or age > STALE_SECONDS else f"{age:.0f} s ago")
+        for item in self.tree.get_children():
+            if item not in rows:
+                self.tree.delete(item)
+        for index, (site, row) in enumerate(rows.items()):
+            if self.tree.exists(site):
+                self.tree.item(site, values=row)
+            else:
+                self.tree.insert("", index, iid=site, values=row)
+        self._after = self.window.after(REFRESH_MS, self.refresh)
+
+    def close(self):
+        if self._after is not None:
+            self.window.after_cancel(self._after)
+        self.window.destroy()
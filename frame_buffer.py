@@ -0,0 +1,150 @@
+import threading
+import time
+
+import numpy as np
+
+
+class FrameRingBuffer:
+    """Fixed-size ring buffer of timestamped camera frames.
+
+    Storage is a single preallocated NumPy array, so pushing a frame is one
+    copy into an existing slot and never allocates on the capture path.
+    With max_bytes set, fewer than capacity slots are allocated when the
+    frames are too large to fit.
+    """
+
+    def __init__(self, capacity=64, max_bytes=None):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.slots = capacity  # Allocated slots: capacity, or fewer under max_bytes
+        self._frames = None  # (slots, h, w, c), allocated on the first frame
+        self._stamps = np.zeros(capacity, dtype=np.float64)
+        self._count = 0  # Total frames written since the last reset
+        self._generation = 0  # Bumped whenever the storage is reallocated or cleared
+        self._lock = threading.Lock()
+
+    def push(self, frame, timestamp=None):
+        """Copy a frame into the next slot, overwriting the oldest one"""
+        if timestamp is None:
+            timestamp = time.time()
+        with self._lock:
+            if self._frames is None or self._frames.shape[1:] != frame.shape or self._frames.dtype != frame.dtype:
+                # (Re)allocate when the camera or its resolution changes
+                self._allocate(frame)
+            slot = self._count % self.slots
+            np.copyto(self._frames[slot], frame)
+            self._stamps[slot] = timestamp
+            self._count += 1
+
+    def _allocate(self, frame):
+        """Size the storage for frames like this one; caller must hold the lock"""
+        slots = self.capacity
+        if self.max_bytes:
+            slots = max(1, min(slots, self.max_bytes // frame.nbytes))
+            if slots < self.capacity:
+                print(f"Frame buffer capped at {slots} of {self.capacity} frames "
+                      f"({self.max_bytes / 2 ** 20:.0f} MB limit)")
+        self._frames = None  # Release the old storage before allocating the new one
+        self._frames = np.empty((slots,) + frame.shape, dtype=frame.dtype)
+        self._stamps = np.zeros(slots, dtype=np.float64)
+        self.slots = slots
+        self._count = 0
+        self._generation += 1
+
+    def clear(self):
+        """Drop all buffered frames (keeps the allocation)"""
+        with self._lock:
+            self._count = 0
+            self._generation += 1
+
+    def __len__(self):
+        with self._lock:
+            return min(self._count, self.slots)
+
+    @property
+    def nbytes(self):
+        """Memory held by the frame storage"""
+        frames = self._frames
+        return frames.nbytes if frames is not None else 0
+
+    def _ordered_slots(self):
+        """Slot indexes from oldest to newest; caller must hold the lock"""
+        n = min(self._count, self.slots)
+        return (np.arange(self._count - n, self._count)) % self.slots
+
+    def latest(self):
+        """Return (timestamp, frame) for the newest frame, or None"""
+        with self._lock:
+            if self._count == 0:
+                return None
+            slot = (self._count - 1) % self.slots
+            return float(self._stamps[slot]), self._frames[slot].copy()
+
+    def window(self, start, end):
+        """Return [(timestamp, frame), ...] captured between start and end, oldest first"""
+        with self._lock:
+            if self._count == 0:
+                return []
+            slots = self._ordered_slots()
+            stamps = self._stamps[slots]
+            selected = slots[(stamps >= start) & (stamps <= end)]
+            return [(float(self._stamps[s]), self._frames[s].copy()) for s in selected]
+
+    def iter_window(self, start, end, transform=None):
+        """Yield (timestamp, frame) captured between start and end, oldest first.
+
+        Unlike window(), the lock is held for one frame copy at a time, so a
+        long window never holds up push(). Frames overwritten while iterating
+        are skipped. transform(frame) runs on each copy outside the lock.
+        """
+        with self._lock:
+            generation = self._generation
+            first = max(0, self._count - self.slots)
+            last = self._count
+        for seq in range(first, last):
+            with self._lock:
+                if self._generation != generation:
+                    return
+                if seq < self._count - self.slots:
+                    continue  # Already overwritten by newer frames
+                slot = seq % self.slots
+                timestamp = float(self._stamps[slot])
+                if timestamp < start:
+                    continue
+                if timestamp > end:
+                    return
+                frame = self._frames[slot].copy()
+            yield timestamp, transform(frame) if transform is not None else frame
+
+
+class LatestFrame:
+    """Latest-wins handoff of frames from a capture thread to a consumer.
+
+    The producer swaps in a reference to its newest frame and the consumer
+    takes it; a frame that is replaced before it was taken counts as dropped.
+    The producer must not write into a frame after publishing it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frame = None
+        self._seq = 0
+        self._taken_seq = 0
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, frame):
+        with self._lock:
+            if self._seq != self._taken_seq:
+                self.dropped += 1
+            self._frame = frame
+            self._seq += 1
+            self.published += 1
+
+    def take(self):
+        """Return the newest frame not yet taken, or None"""
+        with self._lock:
+            if self._seq == self._taken_seq:
+                return None
+            self._taken_seq = self._seq
+            return self._frame
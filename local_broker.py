@@ -0,0 +1,290 @@
+import itertools
+import queue
+import random
+import threading
+import time
+
+
+def topic_matches(subscription, topic):
+    """MQTT topic filter matching with + and # wildcards"""
+    sub_parts = subscription.split('/')
+    topic_parts = topic.split('/')
+    for i, part in enumerate(sub_parts):
+        if part == '#':
+            return True
+        if i >= len(topic_parts):
+            return False
+        if part != '+' and part != topic_parts[i]:
+            return False
+    return len(sub_parts) == len(topic_parts)
+
+
+class LocalMessage:
+    """Same attributes as paho's MQTTMessage that the dashboard reads"""
+
+    __slots__ = ('topic', 'payload', 'qos', 'retain', 'mid', 'dup')
+
+    def __init__(self, topic, payload, qos=0, retain=False, mid=0, dup=False):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.mid = mid
+        self.dup = dup
+
+
+class LocalBroker:
+    """In-process MQTT broker stand-in for running without the ESP32s.
+
+    Supports retained messages, wildcard subscriptions and per-subscription
+    QoS. Each client gets its own delivery thread, like paho's network
+    loop, so handlers run off the publisher's thread.
+
+    Faults can be injected for testing: set_online(False) drops every
+    connection and refuses new ones until set_online(True), and
+    duplicate_rate redelivers that share of QoS 1 messages a second time
+    with the dup flag, as after a lost PUBACK.
+    """
+
+    def __init__(self, duplicate_rate=0.0, seed=None):
+        self._clients = []
+        self._retained = {}
+        self._lock = threading.Lock()
+        self._mids = itertools.count(1)
+        self.online = True
+        self.duplicate_rate = duplicate_rate
+        self._random = random.Random(seed)
+
+    def client(self, client_id=""):
+        return LocalClient(self, client_id)
+
+    def set_online(self, online):
+        """Take the broker down (dropping every client) or bring it back"""
+        with self._lock:
+            self.online = online
+            dropped = [] if online else list(self._clients)
+            if not online:
+                self._clients = []
+        for client in dropped:
+            client._connection_lost()
+
+    def _connect(self, client):
+        with self._lock:
+            if not self.online:
+                return False
+            if client not in self._clients:
+                self._clients.append(client)
+            return True
+
+    def _disconnect(self, client):
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+
+    def _subscribe(self, client, subscription):
+        with self._lock:
+            retained = [msg for topic, msg in self._retained.items() if topic_matches(subscription, topic)]
+        for msg in retained:
+            client._deliver(LocalMessage(msg.topic, msg.payload, msg.qos, True, next(self._mids)))
+
+    def wait_for_subscriber(self, topic, timeout=5.0):
+        """Block until some client is subscribed to topic; False on timeout"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                clients = list(self._clients)
+            if any(client._is_subscribed(topic) for client in clients):
+                return True
+            time.sleep(0.01)
+        return False
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        elif payload is None:
+            payload = b''
+        mid = next(self._mids)
+        with self._lock:
+            if retain:
+                if payload:
+                    self._retained[topic] = LocalMessage(topic, payload, qos, True)
+                else:
+                    self._retained.pop(topic, None)
+            clients = list(self._clients)
+        for client in clients:
+            sub_qos = client._subscribed_qos(topic)
+            if sub_qos is None:
+                continue
+            delivered_qos = min(qos, sub_qos)
+            client._deliver(LocalMessage(topic, payload, delivered_qos, False, mid))
+            if delivered_qos > 0 and self.duplicate_rate and self._random.random() < self.duplicate_rate:
+                client._deliver(LocalMessage(topic, payload, delivered_qos, False, mid, dup=True))
+        return mid
+
+
+class LocalPublishResult:
+    """Mimics paho's MQTTMessageInfo"""
+
+    def __init__(self, mid, rc=0):
+        self.mid = mid
+        self.rc = rc
+
+    def wait_for_publish(self, timeout=None):
+        return True
+
+    def is_published(self):
+        return self.rc == 0
+
+
+class LocalClient:
+    """Subset of paho.mqtt.client.Client backed by a LocalBroker.
+
+    Like paho, connect_async() leaves connecting to the loop thread, which
+    retries failed or dropped connections with a delay doubling from
+    min_delay to max_delay (see reconnect_delay_set()).
+    """
+
+    def __init__(self, broker, client_id=""):
+        self.broker = broker
+        self.client_id = client_id
+        self.on_connect = None
+        self.on_connect_fail = None
+        self.on_disconnect = None
+        self.on_message = None
+        self._subscriptions = {}
+        self._inbox = queue.Queue()
+        self._thread = None
+        self._connected = False
+        self._auto_reconnect = False
+        self._min_delay = 1
+        self._max_delay = 120
+        self._delay = None
+        self._retry_at = None
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        self._min_delay = min_delay
+        self._max_delay = max_delay
+
+    def connect(self, host=None, port=1883, keepalive=60):
+        if not self.broker._connect(self):
+            raise ConnectionRefusedError("Local broker is offline")
+        self._connected = True
+        if self.on_connect is not None:
+            self._inbox.put(('connect', None))
+        return 0
+
+    def connect_async(self, host=None, port=1883, keepalive=60):
+        self._auto_reconnect = True
+        self._inbox.put(('reconnect', None))
+        return 0
+
+    def reconnect(self):
+        return self.connect()
+
+    def disconnect(self):
+        self._auto_reconnect = False
+        self._retry_at = None
+        self.broker._disconnect(self)
+        self._connected = False
+        self._subscriptions = {}
+        if self.on_disconnect is not None:
+            self._inbox.put(('disconnect', 0))
+        return 0
+
+    def _connection_lost(self):
+        """Called by the broker when it drops this client"""
+        self._connected = False
+        self._subscriptions = {}  # Clean session: the broker forgets them
+        self._inbox.put(('lost', 7))  # MQTT_ERR_CONN_LOST
+
+    def is_connected(self):
+        return self._connected
+
+    def loop_start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True, name=f"local-mqtt-{self.client_id}")
+            self._thread.start()
+        return 0
+
+    def loop_stop(self):
+        if self._thread is not None:
+            self._inbox.put(None)
+            self._thread.join(timeout=1.5)
+            self._thread = None
+        return 0
+
+    def subscribe(self, topic, qos=0):
+        if not self._connected:
+            return 4, None  # MQTT_ERR_NO_CONN
+        topics = topic if isinstance(topic, list) else [(topic, qos)]
+        for subscription, sub_qos in topics:
+            self._subscriptions[subscription] = sub_qos
+            self.broker._subscribe(self, subscription)
+        return 0, 1
+
+    def unsubscribe(self, topic):
+        for subscription in (topic if isinstance(topic, list) else [topic]):
+            self._subscriptions.pop(subscription, None)
+        return 0, 1
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if not self._connected:
+            return LocalPublishResult(0, rc=4)  # MQTT_ERR_NO_CONN
+        return LocalPublishResult(self.broker.publish(topic, payload, qos, retain))
+
+    def _is_subscribed(self, topic):
+        return self._subscribed_qos(topic) is not None
+
+    def _subscribed_qos(self, topic):
+        """Highest QoS of the subscriptions matching topic, None if there is none"""
+        matches = [qos for s, qos in list(self._subscriptions.items()) if topic_matches(s, topic)]
+        return max(matches) if matches else None
+
+    def _deliver(self, msg):
+        self._inbox.put(('message', msg))
+
+    def _try_connect(self):
+        """One connection attempt from the loop thread; schedules the next on failure"""
+        self._retry_at = None
+        if self._connected or not self._auto_reconnect:
+            return
+        try:
+            self.connect()
+            self._delay = None
+        except ConnectionRefusedError:
+            if self.on_connect_fail is not None:
+                self.on_connect_fail(self, None)
+            self._schedule_retry()
+
+    def _schedule_retry(self):
+        self._delay = self._min_delay if self._delay is None else min(self._delay * 2, self._max_delay)
+        self._retry_at = time.monotonic() + self._delay
+
+    def _loop(self):
+        while True:
+            timeout = None if self._retry_at is None else max(0.0, self._retry_at - time.monotonic())
+            try:
+                item = self._inbox.get(timeout=timeout)
+            except queue.Empty:
+                try:
+                    self._try_connect()
+                except Exception as e:
+                    print(f"Local MQTT callback error: {str(e)}")
+                continue
+            if item is None:
+                return
+            kind, msg = item
+            try:
+                if kind == 'connect':
+                    self.on_connect(self, None, {}, 0, None)
+                elif kind == 'reconnect':
+                    self._try_connect()
+                elif kind in ('disconnect', 'lost'):
+                    if kind == 'lost' and self._auto_reconnect:
+                        self._schedule_retry()
+                    if self.on_disconnect is not None:
+                        self.on_disconnect(self, None, {}, msg, None)
+                elif self.on_message is not None:
+                    self.on_message(self, None, msg)
+            except Exception as e:
+                print(f"Local MQTT callback error: {str(e)}")
@@ -0,0 +1,334 @@
+"""Counters, histograms and gauges for the dashboard's hot paths.
+
+Instruments are module-level objects in the code they measure. Collection
+is off by default: call sites check REGISTRY.enabled before timing
+anything, so a disabled registry costs one attribute lookup per event.
+Gauges are callbacks read only when metrics are rendered.
+
+The registry renders the Prometheus text format; MetricsServer serves it
+on /metrics, together with /profile while the sampling profiler runs.
+"""
+import bisect
+import collections
+import math
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(text, quote=True):
+    """Backslash, newline (and double quote in label values) escaped per the text format"""
+    text = str(text).replace('\\', '\\\\').replace('\n', '\\n')
+    return text.replace('"', '\\"') if quote else text
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """Monotonic count, optionally per label values"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, labels, value) for labels, value in items]
+
+
+class HistogramValues:
+    """Bucket counts, sum and count for one set of label values"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        """Estimate from the buckets (upper bound of the bucket holding the quantile)"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (math.inf,), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound if bound != math.inf else self.buckets[-1]
+        return self.buckets[-1]
+
+
+class Histogram:
+    """Latency distribution with fixed buckets, optionally per label values"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, HistogramValues(self.buckets))
+        return child
+
+    def observe(self, value, *labels):
+        self.labels(*labels).observe(value)
+
+    def children(self):
+        return list(self._children.items())
+
+    def samples(self):
+        out = []
+        for labels, child in self.children():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += n
+                le = "+Inf" if bound == math.inf else repr(bound)
+                out.append((f"{self.name}_bucket", labels + (le,), cumulative))
+            out.append((f"{self.name}_sum", labels, child.sum))
+            out.append((f"{self.name}_count", labels, child.count))
+        return out
+
+    def label_names_for(self, sample_name):
+        return self.label_names + ('le',) if sample_name.endswith('_bucket') else self.label_names
+
+
+class Gauge:
+    """Current value read from a callback when metrics are rendered"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._callbacks = {}
+
+    def set_function(self, callback, *labels):
+        self._callbacks[labels] = callback
+
+    def remove(self, *labels):
+        self._callbacks.pop(labels, None)
+
+    def samples(self):
+        out = []
+        for labels, callback in list(self._callbacks.items()):
+            try:
+                out.append((self.name, labels, float(callback())))
+            except Exception:
+                continue
+        return out
+
+
+class Registry:
+    """All instruments, plus the switch that turns collection on and off"""
+
+    def __init__(self):
+        self.enabled = False
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help, **options):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **options)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._get_or_create(Counter, name, help, labels=labels)
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._get_or_create(Histogram, name, help, labels=labels, buckets=buckets)
+
+    def gauge(self, name, help, labels=()):
+        return self._get_or_create(Gauge, name, help, labels=labels)
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics():
+            samples = metric.samples()
+            if not samples:
+                continue
+            lines.append(f"# HELP {metric.name} {_escape(metric.help, quote=False)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in samples:
+                names = metric.label_names_for(name) if metric.kind == 'histogram' else metric.label_names
+                lines.append(f"{name}{_format_labels(names, labels)} {value!r}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """[(name, labels, count, mean, p95)] for histograms and [(name, labels, value)] for the rest"""
+        histograms, values = [], []
+        for metric in self.metrics():
+            if metric.kind == 'histogram':
+                for labels, child in metric.children():
+                    mean = child.sum / child.count if child.count else 0.0
+                    histograms.append((metric.name, ",".join(labels), child.count, mean, child.quantile(0.95)))
+            else:
+                for name, labels, value in metric.samples():
+                    values.append((name, ",".join(labels), value))
+        return histograms, values
+
+
+REGISTRY = Registry()
+
+
+class SamplingProfiler:
+    """Opt-in statistical profiler: samples every thread's stack on an interval.
+
+    Costs nothing until started; while running, the cost is one
+    sys._current_frames() walk per interval.
+    """
+
+    def __init__(self, interval=0.005, max_depth=40):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="sampling-profiler")
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=1.5)
+        self._thread = None
+
+    def reset(self):
+        self.stacks.clear()
+        self.samples = 0
+
+    def _loop(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in list(names):
+                if ident not in frames:
+                    del names[ident]
+            for ident, frame in frames.items():
+                if ident == own:
+                    continue
+                if ident not in names:
+                    thread = next((t for t in threading.enumerate() if t.ident == ident), None)
+                    names[ident] = thread.name if thread is not None else str(ident)
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names[ident])
+                self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Stacks in the collapsed format used by flamegraph tools"""
+        stacks = collections.Counter(dict(self.stacks))  # Copy; the sampler keeps adding
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in stacks.most_common()) + "\n"
+
+    def top(self, limit=15):
+        """[(function, share of samples on top of the stack)] for the busiest functions"""
+        own = collections.Counter()
+        stacks = dict(self.stacks)
+        total = sum(stacks.values())
+        for stack, count in stacks.items():
+            own[stack[-1]] += count
+        return [(name, count / total) for name, count in own.most_common(limit)] if total else []
+
+
+PROFILER = SamplingProfiler()
+
+
+class MetricsServer:
+    """Serves /metrics (Prometheus text) and /profile (collapsed stacks) on a local port"""
+
+    def __init__(self, registry=REGISTRY, profiler=PROFILER, host="127.0.0.1", port=9108):
+        registry_ref, profiler_ref = registry, profiler
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = registry_ref.render()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/profile":
+                    body = profiler_ref.collapsed()
+                    content_type = "text/plain"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True, name="metrics-http")
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
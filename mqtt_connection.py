@@ -0,0 +1,259 @@
+"""Broker connection for the engine: reconnects, per-topic QoS, event
+deduplication and a bounded inbound queue.
+
+Works with a paho Client or a LocalClient; both run their own network
+thread, which only filters and queues messages here. Handlers run on the
+connection's worker thread, so a slow handler never stalls keepalives.
+"""
+import collections
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class InboundQueue:
+    """Bounded FIFO between the MQTT network thread and the message handler.
+
+    Drop policy when full: the oldest queued QoS 0 message (telemetry, which
+    newer readings supersede anyway) makes room for the new one; a QoS 0
+    message that finds only QoS 1+ messages queued is dropped itself.
+    QoS 1+ messages are never dropped: if nothing can make room, put()
+    waits, which stalls the network loop and leaves further messages with
+    the broker.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = collections.Counter()  # Per topic
+        self.high_water = 0
+
+    def put(self, msg):
+        """Queue a message; returns False if it (or nothing) was dropped in its place"""
+        with self._cond:
+            if len(self._items) >= self.maxsize and not self._make_room(msg):
+                if msg.qos == 0:
+                    self.dropped[msg.topic] += 1
+                    return False
+                while len(self._items) >= self.maxsize and not self._closed:
+                    self._cond.wait()
+            if self._closed:
+                return False
+            self._items.append(msg)
+            self.high_water = max(self.high_water, len(self._items))
+            self._cond.notify_all()
+            return True
+
+    def _make_room(self, msg):
+        """Drop the oldest QoS 0 message; caller must hold the lock"""
+        for i, queued in enumerate(self._items):
+            if queued.qos == 0:
+                del self._items[i]
+                self.dropped[queued.topic] += 1
+                return True
+        return False
+
+    def get(self, timeout=None):
+        """Next message, or None once closed (or after timeout)"""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            msg = self._items.popleft()
+            self._cond.notify_all()
+            return msg
+
+    def close(self):
+        """Wake every waiter; queued messages are still handed out by get()"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+
+class DuplicateFilter:
+    """Drops stale and repeated copies of event messages such as RED_VIOLATION.
+
+    Event payloads carry no id, and every violation has the same payload,
+    so copies are recognised by how they arrive. A retained message is a
+    replay of an old event. A redelivery is the case this covers: a QoS 1
+    message whose PUBACK was lost is sent again with the dup flag and the
+    same packet id. It is dropped only if a message with that topic,
+    packet id and payload was accepted within `window` seconds; a dup
+    with any other packet id is a different event and is accepted.
+    Packet ids are reused once acknowledged, so the window must stay far
+    shorter than the time it takes the broker to cycle through them.
+    State topics are not filtered; their retained values bootstrap the
+    dashboard on every connect.
+    """
+
+    def __init__(self, topics, window=30.0):
+        self.topics = set(topics)
+        self.window = window
+        self._accepted = collections.OrderedDict()  # (topic, packet id, payload) -> monotonic time, oldest first
+        self.retained = 0
+        self.duplicates = 0
+
+    def accept(self, msg, now=None):
+        if msg.topic not in self.topics:
+            return True
+        if msg.retain:
+            self.retained += 1
+            return False
+        if msg.qos == 0:
+            # Never redelivered, and paho gives QoS 0 messages no packet id
+            return True
+        now = time.monotonic() if now is None else now
+        accepted = self._accepted
+        while accepted and now - next(iter(accepted.values())) > self.window:
+            accepted.popitem(last=False)
+        key = (msg.topic, msg.mid, msg.payload)
+        if msg.dup and key in accepted:
+            self.duplicates += 1
+            return False
+        accepted[key] = now
+        accepted.move_to_end(key)
+        return True
+
+
+class MqttConnection:
+    """Keeps one broker connection alive and feeds its messages to a handler.
+
+    connect() returns at once. The client's network thread connects in the
+    background and, whenever the connection fails or drops, retries after
+    a delay that doubles from min_delay up to max_delay. Every connect
+    (re)subscribes each topic with its own QoS, so retained state is
+    bootstrapped again after an outage. handler(msg) runs on a worker
+    thread fed by an InboundQueue; messages on event_topics pass a
+    DuplicateFilter first. With queue_size=None there is no queue or
+    worker and handler runs on the network thread, for handlers that only
+    hand messages on (such as fleet.FleetIngest.submit).
+
+    on_state(state, detail) is called on every change between
+    'connecting', 'connected' and 'disconnected'.
+    """
+
+    def __init__(self, client, host, port, handler, subscriptions, event_topics=(), keepalive=60,
+                 min_delay=1, max_delay=60, queue_size=1000, dedup_window=30.0):
+        self.client = client
+        self.host = host
+        self.port = port
+        self.handler = handler
+        self.subscriptions = dict(subscriptions)  # topic -> QoS
+        self.keepalive = keepalive
+        self.inbound = InboundQueue(queue_size) if queue_size is not None else None
+        self.duplicates = DuplicateFilter(event_topics, dedup_window)
+        self.on_state = None
+        self.state = 'disconnected'
+        self.connects = 0
+        self.failed_attempts = 0
+
+        client.reconnect_delay_set(min_delay=min_delay, max_delay=max_delay)
+        client.on_connect = self._on_connect
+        client.on_connect_fail = self._on_connect_fail
+        client.on_disconnect = self._on_disconnect
+        client.on_message = self._on_message
+        self._worker = None
+        if self.inbound is not None:
+            self._worker = threading.Thread(target=self._work_loop, daemon=True, name="mqtt-inbound")
+            self._worker.start()
+
+    @property
+    def connected(self):
+        return self.state == 'connected'
+
+    def connect(self):
+        """Start connecting in the background; never blocks on the network"""
+        self._set_state('connecting', f"{self.host}:{self.port}")
+        try:
+            self.client.connect_async(self.host, self.port, self.keepalive)
+        except Exception as e:
+            # Only argument errors get here; network failures are retried by the loop
+            self._set_state('disconnected', str(e))
+            raise
+        self.client.loop_start()
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """Publish through the client; QoS 1+ messages are acknowledged by the broker"""
+        return self.client.publish(topic, payload, qos=qos, retain=retain)
+
+    def stop(self, timeout=1.5):
+        """Disconnect, stop the network loop and hand queued messages to the handler"""
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+        self.client.loop_stop()
+        if self._worker is not None:
+            self.inbound.close()
+            self._worker.join(timeout=timeout)
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'connects': self.connects,
+            'failed_attempts': self.failed_attempts,
+            'queued': len(self.inbound) if self.inbound is not None else 0,
+            'queue_high_water': self.inbound.high_water if self.inbound is not None else 0,
+            'dropped': sum(self.inbound.dropped.values()) if self.inbound is not None else 0,
+            'retained_events_ignored': self.duplicates.retained,
+            'duplicates_ignored': self.duplicates.duplicates,
+        }
+
+    def _set_state(self, state, detail=""):
+        self.state = state
+        if self.on_state is not None:
+            try:
+                self.on_state(state, detail)
+            except Exception:
+                logger.exception("Connection state callback failed")
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc != 0:
+            self.failed_attempts += 1
+            self._set_state('connecting', f"refused by broker ({rc})")
+            return
+        self.connects += 1
+        client.subscribe(list(self.subscriptions.items()))
+        logger.info("Connected to MQTT broker at %s:%s", self.host, self.port)
+        self._set_state('connected', f"{self.host}:{self.port}")
+
+    def _on_connect_fail(self, client, userdata):
+        self.failed_attempts += 1
+        self._set_state('connecting', f"{self.host}:{self.port} unreachable, retrying")
+
+    def _on_disconnect(self, client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            self._set_state('disconnected', "")
+        else:
+            logger.warning("Lost the MQTT connection (%s); reconnecting", rc)
+            self._set_state('connecting', f"connection lost ({rc}), reconnecting")
+
+    def _on_message(self, client, userdata, msg):
+        if not self.duplicates.accept(msg):
+            return
+        if self.inbound is not None:
+            self.inbound.put(msg)
+            return
+        try:
+            self.handler(msg)
+        except Exception:
+            logger.exception("Handler failed for %s", msg.topic)
+
+    def _work_loop(self):
+        while True:
+            msg = self.inbound.get()
+            if msg is None:
+                return
+            try:
+                self.handler(msg)
+            except Exception:
+                logger.exception("Handler failed for %s", msg.topic)
@@ -0,0 +1,132 @@
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class WindowStats:
+    """min/max/mean of a numeric field over one drain interval"""
+
+    __slots__ = ('count', 'min', 'max', 'mean')
+
+    def __init__(self, count, minimum, maximum, mean):
+        self.count = count
+        self.min = minimum
+        self.max = maximum
+        self.mean = mean
+
+    def __repr__(self):
+        return f"WindowStats(count={self.count}, min={self.min}, max={self.max}, mean={self.mean:.1f})"
+
+
+class CoalescedTopic:
+    """Latest-value slot for a high-rate topic.
+
+    offer() runs on the MQTT thread and only stores the raw payload (plus a
+    cheap numeric scan when stats are enabled); the handler runs once per
+    drain with the newest payload.
+    """
+
+    def __init__(self, handler, stats_field=None):
+        self.handler = handler
+        self._pattern = None
+        if stats_field is not None:
+            # Pull the number straight out of the JSON bytes instead of json.loads
+            self._pattern = re.compile(rb'"' + stats_field.encode() + rb'"\s*:\s*(-?\d+(?:\.\d+)?)')
+        self._lock = threading.Lock()
+        self._latest = None
+        self._pending = False
+        self._reset_stats()
+        self.offered = 0
+        self.delivered = 0
+
+    def _reset_stats(self):
+        self._count = 0
+        self._min = None
+        self._max = None
+        self._sum = 0.0
+
+    def offer(self, payload):
+        match = self._pattern.search(payload) if self._pattern is not None else None
+        with self._lock:
+            self._latest = payload
+            self._pending = True
+            self.offered += 1
+            if match is not None:
+                value = float(match.group(1))
+                if self._count == 0:
+                    self._min = self._max = value
+                elif value < self._min:
+                    self._min = value
+                elif value > self._max:
+                    self._max = value
+                self._count += 1
+                self._sum += value
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return False
+            payload = self._latest
+            stats = None
+            if self._count:
+                stats = WindowStats(self._count, self._min, self._max, self._sum / self._count)
+            self._pending = False
+            self._reset_stats()
+        self.delivered += 1
+        self.handler(payload, stats)
+        return True
+
+
+class TopicDispatcher:
+    """Routes MQTT messages to handlers registered per topic.
+
+    Immediate handlers are called as handler(payload) on the MQTT thread.
+    Coalesced handlers are called as handler(payload, stats) from drain(),
+    usually once per UI tick, with only the newest payload.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+        self._coalesced = {}
+        self.received = 0
+        self.unhandled = 0
+
+    def register(self, topic, handler, coalesce=False, stats_field=None):
+        if coalesce:
+            self._coalesced[topic] = CoalescedTopic(handler, stats_field)
+        else:
+            self._handlers[topic] = handler
+
+    def dispatch(self, topic, payload):
+        """Handle one raw message; payload is the undecoded bytes"""
+        self.received += 1
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received: %s - %r", topic, payload)
+
+        slot = self._coalesced.get(topic)
+        if slot is not None:
+            slot.offer(payload)
+            return
+        handler = self._handlers.get(topic)
+        if handler is None:
+            self.unhandled += 1
+            return
+        try:
+            handler(payload)
+        except Exception:
+            logger.exception("Handler for %s failed", topic)
+
+    def drain(self):
+        """Deliver pending coalesced values; returns True if any handler ran"""
+        delivered = False
+        for topic, slot in self._coalesced.items():
+            try:
+                delivered = slot.flush() or delivered
+            except Exception:
+                logger.exception("Handler for %s failed", topic)
+        return delivered
+
+    def topics(self):
+        return list(self._handlers) + list(self._coalesced)
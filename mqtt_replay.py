@@ -0,0 +1,338 @@
+"""Record, replay and synthesize the intersection's MQTT topic stream.
+
+Recordings are a compact binary log of (timestamp, topic, payload, qos,
+retain), gzip-compressed when the file name ends in .gz. They can be
+replayed at the recorded pace, N times faster or as fast as possible,
+either to a real broker or into an in-process engine on a LocalBroker,
+so the dashboard runs without the ESP32s.
+
+    python mqtt_replay.py record --broker 172.20.10.4 --out session.tlsrec.gz [--seconds 600]
+    python mqtt_replay.py generate --intersections 200 --seconds 60 --out fleet.tlsrec.gz
+    python mqtt_replay.py replay session.tlsrec.gz --speed 4 [--broker HOST | --ui]
+    python mqtt_replay.py generate --intersections 200 --topic-format "site/{site}/{topic}" --out sites.tlsrec.gz
+    python mqtt_replay.py replay sites.tlsrec.gz --speed max --fleet-shards 4 [--site-id 7]
+"""
+import argparse
+import gzip
+import heapq
+import itertools
+import json
+import math
+import random
+import struct
+import threading
+import time
+
+MAGIC = b"TLSREC1\n"
+
+# Record headers: a topic definition the first time a topic is seen, then
+# messages that refer to the topic by id
+TOPIC_HEADER = struct.Struct('<cHH')  # b'T', topic id, name length
+MESSAGE_HEADER = struct.Struct('<cdHBI')  # b'M', timestamp, topic id, flags, payload length
+RETAIN_FLAG = 0x04  # flags bits 0-1 hold the QoS
+
+# Topics published by the two ESP32s
+RECORDED_TOPICS = ['traffic/#']
+
+
+def _open(path, mode):
+    return gzip.open(path, mode) if path.endswith('.gz') else open(path, mode)
+
+
+class StreamWriter:
+    """Appends messages to a recording; safe to call from the MQTT network thread"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = _open(path, 'wb')
+        self._file.write(MAGIC)
+        self._topics = {}
+        self._lock = threading.Lock()
+        self.messages = 0
+
+    def write(self, topic, payload, timestamp=None, qos=0, retain=False):
+        if timestamp is None:
+            timestamp = time.time()
+        if isinstance(payload, str):
+            payload = payload.encode()
+        with self._lock:
+            topic_id = self._topics.get(topic)
+            if topic_id is None:
+                topic_id = self._topics[topic] = len(self._topics)
+                name = topic.encode()
+                self._file.write(TOPIC_HEADER.pack(b'T', topic_id, len(name)) + name)
+            flags = (qos & 0x03) | (RETAIN_FLAG if retain else 0)
+            self._file.write(MESSAGE_HEADER.pack(b'M', timestamp, topic_id, flags, len(payload)) + payload)
+            self.messages += 1
+
+    def on_message(self, client, userdata, msg):
+        """paho on_message callback"""
+        self.write(msg.topic, msg.payload, qos=msg.qos, retain=msg.retain)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_stream(path):
+    """Yield (timestamp, topic, payload, qos, retain) from a recording"""
+    topics = {}
+    with _open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a topic stream recording")
+        while True:
+            kind = f.read(1)
+            if not kind:
+                return
+            if kind == b'T':
+                _, topic_id, length = TOPIC_HEADER.unpack(kind + f.read(TOPIC_HEADER.size - 1))
+                topics[topic_id] = f.read(length).decode()
+            elif kind == b'M':
+                _, timestamp, topic_id, flags, length = MESSAGE_HEADER.unpack(kind + f.read(MESSAGE_HEADER.size - 1))
+                yield timestamp, topics[topic_id], f.read(length), flags & 0x03, bool(flags & RETAIN_FLAG)
+            else:
+                raise ValueError(f"Corrupt recording {path}: unknown record {kind!r}")
+
+
+def write_stream(path, messages):
+    """Write (timestamp, topic, payload, qos, retain) tuples to a new recording"""
+    writer = StreamWriter(path)
+    try:
+        for timestamp, topic, payload, qos, retain in messages:
+            writer.write(topic, payload, timestamp, qos, retain)
+    finally:
+        writer.close()
+    return writer.messages
+
+
+def replay(messages, publish, speed=1.0, stop=None):
+    """Publish recorded messages through publish(topic, payload, qos, retain).
+
+    speed scales the recorded pace (2.0 = twice as fast); None or 0 replays
+    as fast as possible. Returns (messages published, worst lateness in s).
+    """
+    count = 0
+    late = 0.0
+    first = None
+    start = time.monotonic()
+    for timestamp, topic, payload, qos, retain in messages:
+        if stop is not None and stop.is_set():
+            break
+        if speed:
+            if first is None:
+                first = timestamp
+            delay = start + (timestamp - first) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                late = max(late, -delay)
+        publish(topic, payload, qos, retain)
+        count += 1
+    return count, late
+
+
+class SyntheticFleet:
+    """Generates the topic stream of many simulated intersections.
+
+    Each intersection follows the ESP firmware: phases advance on minGreen
+    + 2 s per detected vehicle (max 20 s) with 3 s yellows, density every
+    second, distance every `distance_interval`, retained crosswalk and
+    RED_VIOLATION messages. topic_format places an intersection's topics,
+    e.g. "{topic}" (all on the shared topics) or "site/{site}/{topic}".
+    """
+
+    PHASES = ("H_GREEN", "H_YELLOW", "V_GREEN", "V_YELLOW")
+
+    def __init__(self, intersections=1, seed=0, topic_format="{topic}", distance_interval=0.5,
+                 pedestrians_per_hour=30.0, violations_per_hour=6.0):
+        self.intersections = intersections
+        self.rng = random.Random(seed)
+        self.topic_format = topic_format
+        self.distance_interval = distance_interval
+        self.pedestrian_rate = pedestrians_per_hour / 3600.0
+        self.violation_rate = violations_per_hour / 3600.0
+
+    def _topic(self, site, topic):
+        return self.topic_format.format(site=site, topic=topic)
+
+    def _exp(self, rate):
+        return self.rng.expovariate(rate) if rate > 0 else math.inf
+
+    def stream(self, duration, start=None):
+        """Yield (timestamp, topic, payload, qos, retain) in time order for `duration` seconds"""
+        rng = self.rng
+        start = time.time() if start is None else start
+        seq = itertools.count()
+        events = []
+        sites = []
+        for site in range(self.intersections):
+            state = {'phase': 0, 'H': rng.randint(0, 2), 'V': rng.randint(0, 2), 'distance': 200}
+            sites.append(state)
+            offset = rng.random()  # Intersections do not tick in lockstep
+            for kind, at in (('phase', 0.0), ('density', offset), ('distance', offset * self.distance_interval),
+                             ('pedestrian', self._exp(self.pedestrian_rate)),
+                             ('violation', self._exp(self.violation_rate))):
+                heapq.heappush(events, (at, next(seq), kind, site))
+
+        while events:
+            at, _, kind, site = heapq.heappop(events)
+            if at > duration:
+                return
+            state = sites[site]
+            timestamp = start + at
+            if kind == 'phase':
+                phase = self.PHASES[state['phase']]
+                yield timestamp, self._topic(site, 'traffic/phase'), phase.encode(), 0, False
+                if phase.endswith('YELLOW'):
+                    length = 3.0
+                else:
+                    length = min(20.0, 5.0 + 2.0 * state[phase[0]])
+                state['phase'] = (state['phase'] + 1) % len(self.PHASES)
+                heapq.heappush(events, (at + length, next(seq), 'phase', site))
+            elif kind == 'density':
+                for approach in ('H', 'V'):
+                    state[approach] = min(2, max(0, state[approach] + rng.choice((-1, 0, 0, 1))))
+                payload = b'{"H":%d,"V":%d}' % (state['H'], state['V'])
+                yield timestamp, self._topic(site, 'traffic/density'), payload, 0, False
+                heapq.heappush(events, (at + 1.0, next(seq), 'density', site))
+            elif kind == 'distance':
+                state['distance'] = min(400, max(2, state['distance'] + rng.randint(-20, 20)))
+                yield timestamp, self._topic(site, 'traffic/distance'), b'{"distance":%d}' % state['distance'], 0, False
+                heapq.heappush(events, (at + self.distance_interval, next(seq), 'distance', site))
+            elif kind == 'pedestrian':
+                yield timestamp, self._topic(site, 'traffic/crosswalk'), b'PEDESTRIAN_WAITING', 0, True
+                heapq.heappush(events, (at + 10.0, next(seq), 'clear', site))
+                heapq.heappush(events, (at + 10.0 + self._exp(self.pedestrian_rate), next(seq), 'pedestrian', site))
+            elif kind == 'clear':
+                yield timestamp, self._topic(site, 'traffic/crosswalk'), b'CROSSWALK_CLEAR', 0, True
+            elif kind == 'violation':
+                # The ESP only reports violations while the horizontal approach is red
+                if self.PHASES[state['phase'] - 1].startswith('V'):
+                    yield timestamp, self._topic(site, 'traffic/violation'), b'RED_VIOLATION', 0, True
+                heapq.heappush(events, (at + self._exp(self.violation_rate), next(seq), 'violation', site))
+
+
+def record(broker, port, path, seconds=None):
+    """Record the live topic stream from a broker until Ctrl+C or `seconds`"""
+    import paho.mqtt.client as mqtt
+    writer = StreamWriter(path)
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    client.on_connect = lambda c, u, f, rc, p=None: c.subscribe([(t, 0) for t in RECORDED_TOPICS])
+    client.on_message = writer.on_message
+    client.connect(broker, port, 60)
+    client.loop_start()
+    print(f"Recording {', '.join(RECORDED_TOPICS)} from {broker}:{port} to {path}. Press Ctrl+C to stop.")
+    try:
+        time.sleep(seconds) if seconds else threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    client.loop_stop()
+    client.disconnect()
+    writer.close()
+    print(f"Recorded {writer.messages} messages")
+
+
+def parse_speed(value):
+    return None if value == 'max' else float(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record, replay and generate the traffic MQTT topic stream")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    rec = commands.add_parser('record', help="Record the live topic stream")
+    rec.add_argument('--broker', default='172.20.10.4')
+    rec.add_argument('--port', type=int, default=1883)
+    rec.add_argument('--out', required=True)
+    rec.add_argument('--seconds', type=float)
+
+    gen = commands.add_parser('generate', help="Write a synthetic recording")
+    gen.add_argument('--intersections', type=int, default=1)
+    gen.add_argument('--seconds', type=float, default=60.0)
+    gen.add_argument('--seed', type=int, default=0)
+    gen.add_argument('--topic-format', default="{topic}", help='e.g. "site/{site}/{topic}"')
+    gen.add_argument('--out', required=True)
+
+    rep = commands.add_parser('replay', help="Replay a recording to a broker or an in-process engine")
+    rep.add_argument('recording')
+    rep.add_argument('--speed', type=parse_speed, default=1.0, help="Pace multiplier, or 'max'")
+    rep.add_argument('--broker', help="Publish to this broker instead of an in-process engine")
+    rep.add_argument('--port', type=int, default=1883)
+    rep.add_argument('--ui', action='store_true', help="Attach the Tk dashboard to the in-process engine")
+    rep.add_argument('--site-id', help="Intersection the in-process engine is (for site/<id>/... recordings)")
+    rep.add_argument('--fleet-shards', type=int, help="Aggregate every site/<id>/... topic with this many shards")
+
+    args = parser.parse_args(argv)
+    if args.command == 'record':
+        record(args.broker, args.port, args.out, args.seconds)
+    elif args.command == 'generate':
+        fleet = SyntheticFleet(args.intersections, args.seed, args.topic_format)
+        count = write_stream(args.out, fleet.stream(args.seconds))
+        print(f"Wrote {count} messages to {args.out}")
+    elif args.broker:
+        import paho.mqtt.client as mqtt
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        client.connect(args.broker, args.port, 60)
+        client.loop_start()
+        count, late = replay(read_stream(args.recording), client.publish, args.speed)
+        client.loop_stop()
+        client.disconnect()
+        print(f"Replayed {count} messages (worst lateness {late * 1000:.1f} ms)")
+    else:
+        replay_local(args.recording, args.speed, args.ui, args.site_id, args.fleet_shards)
+
+
+def replay_local(path, speed, ui=False, site_id=None, fleet_shards=None):
+    """Run an engine on a LocalBroker (fake backend, no cameras) and replay into it.
+
+    Violations and telemetry go to a scratch directory, not the live ones.
+    """
+    import os
+    import tempfile
+
+    import traffic_core
+    from config import Config
+    from fleet import site_topic
+    from local_broker import LocalBroker
+    from violation_store import FakeBackend
+
+    broker = LocalBroker()
+    workdir = tempfile.mkdtemp(prefix="replay_")
+    config = Config(overrides={'camera_sources': [], 'violations_dir': os.path.join(workdir, "violations"),
+                               'telemetry_dir': os.path.join(workdir, "telemetry"),
+                               'site_id': site_id, 'fleet_shards': fleet_shards})
+    engine = traffic_core.TrafficEngine(FakeBackend(), config, mqtt_client=broker.client("dashboard"),
+                                        fleet_client=broker.client("fleet"))
+    player = broker.client("replay")
+    player.connect()
+    stop = threading.Event()
+
+    def play():
+        if not broker.wait_for_subscriber(site_topic(site_id, 'traffic/phase'), timeout=30.0):
+            print("Engine did not subscribe; nothing replayed")
+            return
+        count, late = replay(read_stream(path), player.publish, speed, stop)
+        print(f"Replayed {count} messages (worst lateness {late * 1000:.1f} ms)")
+
+    if ui:
+        import traffic_system_ui
+        threading.Thread(target=play, daemon=True, name="replay").start()
+        traffic_system_ui.run(engine)
+        stop.set()
+        return
+    engine.start()
+    try:
+        play()
+        time.sleep(0.5)  # Let the last messages drain
+    except KeyboardInterrupt:
+        stop.set()
+    print(json.dumps(engine.snapshot()))
+    if engine.fleet is not None:
+        engine.fleet.flush()
+        time.sleep(2 * config.fleet_report_interval)  # Wait for the shards' last reports
+        print(json.dumps(engine.fleet.totals()))
+    engine.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Discrete-event simulation of the intersection for benchmarking signal timing.
+
+Vehicles arrive per approach as Poisson processes, queue at the stop line
+and discharge at a saturation headway during green after a start-up lost
+time. Each approach has a pair of presence detectors like the IR sensors
+on the controller ESP: they see the first vehicles of the queue and
+vehicles just passing. Pedestrians arrive at the crosswalk, raise
+PEDESTRIAN_WAITING and cross at the start of the next vertical green.
+
+The signal is driven by a signal_timing.SignalTimer ticking at the same
+rate as the engine, so the strategies run exactly as they do live.
+"""
+import heapq
+import itertools
+import math
+import random
+from collections import deque
+
+from signal_timing import GREEN_APPROACH, Observation, SignalTimer
+
+# Seconds between vehicles leaving one approach at saturation (two lanes, 2 s per lane)
+SATURATION_HEADWAY = 1.0
+STARTUP_LOST_TIME = 2.0
+
+# Presence detectors per approach and how long a passing vehicle occupies one
+DETECTORS = 2
+DETECTOR_OCCUPANCY = 1.0
+
+# Engine tick (the telemetry_tick setting)
+TICK = 0.2
+
+
+class IntersectionSim:
+    """One intersection under a SignalTimer; arrival rates are vehicles (pedestrians) per hour"""
+
+    def __init__(self, timer, arrivals, pedestrians=0.0, seed=0, headway=SATURATION_HEADWAY,
+                 startup_lost=STARTUP_LOST_TIME, detectors=DETECTORS, tick=TICK):
+        self.timer = timer
+        self.arrivals = arrivals
+        self.pedestrians = pedestrians
+        self.headway = headway
+        self.startup_lost = startup_lost
+        self.detectors = detectors
+        self.tick = tick
+        self.rng = random.Random(seed)
+        self._events = []
+        self._seq = itertools.count()
+
+        self.now = 0.0
+        self.phase = None
+        self.queues = {a: deque() for a in arrivals}
+        self.passing = {a: deque() for a in arrivals}  # Recent departure times, for the detectors
+        self.next_free = {a: 0.0 for a in arrivals}
+        self.discharging = {a: False for a in arrivals}
+        self.green_id = {a: 0 for a in arrivals}
+        self.waiting_pedestrians = []
+
+        self.delays = []
+        self.pedestrian_waits = []
+        self.max_queue = {a: 0 for a in arrivals}
+        self.greens = 0
+
+    def _schedule(self, at, kind, approach=None, token=None):
+        heapq.heappush(self._events, (at, next(self._seq), kind, approach, token))
+
+    def _exp(self, per_hour):
+        return self.rng.expovariate(per_hour / 3600.0) if per_hour > 0 else math.inf
+
+    def observe(self):
+        counts = {}
+        for approach, passing in self.passing.items():
+            while passing and passing[0] < self.now - DETECTOR_OCCUPANCY:
+                passing.popleft()
+            counts[approach] = min(self.detectors, len(self.queues[approach]) + len(passing))
+        return Observation(counts, bool(self.waiting_pedestrians))
+
+    def set_phase(self, phase):
+        old = GREEN_APPROACH.get(self.phase)
+        if old is not None:
+            # Pending discharges of the old green are stale from here on
+            self.green_id[old] += 1
+            self.discharging[old] = False
+        pedestrians = bool(self.waiting_pedestrians)
+        obs = self.observe()
+        self.phase = phase
+        approach = GREEN_APPROACH.get(phase)
+        if approach is not None:
+            self.greens += 1
+            self.next_free[approach] = self.now + self.startup_lost
+            self._start_discharge(approach)
+        if phase == "V_GREEN":
+            self.pedestrian_waits.extend(self.now - t for t in self.waiting_pedestrians)
+            self.waiting_pedestrians = []
+        self.timer.on_phase(phase, self.now, pedestrians, obs)
+
+    def _start_discharge(self, approach):
+        if self.queues[approach] and not self.discharging[approach]:
+            self.discharging[approach] = True
+            self._schedule(max(self.now, self.next_free[approach]), 'discharge', approach, self.green_id[approach])
+
+    def _depart(self, approach, arrived):
+        self.delays.append(self.now - arrived)
+        self.passing[approach].append(self.now)
+        self.next_free[approach] = self.now + self.headway
+
+    def run(self, duration, phase="H_GREEN"):
+        """Simulate `duration` seconds and return the results of summary()"""
+        for approach, rate in self.arrivals.items():
+            self._schedule(self._exp(rate), 'arrival', approach)
+        self._schedule(self._exp(self.pedestrians), 'pedestrian')
+        self._schedule(self.tick, 'tick')
+        self.set_phase(phase)
+
+        while self._events:
+            at, _, kind, approach, token = heapq.heappop(self._events)
+            if at > duration:
+                break
+            self.now = at
+            if kind == 'tick':
+                command = self.timer.step(self.now, self.observe())
+                if command is not None and command != self.phase:
+                    self.set_phase(command)
+                self._schedule(self.now + self.tick, 'tick')
+            elif kind == 'arrival':
+                self._schedule(self.now + self._exp(self.arrivals[approach]), 'arrival', approach)
+                queue = self.queues[approach]
+                if (GREEN_APPROACH.get(self.phase) == approach and not queue
+                        and self.now >= self.next_free[approach]):
+                    self._depart(approach, self.now)  # Rolls through on green
+                    continue
+                queue.append(self.now)
+                self.max_queue[approach] = max(self.max_queue[approach], len(queue))
+                if GREEN_APPROACH.get(self.phase) == approach:
+                    self._start_discharge(approach)
+            elif kind == 'discharge':
+                if token != self.green_id[approach]:
+                    continue
+                queue = self.queues[approach]
+                if queue:
+                    self._depart(approach, queue.popleft())
+                if queue:
+                    self._schedule(self.next_free[approach], 'discharge', approach, token)
+                else:
+                    self.discharging[approach] = False
+            elif kind == 'pedestrian':
+                self._schedule(self.now + self._exp(self.pedestrians), 'pedestrian')
+                self.waiting_pedestrians.append(self.now)
+
+        self.now = duration
+        return self.summary()
+
+    def summary(self):
+        """Throughput and delay; vehicles still queued count with the delay they have so far"""
+        queued = [self.now - t for queue in self.queues.values() for t in queue]
+        delays = sorted(self.delays + queued)
+        hours = self.now / 3600.0
+        return {
+            'served': len(self.delays),
+            'throughput': len(self.delays) / hours,
+            'mean_delay': sum(delays) / len(delays) if delays else 0.0,
+            'p95_delay': delays[int(0.95 * (len(delays) - 1))] if delays else 0.0,
+            'left_queued': len(queued),
+            'max_queue': max(self.max_queue.values()),
+            'pedestrian_wait': (sum(self.pedestrian_waits) / len(self.pedestrian_waits)
+                                if self.pedestrian_waits else 0.0),
+            'cycles': self.greens / 2,
+        }
+
+
+def simulate(strategy, arrivals, duration=3600.0, pedestrians=0.0, seed=0, **timer_options):
+    """Run one strategy instance on one demand scenario"""
+    timer = SignalTimer(strategy, **timer_options)
+    return IntersectionSim(timer, arrivals, pedestrians, seed=seed).run(duration)
@@ -0,0 +1,211 @@
+"""Host-side signal timing for the intersection controller.
+
+A SignalTimer decides when each green ends, within min/max green and
+pedestrian constraints, using a pluggable timing strategy. The same timer
+drives the live controller (through traffic/override) and the offline
+simulator in signal_sim.py.
+
+Live, the ESP keeps sequencing phases on its own. The host only re-asserts
+the current green before the ESP's own timer would end it (an override
+restarts the ESP's phaseStart) and sends the yellow when the strategy says
+the green is done; yellows still run on the ESP.
+"""
+import math
+
+# Same limits as the controller ESP
+MIN_GREEN = 5.0
+MAX_GREEN = 20.0
+YELLOW = 3.0
+
+# A vertical green that starts with a pedestrian waiting lasts at least this
+# long; the crosswalk ESP holds the walk for 10 s
+PEDESTRIAN_GREEN = 10.0
+
+# Re-assert a held green this often; must stay below the ESP's minGreen
+HOLD_INTERVAL = 4.0
+
+PHASE_ORDER = ("H_GREEN", "H_YELLOW", "V_GREEN", "V_YELLOW")
+GREEN_APPROACH = {"H_GREEN": 'H', "V_GREEN": 'V'}
+OPPOSING = {'H': 'V', 'V': 'H'}
+
+
+def next_phase(phase):
+    return PHASE_ORDER[(PHASE_ORDER.index(phase) + 1) % len(PHASE_ORDER)]
+
+
+class Observation:
+    """What the timer sees on each tick: vehicles at the detectors per approach and the crosswalk"""
+
+    __slots__ = ('counts', 'pedestrian_waiting')
+
+    def __init__(self, counts, pedestrian_waiting=False):
+        self.counts = counts
+        self.pedestrian_waiting = pedestrian_waiting
+
+    def __repr__(self):
+        return f"Observation(counts={self.counts}, pedestrian_waiting={self.pedestrian_waiting})"
+
+
+class EspTiming:
+    """The ESP's own rule: minGreen + 2 s per vehicle at the detectors, re-evaluated continuously"""
+
+    name = 'esp'
+
+    def __init__(self, per_vehicle=2.0):
+        self.per_vehicle = per_vehicle
+
+    def observe(self, now, obs):
+        pass
+
+    def green_started(self, approach, now, obs, min_green, max_green):
+        pass
+
+    def green_done(self, approach, elapsed, now, obs, min_green, max_green):
+        return elapsed >= min(max_green, min_green + self.per_vehicle * obs.counts[approach])
+
+
+class ActuatedTiming:
+    """Queue-based actuation: extend the green while vehicles keep arriving at the detectors.
+
+    After min green, the green gaps out once its detectors have been clear
+    for `gap` seconds and the opposing approach has a vehicle waiting. With
+    nobody waiting on the other side the green rests until max green.
+    """
+
+    name = 'actuated'
+
+    def __init__(self, gap=2.0):
+        self.gap = gap
+        self._last_occupied = {'H': -math.inf, 'V': -math.inf}
+
+    def observe(self, now, obs):
+        for approach, count in obs.counts.items():
+            if count > 0:
+                self._last_occupied[approach] = now
+
+    def green_started(self, approach, now, obs, min_green, max_green):
+        pass
+
+    def green_done(self, approach, elapsed, now, obs, min_green, max_green):
+        if obs.counts[OPPOSING[approach]] == 0:
+            return False
+        return now - self._last_occupied[approach] >= self.gap
+
+
+class WebsterTiming:
+    """Webster-style cycle and green split from smoothed detector occupancy.
+
+    The flow ratio of each approach is estimated as its mean occupancy
+    (vehicles at the detectors / detectors) scaled by `occupancy_to_flow`.
+    Each green gets the share (C - L) * y_i / Y of Webster's optimal cycle
+    C = (1.5 L + 5) / (1 - Y), planned when the green starts.
+    """
+
+    name = 'webster'
+
+    def __init__(self, detectors=2, occupancy_to_flow=0.5, smoothing=0.01, lost_time=2.0, yellow=YELLOW):
+        self.detectors = detectors
+        self.occupancy_to_flow = occupancy_to_flow
+        self.smoothing = smoothing
+        self.lost_time = lost_time + yellow  # Per phase
+        self.occupancy = {'H': 0.0, 'V': 0.0}
+        self._planned = None
+
+    def observe(self, now, obs):
+        for approach, count in obs.counts.items():
+            occupied = min(count, self.detectors) / self.detectors
+            self.occupancy[approach] += self.smoothing * (occupied - self.occupancy[approach])
+
+    def split(self, min_green, max_green):
+        """Planned green time per approach for the current demand"""
+        ratios = {a: max(0.01, self.occupancy_to_flow * occ) for a, occ in self.occupancy.items()}
+        total = sum(ratios.values())
+        lost = self.lost_time * len(ratios)
+        cycle = (1.5 * lost + 5) / (1 - min(0.9, total))  # Y is capped so C stays finite
+        return {a: min(max_green, max(min_green, (cycle - lost) * y / total)) for a, y in ratios.items()}
+
+    def green_started(self, approach, now, obs, min_green, max_green):
+        self._planned = self.split(min_green, max_green)[approach]
+
+    def green_done(self, approach, elapsed, now, obs, min_green, max_green):
+        return elapsed >= self._planned
+
+
+STRATEGIES = {
+    'esp': EspTiming,
+    'actuated': ActuatedTiming,
+    'webster': WebsterTiming,
+}
+
+
+class SignalTimer:
+    """Phase timing around a strategy, with min/max green and pedestrian constraints.
+
+    on_phase() reports the phase the controller is actually in; step() is
+    called on every tick and returns the phase to command, or None. With
+    hold_interval set (live control), a green the strategy wants to keep is
+    re-asserted that often. With controls_yellow off, yellows are left to
+    the controller.
+    """
+
+    def __init__(self, strategy, min_green=MIN_GREEN, max_green=MAX_GREEN, yellow=YELLOW,
+                 pedestrian_green=PEDESTRIAN_GREEN, hold_interval=None, controls_yellow=True):
+        self.strategy = strategy
+        self.min_green = min_green
+        self.max_green = max_green
+        self.yellow = yellow
+        self.pedestrian_green = pedestrian_green
+        self.hold_interval = hold_interval
+        self.controls_yellow = controls_yellow
+        self.phase = None
+        self.phase_start = 0.0
+        self.walk = False  # Pedestrians cross during the current vertical green
+        self._last_command = 0.0
+        self._requested = None  # Phase change sent but not yet reported back
+
+    def on_phase(self, phase, now, pedestrian_waiting=False, obs=None):
+        """Record a phase change; repeated reports of the same phase (after a hold) are ignored"""
+        if phase == self.phase or phase not in PHASE_ORDER:
+            return
+        self.phase = phase
+        self.phase_start = self._last_command = now
+        self._requested = None
+        self.walk = phase == "V_GREEN" and pedestrian_waiting
+        approach = GREEN_APPROACH.get(phase)
+        if approach is not None:
+            self.strategy.green_started(approach, now, obs or Observation({'H': 0, 'V': 0}),
+                                        self.min_green, self.max_green)
+
+    def green_done(self, approach, elapsed, now, obs):
+        if elapsed < self.min_green:
+            return False
+        if elapsed >= self.max_green:
+            return True
+        if approach == 'V' and self.walk and elapsed < self.pedestrian_green:
+            return False
+        if approach == 'H' and obs.pedestrian_waiting:
+            # Same as the ESP: a waiting pedestrian cuts the horizontal green to its minimum
+            return True
+        return self.strategy.green_done(approach, elapsed, now, obs, self.min_green, self.max_green)
+
+    def step(self, now, obs):
+        """Phase to command at time `now`, or None to leave the controller alone"""
+        self.strategy.observe(now, obs)
+        if self.phase is None:
+            return None
+        elapsed = now - self.phase_start
+        approach = GREEN_APPROACH.get(self.phase)
+        if approach is None:
+            if self.controls_yellow and elapsed >= self.yellow:
+                return next_phase(self.phase)
+            return None
+        if self.green_done(approach, elapsed, now, obs):
+            if self._requested is not None and now - self._last_command < (self.hold_interval or 0.0):
+                return None  # Already asked; give the controller time to report the change
+            self._requested = next_phase(self.phase)
+            self._last_command = now
+            return self._requested
+        if self.hold_interval is not None and now - self._last_command >= self.hold_interval:
+            self._last_command = now
+            return self.phase
+        return None
@@ -0,0 +1,360 @@
+"""Embedded time-series store for intersection telemetry.
+
+Samples are kept per series in a preallocated NumPy chunk and appended to
+flat binary files when the chunk fills or on flush(). Each flush also rolls
+the samples up into 1 s, 1 min and 1 h buckets (count/sum/min/max/last), so
+long ranges are answered from small rollup files. The incomplete bucket of
+each level is saved to open.bin on every flush and picked up again when the
+store is reopened, so a restart does not lose the current minute or hour. Files are read back with
+np.memmap and binary search on the (sorted) timestamp column.
+"""
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+RAW_DTYPE = np.dtype([('t', '<f8'), ('v', '<f4')])
+ROLLUP_DTYPE = np.dtype([('t', '<f8'), ('count', '<u4'), ('sum', '<f8'),
+                         ('min', '<f4'), ('max', '<f4'), ('last', '<f4')])
+
+# Rollup bucket widths in seconds, finest first
+ROLLUP_LEVELS = (1, 60, 3600)
+
+# Seconds of history kept per resolution ('raw' or bucket width); None keeps everything
+RETENTION = {'raw': 2 * 86400, 1: 14 * 86400, 60: 400 * 86400, 3600: None}
+
+# Longest range answered from each resolution when resolution='auto'
+AUTO_RESOLUTION = (('raw', 10 * 60), (1, 6 * 3600), (60, 14 * 86400), (3600, None))
+
+# Categorical topics are stored as codes
+PHASE_CODES = {"H_GREEN": 0, "H_YELLOW": 1, "V_GREEN": 2, "V_YELLOW": 3}
+CROSSWALK_CODES = {"CROSSWALK_CLEAR": 0, "PEDESTRIAN_WAITING": 1}
+
+
+def rollup(t, count, total, minimum, maximum, last, width):
+    """Aggregate sorted samples (or finer buckets) into buckets of `width` seconds"""
+    buckets = np.floor(t / width) * width
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(t)] - 1
+    out = np.empty(len(starts), dtype=ROLLUP_DTYPE)
+    out['t'] = buckets[starts]
+    out['count'] = np.add.reduceat(count, starts)
+    out['sum'] = np.add.reduceat(total, starts)
+    out['min'] = np.minimum.reduceat(minimum, starts)
+    out['max'] = np.maximum.reduceat(maximum, starts)
+    out['last'] = last[ends]
+    return out
+
+
+def _merge_bucket(bucket, into):
+    """Fold a partial bucket into the first bucket of `into` (same start time)"""
+    first = into[0]
+    first['count'] += bucket['count']
+    first['sum'] += bucket['sum']
+    first['min'] = min(first['min'], bucket['min'])
+    first['max'] = max(first['max'], bucket['max'])
+
+
+def _bisect(stamps, x, right):
+    """Binary search on a strided memmap column without copying it (np.searchsorted would)"""
+    lo, hi = 0, len(stamps)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if stamps[mid] < x or (right and stamps[mid] == x):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _read_range(path, dtype, start, end):
+    """Records of a sorted binary file with start <= t <= end"""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return np.empty(0, dtype=dtype)
+    n = size // dtype.itemsize
+    if n == 0:
+        return np.empty(0, dtype=dtype)
+    mm = np.memmap(path, dtype=dtype, mode='r', shape=(n,))
+    stamps = mm['t']
+    i0 = _bisect(stamps, start, right=False)
+    i1 = _bisect(stamps, end, right=True)
+    return np.array(mm[i0:i1])
+
+
+class _Series:
+    """Files and in-memory state of one series; callers hold the store lock"""
+
+    def __init__(self, directory, chunk_size):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.chunk = np.empty(chunk_size, dtype=RAW_DTYPE)
+        self.n = 0
+        self.open = {level: None for level in ROLLUP_LEVELS}  # Incomplete bucket per level
+        self._load_open()
+
+    def _load_open(self):
+        """Incomplete buckets saved by the last flush, one record per level (count 0 for none)"""
+        try:
+            saved = np.fromfile(self.path('open'), dtype=ROLLUP_DTYPE)
+        except OSError:
+            return
+        if len(saved) != len(ROLLUP_LEVELS):
+            return
+        for level, bucket in zip(ROLLUP_LEVELS, saved):
+            if bucket['count']:
+                self.open[level] = np.array([bucket], dtype=ROLLUP_DTYPE)
+
+    def _save_open(self):
+        saved = np.zeros(len(ROLLUP_LEVELS), dtype=ROLLUP_DTYPE)
+        for i, level in enumerate(ROLLUP_LEVELS):
+            if self.open[level] is not None:
+                saved[i] = self.open[level][0]
+        path = self.path('open')
+        saved.tofile(path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def path(self, resolution):
+        if resolution in ('raw', 'open'):
+            return os.path.join(self.directory, f"{resolution}.bin")
+        return os.path.join(self.directory, f"rollup_{resolution}s.bin")
+
+    def append(self, t, v):
+        self.chunk[self.n] = (t, v)
+        self.n += 1
+        return self.n == len(self.chunk)
+
+    def flush(self):
+        if self.n == 0:
+            return
+        data = self.chunk[:self.n].copy()
+        self.n = 0
+        data.sort(order='t', kind='stable')
+        with open(self.path('raw'), 'ab') as f:
+            data.tofile(f)
+
+        values = data['v']
+        level_input = (data['t'], np.ones(len(data), dtype=np.uint32), values.astype(np.float64),
+                       values, values, values)
+        for level in ROLLUP_LEVELS:
+            buckets = rollup(*level_input, level)
+            pending = self.open[level]
+            if pending is not None:
+                if pending['t'][0] == buckets['t'][0]:
+                    _merge_bucket(pending[0], buckets)
+                else:
+                    buckets = np.concatenate([pending, buckets])
+            # The newest bucket may still grow; only complete ones go to disk
+            complete, self.open[level] = buckets[:-1], buckets[-1:]
+            if len(complete) == 0:
+                break
+            with open(self.path(level), 'ab') as f:
+                complete.tofile(f)
+            level_input = (complete['t'], complete['count'], complete['sum'],
+                           complete['min'], complete['max'], complete['last'])
+        self._save_open()
+
+    def unflushed(self, resolution):
+        """Data not yet in the resolution's file: for a rollup level, its open bucket
+        merged with the unflushed samples and the finer levels' open buckets"""
+        if resolution == 'raw':
+            return self.chunk[:self.n].copy()
+        samples = self.chunk[:self.n]
+        values = samples['v']
+        parts = [(samples['t'], np.ones(self.n, dtype=np.uint32), values.astype(np.float64), values, values, values)]
+        for level in ROLLUP_LEVELS:
+            pending = self.open[level]
+            if level > resolution:
+                break
+            if pending is not None:
+                parts.append((pending['t'], pending['count'], pending['sum'],
+                              pending['min'], pending['max'], pending['last']))
+        columns = [np.concatenate(column) for column in zip(*parts)]
+        if len(columns[0]) == 0:
+            return np.empty(0, dtype=ROLLUP_DTYPE)
+        order = np.argsort(columns[0], kind='stable')
+        return rollup(*(column[order] for column in columns), resolution)
+
+    def compact(self, now):
+        """Drop records older than the retention of each resolution"""
+        for resolution in ('raw',) + ROLLUP_LEVELS:
+            keep = RETENTION.get(resolution)
+            path = self.path(resolution)
+            if keep is None or not os.path.exists(path):
+                continue
+            dtype = RAW_DTYPE if resolution == 'raw' else ROLLUP_DTYPE
+            data = _read_range(path, dtype, now - keep, np.inf)
+            if len(data) * dtype.itemsize == os.path.getsize(path):
+                continue
+            tmp = path + ".tmp"
+            data.tofile(tmp)
+            os.replace(tmp, path)
+
+
+class TelemetryStore:
+    """Columnar time-series store with 1 s / 1 min / 1 h rollups"""
+
+    def __init__(self, root, chunk_size=4096):
+        self.root = root
+        self.chunk_size = chunk_size
+        self._series = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        # Reopen series written by a previous run
+        for name in sorted(os.listdir(root)):
+            if os.path.isdir(os.path.join(root, name)):
+                self._series[name] = _Series(os.path.join(root, name), chunk_size)
+
+    def _get(self, name):
+        series = self._series.get(name)
+        if series is None:
+            if not re.fullmatch(r'[A-Za-z0-9_.-]+', name):
+                raise ValueError(f"Invalid series name {name!r}")
+            series = self._series[name] = _Series(os.path.join(self.root, name), self.chunk_size)
+        return series
+
+    def record(self, name, value, timestamp=None):
+        """Append one sample; writes to disk only when the series' chunk is full"""
+        if timestamp is None:
+            timestamp = time.time()
+        with self._lock:
+            series = self._get(name)
+            if series.append(timestamp, value):
+                series.flush()
+
+    def flush(self):
+        with self._lock:
+            for series in self._series.values():
+                series.flush()
+
+    def compact(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            for series in self._series.values():
+                series.compact(now)
+
+    def series(self):
+        return sorted(self._series)
+
+    @staticmethod
+    def pick_resolution(start, end):
+        span = end - start
+        for resolution, longest in AUTO_RESOLUTION:
+            if longest is None or span <= longest:
+                return resolution
+
+    def query(self, name, start, end, resolution='auto'):
+        """Samples or buckets of a series in [start, end].
+
+        resolution is 'raw', one of ROLLUP_LEVELS, or 'auto' to pick one
+        from the span. Returns a dict of equal-length NumPy arrays:
+        t, count, mean, min, max, last.
+        """
+        if resolution == 'auto':
+            resolution = self.pick_resolution(start, end)
+        dtype = RAW_DTYPE if resolution == 'raw' else ROLLUP_DTYPE
+        if resolution != 'raw':
+            # Include the bucket that start falls in, not just those beginning after it
+            start = np.floor(start / resolution) * resolution
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                data = np.empty(0, dtype=dtype)
+            else:
+                stored = _read_range(series.path(resolution), dtype, start, end)
+                recent = series.unflushed(resolution)
+                recent = recent[(recent['t'] >= start) & (recent['t'] <= end)]
+                data = np.concatenate([stored, recent]) if len(recent) else stored
+
+        if resolution == 'raw':
+            values = data['v']
+            return {'t': data['t'], 'count': np.ones(len(data), dtype=np.uint32),
+                    'mean': values, 'min': values, 'max': values, 'last': values}
+        counts = data['count']
+        return {'t': data['t'], 'count': counts,
+                'mean': (data['sum'] / np.maximum(counts, 1)).astype(np.float32),
+                'min': data['min'], 'max': data['max'], 'last': data['last']}
+
+    def aggregate(self, name, start, end, resolution='auto'):
+        """count/min/max/mean/last of a series over [start, end]"""
+        data = self.query(name, start, end, resolution)
+        count = int(data['count'].sum())
+        if count == 0:
+            return {'count': 0, 'min': None, 'max': None, 'mean': None, 'last': None}
+        return {
+            'count': count,
+            'min': float(data['min'].min()),
+            'max': float(data['max'].max()),
+            'mean': float((data['mean'] * data['count']).sum() / count),
+            'last': float(data['last'][-1]),
+        }
+
+
+class TelemetryRecorder:
+    """Feeds raw MQTT telemetry into a TelemetryStore.
+
+    Numbers are pulled from the JSON payloads with regexes so recording does
+    not undo the dispatcher's savings from not parsing coalesced topics.
+    A background thread flushes and compacts the store.
+    """
+
+    _NUMBER = rb'"%s"\s*:\s*(-?\d+(?:\.\d+)?)'
+
+    def __init__(self, store, flush_interval=5.0, compact_interval=3600.0):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self._fields = {
+            'traffic/density': [('h_density', re.compile(self._NUMBER % b'H')),
+                                ('v_density', re.compile(self._NUMBER % b'V'))],
+            'traffic/distance': [('distance', re.compile(self._NUMBER % b'distance'))],
+        }
+        self._codes = {
+            'traffic/phase': ('phase', PHASE_CODES),
+            'traffic/crosswalk': ('crosswalk', CROSSWALK_CODES),
+        }
+        self._stop = threading.Event()
+        self._thread = None
+
+    def on_message(self, topic, payload, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        fields = self._fields.get(topic)
+        if fields is not None:
+            for name, pattern in fields:
+                match = pattern.search(payload)
+                if match:
+                    self.store.record(name, float(match.group(1)), timestamp)
+            return
+        coded = self._codes.get(topic)
+        if coded is not None:
+            name, codes = coded
+            code = codes.get(payload.decode(errors='replace'))
+            if code is not None:
+                self.store.record(name, code, timestamp)
+        elif topic == 'traffic/violation' and payload == b'RED_VIOLATION':
+            self.store.record('violations', 1, timestamp)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True, name="telemetry-flush")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.5)
+        self.store.flush()
+
+    def _flush_loop(self):
+        next_compact = time.monotonic()
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.store.flush()
+                if time.monotonic() >= next_compact:
+                    self.store.compact()
+                    next_compact = time.monotonic() + self.compact_interval
+            except Exception as e:
+                print(f"Telemetry flush failed: {str(e)}")
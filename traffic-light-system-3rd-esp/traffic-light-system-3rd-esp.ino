@@ -237,7 +237,7 @@ void reconnect() {
       Serial.println("Connected");
       
       // Subscribe to relevant topics
-      client.subscribe(topicOverride);
+      client.subscribe(topicOverride, 1);  // QoS 1: the dashboard publishes overrides at QoS 1
       client.subscribe(topicCrosswalk);
       
       Serial.println("MQTT → Subscribed to topics");
@@ -0,0 +1,820 @@
+"""Headless monitoring engine for the smart traffic light system.
+
+Owns MQTT ingest, camera capture, violation handling and persistence, and
+runs without tkinter. Importing this module does not touch the network or
+Firebase; everything is started by TrafficEngine.start().
+
+    python traffic_core.py [--config FILE] [--site NAME] [--broker HOST] [--backend fake]
+                           [--camera cam0=0] [--ui]
+
+Settings come from config.Config (defaults, config file, site profile,
+TRAFFIC_* environment variables, then these options).
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+
+import paho.mqtt.client as mqtt
+
+from capture_manager import CaptureManager, parse_source
+from clip_writer import ClipWriter
+from config import Config, ConfigError, ConfigWatcher, default_path
+from density_estimator import DensityEstimator, create_pool
+from fleet import FLEET_SUBSCRIPTION, FleetIngest, IntersectionState, site_topic
+from metrics import PROFILER, REGISTRY, MetricsServer
+from mqtt_connection import MqttConnection
+from mqtt_dispatch import TopicDispatcher
+from signal_timing import HOLD_INTERVAL, STRATEGIES, Observation, SignalTimer
+from telemetry_store import TelemetryRecorder, TelemetryStore
+from traffic_rules import RuleEngine, default_signals, load_plugins
+from violation_index import ViolationIndex, ViolationSync
+from violation_storage import STORAGE_BYTES, RetentionPolicy, StorageManager
+from violation_store import FakeBackend, FirestoreBackend, ViolationPersister
+from violation_verify import RED_PHASES, StopLineVerifier
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_SECONDS = REGISTRY.histogram('traffic_mqtt_message_seconds', "Time to handle one MQTT message",
+                                     labels=('topic',))
+CAPTURE_SECONDS = REGISTRY.histogram('traffic_violation_capture_seconds',
+                                     "Time to collect, verify and queue a violation burst", labels=('camera',))
+QUEUE_DEPTH = REGISTRY.gauge('traffic_queue_depth', "Items waiting in an engine queue", labels=('queue',))
+CAMERA_BUFFERED = REGISTRY.gauge('traffic_camera_buffered_frames', "Frames in a camera's ring buffer",
+                                 labels=('camera',))
+
+# Dashboard wording of the crosswalk payloads, for other sites' fleet state
+CROSSWALK_STATUS = {'PEDESTRIAN_WAITING': "Pedestrian Waiting", 'CROSSWALK_CLEAR': "Clear"}
+
+# The controller counts vehicles with two IR detectors per approach
+SENSOR_DENSITY_MAX = 2
+# A camera estimate older than this many density_intervals is ignored (stalled camera or estimator)
+CAMERA_DENSITY_MAX_AGE = 4
+
+
+def init_firebase(credentials_path):
+    """Connect to Firebase and return a Firestore client"""
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    cred = credentials.Certificate(credentials_path)
+    firebase_admin.initialize_app(cred)
+    return firestore.client()
+
+
+class TrafficEngine:
+    """MQTT ingest, camera capture and violation pipeline for one intersection.
+
+    With site_id set, the intersection's topics are site/<site_id>/traffic/...
+    on the broker; handlers, rules and the QoS table still use the plain
+    traffic/... names. With fleet_shards set, a second connection
+    (fleet_client) subscribes to every site's messages and feeds them to
+    self.fleet, the aggregated state of all intersections.
+
+    Front ends subscribe with add_listener(callback); callbacks receive an
+    event name ('state', 'violation', 'synced', 'rule' or 'config') and run
+    on engine threads.
+    Settings are read from self.config when used, so hot-reloaded values
+    apply without a restart; apply_config() handles the ones that need more.
+    """
+
+    def __init__(self, backend, config=None, mqtt_client=None, fleet_client=None):
+        self.backend = backend
+        self.config = config if config is not None else Config()
+        config = self.config
+        self.broker = config.mqtt_broker
+        self.port = config.mqtt_port
+        self.violations_dir = config.violations_dir
+        self.telemetry_dir = config.telemetry_dir if config.record_telemetry else None
+        self.mqtt_client = mqtt_client
+        self.fleet_client = fleet_client
+        self.site_id = config.site_id
+        self.topic_prefix = site_topic(self.site_id, "")
+        self.connection = None
+        self.fleet_connection = None
+        self.broker_status = "Disconnected"
+        self.metrics_server = None
+        self.config_watcher = None
+        self.listeners = []
+
+        # Variables for storing data
+        self.traffic_phase = "Unknown"
+        self.h_density = 0
+        self.v_density = 0
+        self.sensor_density = {'H': 0, 'V': 0}
+        self.camera_density = {}  # Camera name -> (monotonic time, latest {'H': .., 'V': ..} estimate)
+        self.last_distance = 0
+        self.crosswalk_status = "Clear"
+
+        # Per-topic handlers; distance and density only keep their latest value per tick
+        self.dispatcher = TopicDispatcher()
+        self.dispatcher.register('traffic/phase', self.on_phase)
+        for topic, camera_names in config.violation_cameras.items():
+            self.dispatcher.register(topic, lambda payload, names=camera_names: self.on_violation(payload, names))
+        self.dispatcher.register('traffic/crosswalk', self.on_crosswalk)
+        self.dispatcher.register('traffic/density', self.on_density, coalesce=True)
+        self.dispatcher.register('traffic/distance', self.on_distance, coalesce=True)
+
+        # Derived events (white line, pedestrian wait, ...) see every message, not just the coalesced ones
+        load_plugins(config.rule_plugins)
+        self.rules = RuleEngine(config.rules, default_signals(config.violation_cameras))
+
+        # Camera sources run on a shared capture worker pool; each keeps its
+        # own ring buffer for violation capture
+        self.capture = CaptureManager(config.capture_workers)
+
+        # Stop-line verifiers per camera (only used when verify_violations is on)
+        self.verifiers = {}
+        if config.verify_violations:
+            for name, zone in config.stop_line_zones.items():
+                self.verifiers[name] = StopLineVerifier(budget_ms=config.verify_budget_ms, **zone)
+
+        # Adaptive green times; the ESP still runs the yellows and takes over if the host goes away
+        self.signal_timer = None
+        if config.signal_timing != 'esp':
+            self.signal_timer = SignalTimer(STRATEGIES[config.signal_timing](), hold_interval=HOLD_INTERVAL,
+                                            controls_yellow=False)
+        self._timing_lock = threading.Lock()
+
+        # Last file name stem per camera, to keep names unique
+        self._last_names = {}
+        self._names_lock = threading.Lock()
+
+        self.persister = None
+        self.storage = None
+        self.clips = None
+        self.index = None
+        self.violation_sync = None
+        self.telemetry = None
+        self.recorder = None
+        self.density_pool = None
+        self.density_estimators = []
+        self.fleet = None
+        self._stop = threading.Event()
+        self._ticker = None
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def _notify(self, event, data=None):
+        for callback in list(self.listeners):
+            try:
+                callback(event, data)
+            except Exception:
+                logger.exception("Listener failed for %s", event)
+
+    def start(self, connect=True):
+        """Start capture, persistence and (optionally) the MQTT connection"""
+        config = self.config
+        os.makedirs(self.violations_dir, exist_ok=True)
+
+        # Background JPEG encoding and batched uploads
+        self.persister = ViolationPersister(self.backend, os.path.join(self.violations_dir, "spool.db"))
+
+        # Upload state, dedupe, recompression and retention of the evidence files
+        self.storage = StorageManager(self.violations_dir, os.path.join(self.violations_dir, "storage.db"),
+                                      self.retention_policy(), interval=config.storage_interval)
+        self.persister.on_committed = self.storage.mark_uploaded
+        self.storage.start()
+        if config.clip_codec:
+            self.clips = ClipWriter(config.clip_codec, scale=config.clip_scale, queue_size=config.clip_queue_size)
+
+        # Every violation, local or from other hosts, is browsed through the index
+        self.index = ViolationIndex(os.path.join(self.violations_dir, "index.db"))
+        self.violation_sync = ViolationSync(self.index, self.backend, interval=config.violation_sync_interval)
+        self.violation_sync.on_synced = lambda count: self._notify('synced', count)
+        self.violation_sync.start()
+
+        # Queue depths are read only when metrics are rendered
+        QUEUE_DEPTH.set_function(self.persister.queue_depth, 'violation_persist')
+        QUEUE_DEPTH.set_function(lambda: len(self.persister.spool), 'violation_spool')
+        if self.clips is not None:
+            QUEUE_DEPTH.set_function(self.clips.queue_depth, 'violation_clips')
+        for upload in ('pending', 'uploaded', 'unknown'):
+            STORAGE_BYTES.set_function(lambda upload=upload: self.storage.usage().get(upload, 0), upload)
+        if config.metrics_port is not None:
+            self.start_metrics_server(config.metrics_port)
+
+        # History of every telemetry message, queried through self.telemetry
+        if self.telemetry_dir:
+            self.telemetry = TelemetryStore(self.telemetry_dir)
+            self.recorder = TelemetryRecorder(self.telemetry)
+            self.recorder.start()
+
+        # Setup cameras
+        for camera in config.camera_sources:
+            self.add_camera(**camera)
+        self.capture.start()
+
+        # Camera density estimators share one process pool
+        if config.density_cameras:
+            self.density_pool = create_pool(config.density_workers)
+        for name, lane_rois in config.density_cameras.items():
+            source = self.capture.get(name)
+            if source is None:
+                print(f"Density camera {name} is not configured")
+                continue
+            estimator = DensityEstimator(source, lane_rois, self.density_pool,
+                                         lambda payload, name=name: self.on_camera_density(name, payload),
+                                         interval=config.density_interval)
+            estimator.start()
+            self.density_estimators.append(estimator)
+            QUEUE_DEPTH.set_function(lambda e=estimator: e.in_flight, f'density_{name}')
+
+        # Every intersection on the broker, sharded across processes by site
+        if config.fleet_shards is not None:
+            self.fleet = FleetIngest(config.fleet_shards, report_interval=config.fleet_report_interval,
+                                     rate_window=config.fleet_rate_window_s)
+            self.fleet.start()
+
+        self._stop.clear()
+        self._ticker = threading.Thread(target=self._tick_loop, daemon=True, name="telemetry-tick")
+        self._ticker.start()
+
+        # Hot settings in the config file apply while running
+        if config.path:
+            self.config_watcher = ConfigWatcher(config, self.apply_config)
+            self.config_watcher.start()
+
+        if connect:
+            self.connect_mqtt()
+
+    def stop(self):
+        """Stop every engine thread and flush pending uploads"""
+        self._stop.set()
+        if self.config_watcher is not None:
+            self.config_watcher.stop()
+        if self.connection is not None:
+            print("Stopping MQTT client loop...")
+            self.connection.stop()
+        if self.fleet_connection is not None:
+            self.fleet_connection.stop()
+        for estimator in self.density_estimators:
+            estimator.stop()
+        if self.density_pool is not None:
+            self.density_pool.shutdown(wait=False, cancel_futures=True)
+        if self.fleet is not None:
+            self.fleet.stop()
+        print("Stopping cameras...")
+        self.capture.stop()
+        if self.clips is not None:
+            self.clips.stop()
+        if self.persister is not None:
+            print("Flushing violation uploads...")
+            self.persister.stop()
+        if self.storage is not None:
+            self.storage.stop()
+            self.storage.close()
+        if self.violation_sync is not None:
+            self.violation_sync.stop()
+            self.index.close()
+        if self.recorder is not None:
+            self.recorder.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        PROFILER.stop()
+
+    def add_camera(self, name, uri, **options):
+        """Start capturing from a camera source"""
+        options = {key: value for key, value in options.items() if value is not None}
+        options.setdefault('buffer_frames', self.buffer_frames(options.get('fps', 30)))
+        options.setdefault('buffer_max_bytes', self.config.ring_buffer_max_mb * 2 ** 20)
+        source = self.capture.add_source(name, uri, **options)
+        # Only cameras that back a violation topic or density need frames while hidden
+        source.record = (name in self.config.density_cameras or
+                         any(name in names for names in self.config.violation_cameras.values()))
+        CAMERA_BUFFERED.set_function(lambda: len(source.frame_buffer), name)
+        return source
+
+    def buffer_frames(self, fps):
+        """Ring buffer slots covering the longest capture window at this frame rate"""
+        config = self.config
+        seconds = (config.pre_event_ms + config.post_event_ms) / 1000.0
+        if config.clip_codec:
+            seconds = max(seconds, config.clip_pre_event_s + config.clip_post_event_s)
+        # 10% headroom for frame rate jitter
+        return max(config.ring_buffer_frames, math.ceil(seconds * (fps if fps > 0 else 30) * 1.1))
+
+    def remove_camera(self, name):
+        """Stop capturing from a camera source"""
+        self.capture.remove_source(name)
+        CAMERA_BUFFERED.remove(name)
+
+    def sync_cameras(self, cameras):
+        """Add, remove and reconfigure sources to match a camera_sources list"""
+        wanted = {camera['name']: camera for camera in cameras}
+        for name in self.capture.names():
+            if name not in wanted:
+                self.remove_camera(name)
+                print(f"Removed camera {name}")
+        for name, camera in wanted.items():
+            source = self.capture.get(name)
+            if source is None:
+                self.add_camera(**camera)
+                continue
+            uri = parse_source(camera['uri'])
+            fps = camera.get('fps') or source.fps
+            resolution = tuple(camera['resolution']) if camera.get('resolution') else None
+            if (uri, fps, resolution) != (source.uri, source.fps, source.resolution):
+                # An empty resolution switches back to the camera's native size
+                source.reconfigure(uri=uri, fps=fps, resolution=resolution or ())
+                print(f"Reconfigured camera {name}")
+
+    def apply_config(self, changed):
+        """Apply hot settings that are not simply read when used"""
+        config = self.config
+        if 'camera_sources' in changed:
+            self.sync_cameras(config.camera_sources)
+        if 'clip_scale' in changed and self.clips is not None:
+            self.clips.scale = config.clip_scale
+        if 'violation_redelivery_window' in changed and self.connection is not None:
+            self.connection.duplicates.window = config.violation_redelivery_window
+        if 'violation_sync_interval' in changed and self.violation_sync is not None:
+            self.violation_sync.interval = config.violation_sync_interval
+        if 'rules' in changed:
+            try:
+                self.rules.configure(config.rules)
+            except ConfigError as e:
+                print(f"Rules not applied: {str(e)}")
+        if 'density_source' in changed:
+            self.update_density()
+        if 'density_interval' in changed:
+            for estimator in self.density_estimators:
+                estimator.interval = config.density_interval
+        if self.storage is not None and any(name.startswith('storage_') for name in changed):
+            self.storage.policy = self.retention_policy()
+            self.storage.interval = config.storage_interval
+        self._notify('config', changed)
+
+    def retention_policy(self):
+        """Evidence retention rules from the storage_* settings"""
+        config = self.config
+
+        def mb(value):
+            return value * 2 ** 20 if value is not None else None
+
+        return RetentionPolicy(quota_bytes=mb(config.storage_quota_mb),
+                               min_free_bytes=mb(config.storage_min_free_mb),
+                               max_age_days=config.storage_max_age_days,
+                               recompress_after_days=config.storage_recompress_after_days,
+                               recompress_quality=config.storage_recompress_quality,
+                               recompress_max_width=config.storage_recompress_max_width,
+                               dedupe_distance=config.storage_dedupe_distance)
+
+    def start_metrics_server(self, port):
+        """Turn metrics collection on and serve it on http://127.0.0.1:<port>/metrics"""
+        REGISTRY.enabled = True
+        try:
+            self.metrics_server = MetricsServer(port=port)
+        except OSError as e:
+            print(f"Could not serve metrics on port {port}: {str(e)}")
+            return
+        self.metrics_server.start()
+        print(f"Serving metrics on http://127.0.0.1:{self.metrics_server.port}/metrics")
+
+    def connect_mqtt(self):
+        """Connect to the MQTT broker in the background; reconnects until stop()"""
+        if self.mqtt_client is None:
+            self.mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        config = self.config
+        prefix = self.topic_prefix
+        subscriptions = {prefix + topic: config.topic_qos.get(topic, 1 if topic in config.violation_cameras else 0)
+                         for topic in self.dispatcher.topics()}
+        self.connection = MqttConnection(self.mqtt_client, self.broker, self.port, self.handle_message,
+                                         subscriptions,
+                                         event_topics=[prefix + topic for topic in config.violation_cameras],
+                                         keepalive=config.mqtt_keepalive,
+                                         min_delay=config.mqtt_reconnect_min_delay,
+                                         max_delay=config.mqtt_reconnect_max_delay,
+                                         queue_size=config.mqtt_inbound_queue,
+                                         dedup_window=config.violation_redelivery_window)
+        self.connection.on_state = self.on_connection_state
+        QUEUE_DEPTH.set_function(lambda: len(self.connection.inbound), 'mqtt_inbound')
+        try:
+            self.connection.connect()
+            print(f"Connecting to MQTT broker at {self.broker}:{self.port}")
+        except Exception as e:
+            print(f"Failed to connect to MQTT broker: {str(e)}")
+        if self.fleet is not None:
+            self.connect_fleet()
+
+    def connect_fleet(self):
+        """Subscribe to every site's topics on a connection of their own.
+
+        Fleet messages go straight from the client's network thread to the
+        shards, so they neither queue behind nor crowd out this
+        intersection's messages in the inbound queue.
+        """
+        if self.fleet_client is None:
+            self.fleet_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        config = self.config
+        fleet = self.fleet
+        self.fleet_connection = MqttConnection(self.fleet_client, self.broker, self.port,
+                                               lambda msg: fleet.submit(msg.topic, msg.payload, retain=msg.retain),
+                                               {FLEET_SUBSCRIPTION: 0}, keepalive=config.mqtt_keepalive,
+                                               min_delay=config.mqtt_reconnect_min_delay,
+                                               max_delay=config.mqtt_reconnect_max_delay, queue_size=None)
+        try:
+            self.fleet_connection.connect()
+        except Exception as e:
+            print(f"Failed to connect the fleet subscription: {str(e)}")
+
+    def on_connection_state(self, state, detail):
+        """Called by the MqttConnection whenever the broker connection changes"""
+        self.broker_status = {'connected': "Connected",
+                              'connecting': "Reconnecting" if self.connection.connects else "Connecting",
+                              }.get(state, "Disconnected")
+        print(f"MQTT {state}: {detail}" if detail else f"MQTT {state}")
+        self._notify('state')
+
+    def publish(self, topic, payload, qos=None, retain=False, site=None):
+        """Publish a traffic/... topic of this site (or another one) with the topic's QoS unless one is given"""
+        if qos is None:
+            qos = self.config.topic_qos.get(topic, 0)
+        topic = site_topic(site or self.site_id, topic)
+        if self.connection is not None:
+            return self.connection.publish(topic, payload, qos=qos, retain=retain)
+        if self.mqtt_client is None:
+            raise RuntimeError("MQTT is not connected")
+        return self.mqtt_client.publish(topic, payload, qos=qos, retain=retain)
+
+    def send_override(self, phase, site=None):
+        """Publish a phase override; refused while offline so it cannot arrive late"""
+        if self.connection is None or not self.connection.connected:
+            raise RuntimeError("Not connected to the MQTT broker")
+        info = self.publish("traffic/override", phase, site=site)
+        if info.rc != 0:
+            raise RuntimeError(f"Broker did not accept the override (rc={info.rc})")
+        return info
+
+    def override_phase(self, phase, site=None):
+        """Ask the controller (of this site unless another is given) to switch to a phase"""
+        self.send_override(phase, site=site)
+        print(f"Published override: {phase}" + (f" to {site}" if site else ""))
+
+    def handle_message(self, msg):
+        """Handle one incoming MQTT message (on the connection's inbound worker)"""
+        start = time.perf_counter() if REGISTRY.enabled else None
+        topic = msg.topic
+        if self.topic_prefix:
+            if not topic.startswith(self.topic_prefix):
+                return
+            topic = topic[len(self.topic_prefix):]
+        if self.recorder is not None:
+            self.recorder.on_message(topic, msg.payload)
+        self.dispatcher.dispatch(topic, msg.payload)
+        events = self.rules.on_message(topic, msg.payload, time.time())
+        if events:
+            self.emit_rule_events(events)
+        if start is not None:
+            MESSAGE_SECONDS.observe(time.perf_counter() - start, topic)
+
+    def _tick_loop(self):
+        while not self._stop.wait(self.config.telemetry_tick):
+            # Apply the latest coalesced distance/density values
+            changed = self.dispatcher.drain()
+            # Camera estimates expire even when no new density arrives
+            if self.camera_density and self.update_density():
+                changed = True
+            if changed:
+                self._notify('state')
+            events = self.rules.tick(time.time())
+            if events:
+                self.emit_rule_events(events)
+            if self.signal_timer is not None:
+                self.update_timing()
+
+    def on_phase(self, payload):
+        """Handle a traffic/phase message"""
+        phase = payload.decode()
+        if self.signal_timer is not None:
+            with self._timing_lock:
+                self.signal_timer.on_phase(phase, time.monotonic(), *self.timing_observation())
+        self.traffic_phase = phase
+        # Update crosswalk status based on phase
+        if phase in ["H_GREEN", "H_YELLOW"]:
+            self.crosswalk_status = "Clear"
+        elif phase in ["V_GREEN", "V_YELLOW"]:
+            self.crosswalk_status = "Not Clear"
+        self._notify('state')
+
+    def on_density(self, payload, stats):
+        """Handle the latest traffic/density message of a tick"""
+        try:
+            density_data = json.loads(payload)
+            self.sensor_density = {'H': density_data.get('H', 0), 'V': density_data.get('V', 0)}
+        except json.JSONDecodeError:
+            logger.warning("Invalid JSON in density data: %r", payload)
+            return
+        self.update_density()
+
+    def on_camera_density(self, camera, payload):
+        """Handle an estimate from a camera's DensityEstimator (on a pool callback thread)"""
+        self.camera_density[camera] = (time.monotonic(), json.loads(payload))
+        self.update_density()
+        self._notify('state')
+        self.publish(self.config.density_topic, payload)
+
+    def update_density(self):
+        """Set h_density/v_density from the sensor and camera counts as density_source says.
+
+        Only camera estimates from the last CAMERA_DENSITY_MAX_AGE intervals
+        count. For 'max' they are clamped to the IR scale first, so a blob
+        count cannot outweigh the controller's detectors. Returns True if the
+        density changed.
+        """
+        source = self.config.density_source
+        density = dict(self.sensor_density)
+        if source != 'sensor' and self.camera_density:
+            oldest = time.monotonic() - CAMERA_DENSITY_MAX_AGE * self.config.density_interval
+            estimates = [estimate for at, estimate in list(self.camera_density.values()) if at >= oldest]
+            for approach in ('H', 'V'):
+                counts = [estimate[approach] for estimate in estimates if approach in estimate]
+                if not counts:
+                    continue
+                camera = max(counts)
+                if source == 'camera':
+                    density[approach] = camera
+                else:
+                    density[approach] = max(min(camera, SENSOR_DENSITY_MAX), density[approach])
+        changed = (density['H'], density['V']) != (self.h_density, self.v_density)
+        self.h_density, self.v_density = density['H'], density['V']
+        return changed
+
+    def on_distance(self, payload, stats):
+        """Handle the latest traffic/distance message of a tick"""
+        try:
+            distance_data = json.loads(payload)
+            self.last_distance = distance_data.get('distance', 0)
+        except json.JSONDecodeError:
+            logger.warning("Invalid JSON in distance data: %r", payload)
+
+    def on_crosswalk(self, payload):
+        """Handle a traffic/crosswalk message"""
+        status = payload.decode()
+        if status == "PEDESTRIAN_WAITING":
+            self.crosswalk_status = "Pedestrian Waiting"
+        elif status == "CROSSWALK_CLEAR":
+            # Only update to Clear if we're in horizontal phase
+            if self.traffic_phase in ["H_GREEN", "H_YELLOW"]:
+                self.crosswalk_status = "Clear"
+            else:
+                self.crosswalk_status = "Not Clear"
+        self._notify('state')
+
+    def timing_observation(self):
+        """(pedestrian waiting, Observation) for the signal timer"""
+        pedestrian_waiting = self.crosswalk_status == "Pedestrian Waiting"
+        return pedestrian_waiting, Observation({'H': self.h_density, 'V': self.v_density}, pedestrian_waiting)
+
+    def update_timing(self):
+        """Let the signal timer hold or end the current green"""
+        if self.connection is None or not self.connection.connected:
+            return  # The controller runs its own timing until the broker is back
+        with self._timing_lock:
+            command = self.signal_timer.step(time.monotonic(), self.timing_observation()[1])
+        if command is None:
+            return
+        try:
+            self.send_override(command)
+            logger.debug("Signal timing override: %s", command)
+        except Exception as e:
+            logger.warning("Failed to send timing override %s: %s", command, e)
+
+    def emit_rule_events(self, events):
+        """Publish, record and announce rules turning active or clearing"""
+        for event in events:
+            rule = event.rule
+            print(f"Rule {rule.name} {'active' if event.active else 'cleared'} (value {event.value})")
+            if self.telemetry is not None:
+                self.telemetry.record(f"rule_{rule.name}", 1 if event.active else 0, event.timestamp)
+            # Retained so dashboards and other hosts see the current state when they connect
+            if self.connection is not None and self.connection.connected:
+                try:
+                    self.publish(rule.topic, event.payload(), retain=True)
+                except Exception as e:
+                    logger.warning("Failed to publish rule %s: %s", rule.name, e)
+            self._notify('rule', event)
+        self._notify('state')
+
+    def white_line_warning(self):
+        """True if a car is past the white line while the vertical lane is red (the white_line rule)"""
+        return self.rules.active('white_line')
+
+    def snapshot(self):
+        """Current intersection state as a plain dict"""
+        return {
+            'phase': self.traffic_phase,
+            'h_density': self.h_density,
+            'v_density': self.v_density,
+            'distance': self.last_distance,
+            'crosswalk': self.crosswalk_status,
+            'white_line_warning': self.white_line_warning(),
+            'alerts': self.rules.active_rules(),
+            'broker': self.broker_status,
+        }
+
+    def site_snapshot(self, site):
+        """State of another intersection from the fleet, shaped like snapshot()"""
+        summary = self.fleet.site(site) if self.fleet is not None else None
+        if summary is None:
+            summary = IntersectionState(site).summary(self.config.fleet_rate_window_s)
+        alerts = [f"{summary['violations_per_hour']:.1f} violations/h"] if summary['violations_per_hour'] else []
+        return {
+            'phase': summary['phase'],
+            'h_density': summary['h_density'],
+            'v_density': summary['v_density'],
+            'distance': summary['distance'] if summary['distance'] is not None else "-",
+            'crosswalk': CROSSWALK_STATUS.get(summary['crosswalk'], summary['crosswalk']),
+            'white_line_warning': False,
+            'alerts': alerts,
+            'broker': self.broker_status,
+        }
+
+    def on_violation(self, payload, cameras):
+        """Handle a violation message for the given cameras"""
+        if payload == b'RED_VIOLATION':
+            print("Violation detected! Handling violation...")
+            self.handle_violation(cameras)
+
+    def handle_violation(self, cameras):
+        """Handle a red light violation"""
+        event_time = time.time()
+        phase = self.traffic_phase  # Phase at the moment of the event
+        for name in cameras:
+            source = self.capture.get(name)
+            if source is None or not source.is_open():
+                print(f"Camera {name} not available for capturing violation")
+                continue
+
+            # Collect the burst once the post-event window has been filled by
+            # the capture workers, without blocking the MQTT network thread
+            timer = threading.Timer(self.config.post_event_ms / 1000.0, self.capture_violation,
+                                    args=(event_time, phase, source))
+            timer.daemon = True
+            timer.start()
+
+    def capture_violation(self, event_time, phase, source):
+        """Save the buffered frames around a violation as a burst of images"""
+        start = time.perf_counter() if REGISTRY.enabled else None
+        config = self.config
+        frames = source.frame_buffer.window(event_time - config.pre_event_ms / 1000.0,
+                                            event_time + config.post_event_ms / 1000.0)
+        if not frames:
+            print(f"No buffered frames available for violation on camera {source.name}")
+            return
+
+        # Drop sensor false positives when the camera saw no stop-line crossing
+        verifier = self.verifiers.get(source.name)
+        if verifier is not None:
+            result = verifier.verify(frames, phase)
+            print(f"Violation check on camera {source.name}: {result.reason} ({result.ms_per_frame:.2f} ms/frame)")
+            if not result.confirmed:
+                return
+
+        # Hand the burst to the persistence pipeline
+        base = os.path.join(self.violations_dir, self.violation_basename(event_time, source.name))
+        filenames = [f"{base}_{i:02d}.jpg" for i in range(len(frames))]
+        extra = {}
+        if self.clips is not None:
+            extra['clip_filename'] = base + config.clip_extension
+
+        # Key frame is the first one taken at or after the event
+        key_index = next((i for i, (ts, _) in enumerate(frames) if ts >= event_time), len(frames) - 1)
+        record = ViolationPersister.new_record(event_time, filenames[key_index], filenames,
+                                               camera=source.name, phase=phase, verified=verifier is not None,
+                                               approach=self.violation_approach(source.name, phase), **extra)
+        # Tracked before the files are written; dropped ones end up marked missing
+        self.storage.track(record)
+        if not self.persister.submit(record, [(fn, frame) for fn, (_, frame) in zip(filenames, frames)]):
+            return
+        print(f"Queued {len(filenames)} violation images as {base}_*.jpg")
+        if self.clips is not None:
+            self.clips.record(source, record['clip_filename'],
+                              event_time - config.clip_pre_event_s, event_time + config.clip_post_event_s)
+
+        # Indexed right away so the browser shows it even while uploads are spooled
+        self.index.upsert([record])
+        if start is not None:
+            CAPTURE_SECONDS.observe(time.perf_counter() - start, source.name)
+        self._notify('violation', record)
+
+    def violation_basename(self, event_time, camera):
+        """Millisecond-precise file name stem, unique even for events in the same millisecond"""
+        stamp = datetime.fromtimestamp(event_time)
+        stem = stamp.strftime("violation_%Y%m%d_%H%M%S_") + f"{stamp.microsecond // 1000:03d}_{camera}"
+        with self._names_lock:
+            last, n = self._last_names.get(camera, (None, 0))
+            n = n + 1 if stem == last else 0
+            self._last_names[camera] = (stem, n)
+        return f"{stem}_{n}" if n else stem
+
+    def violation_approach(self, camera, phase):
+        """Approach that ran the red light: the camera's stop-line zone, else whichever was red"""
+        zone = self.config.stop_line_zones.get(camera)
+        if zone is not None:
+            return zone['approach']
+        return next((approach for approach, phases in RED_PHASES.items() if phase in phases), None)
+
+    def density_metrics(self):
+        """Throughput and latency of each camera density estimator"""
+        return {estimator.source.name: estimator.metrics() for estimator in self.density_estimators}
+
+
+def parse_camera(value):
+    """--camera name=uri, or just uri (named camN)"""
+    name, sep, uri = value.partition('=')
+    return (name, uri) if sep else (None, value)
+
+
+# Command line options that override a setting: option dest -> setting name
+OPTION_SETTINGS = {
+    'broker': 'mqtt_broker',
+    'port': 'mqtt_port',
+    'credentials': 'firebase_credentials',
+    'violations_dir': 'violations_dir',
+    'telemetry_dir': 'telemetry_dir',
+    'timing': 'signal_timing',
+    'metrics_port': 'metrics_port',
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Smart traffic light monitoring service")
+    parser.add_argument('--config', help="JSON settings file (default: $TRAFFIC_CONFIG or ./traffic_config.json)")
+    parser.add_argument('--site', help="Intersection profile to load from the config file")
+    parser.add_argument('--broker', help="MQTT broker host")
+    parser.add_argument('--port', type=int, help="MQTT broker port")
+    parser.add_argument('--backend', choices=['firestore', 'fake'], default='firestore',
+                        help="Where violations are uploaded ('fake' keeps them in memory)")
+    parser.add_argument('--credentials', help="Firebase credentials JSON")
+    parser.add_argument('--camera', action='append', type=parse_camera, metavar='[NAME=]SOURCE',
+                        help="Camera device index, file or URL; repeat for several cameras")
+    parser.add_argument('--no-camera', action='store_true', help="Run without any camera")
+    parser.add_argument('--violations-dir')
+    parser.add_argument('--telemetry-dir')
+    parser.add_argument('--no-telemetry', action='store_true', help="Do not record telemetry history")
+    parser.add_argument('--timing', choices=sorted(STRATEGIES),
+                        help="Signal timing strategy ('esp' leaves timing to the controller)")
+    parser.add_argument('--metrics-port', type=int,
+                        help="Collect metrics and serve them on this local port (/metrics)")
+    parser.add_argument('--profile', action='store_true', help="Run the sampling profiler (served on /profile)")
+    parser.add_argument('--ui', action='store_true', help="Attach the Tk dashboard")
+    parser.add_argument('--log-level', default='INFO')
+    return parser
+
+
+def config_from_args(args):
+    """Config from the file, profile and environment, with the given options on top"""
+    overrides = {setting: getattr(args, dest) for dest, setting in OPTION_SETTINGS.items()
+                 if getattr(args, dest) is not None}
+    if args.no_camera:
+        overrides['camera_sources'] = []
+    elif args.camera:
+        overrides['camera_sources'] = [{'name': name or f"cam{i}", 'uri': uri}
+                                       for i, (name, uri) in enumerate(args.camera)]
+    if args.no_telemetry:
+        overrides['record_telemetry'] = False
+    return Config(args.config or default_path(), site=args.site, overrides=overrides)
+
+
+def engine_from_args(args, config):
+    if args.backend == 'fake':
+        backend = FakeBackend()
+    else:
+        backend = FirestoreBackend(init_firebase(config.firebase_credentials))
+    return TrafficEngine(backend, config)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        config = config_from_args(args)
+        engine = engine_from_args(args, config)
+    except ConfigError as e:
+        parser.error(str(e))
+    if args.profile:
+        PROFILER.start()
+
+    if args.ui:
+        import traffic_system_ui
+        traffic_system_ui.run(engine)
+        return
+
+    engine.start()
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    print("Monitoring service running. Press Ctrl+C to stop.")
+    stop.wait()
+    engine.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+"""Declarative rules over the intersection's event stream.
+
+Each MQTT message is turned into signal values (distance, h_density,
+v_density, phase, crosswalk, violation) and handed only to the rules that
+watch those signals. Rules keep a little state and update it per value,
+so every message is evaluated once and history is never rescanned; rules
+that depend on time passing are also stepped on the engine's tick. A rule
+is either active or not, and every change comes back as a RuleEvent for
+the engine to publish and log.
+
+Rule types live in RULE_TYPES. A plugin module registers its own Rule
+subclasses there when imported and is loaded by name from the
+rule_plugins setting:
+
+    from traffic_rules import RULE_TYPES, Rule
+
+    class MyRule(Rule):
+        ...
+
+    RULE_TYPES['my_rule'] = MyRule
+"""
+import collections
+import importlib
+import json
+import re
+import threading
+
+from config import ConfigError
+
+# Topic prefix for rule state; each rule publishes (retained) on <prefix><name>
+RULE_TOPIC_PREFIX = "traffic/rules/"
+
+_NUMBER = rb'"%s"\s*:\s*(-?\d+(?:\.\d+)?)'
+
+
+def number_field(field):
+    """Parser pulling a number out of a JSON payload without json.loads"""
+    pattern = re.compile(_NUMBER % field.encode())
+
+    def parse(payload):
+        match = pattern.search(payload)
+        return float(match.group(1)) if match else None
+    return parse
+
+
+def text(payload):
+    return payload.decode(errors='replace')
+
+
+_distance = number_field('distance')
+
+
+def distance(payload):
+    """Distance in cm; readings <= 0 are skipped, as the original `last_distance > 0` check did.
+
+    The firmware reports maxDistance (400) when there is no echo; 0 is an
+    echo under 58 us, i.e. something closer than 1 cm to the sensor.
+    """
+    value = _distance(payload)
+    return value if value is not None and value > 0 else None
+
+
+def red_violation(payload):
+    return 1 if payload == b'RED_VIOLATION' else None
+
+
+def default_signals(violation_topics=('traffic/violation',)):
+    """topic -> [(signal, parser), ...] for the ESP topics; parsers return None to skip a payload"""
+    signals = {
+        'traffic/distance': [('distance', distance)],
+        'traffic/density': [('h_density', number_field('H')), ('v_density', number_field('V'))],
+        'traffic/phase': [('phase', text)],
+        'traffic/crosswalk': [('crosswalk', text)],
+    }
+    for topic in violation_topics:
+        signals[topic] = [('violation', red_violation)]
+    return signals
+
+
+class RuleEvent:
+    """A rule turning active or clearing"""
+
+    __slots__ = ('rule', 'active', 'timestamp', 'value')
+
+    def __init__(self, rule, active, timestamp, value):
+        self.rule = rule
+        self.active = active
+        self.timestamp = timestamp
+        self.value = value
+
+    def payload(self):
+        return json.dumps({'rule': self.rule.name, 'active': self.active,
+                           'timestamp': self.timestamp, 'value': self.value}).encode()
+
+    def __repr__(self):
+        return f"RuleEvent({self.rule.name}, {'active' if self.active else 'cleared'}, value={self.value})"
+
+
+class Rule:
+    """A named condition that is either active or not.
+
+    Subclasses set `signals` (the signals they are evaluated on) and
+    `timed` (whether on_tick must be called), and return the result of
+    _change() from on_value() and on_tick(). `latest` maps every signal
+    to its newest value.
+    """
+
+    signals = ()
+    timed = False
+
+    def __init__(self, name, topic=None):
+        self.name = name
+        self.topic = topic or RULE_TOPIC_PREFIX + name
+        self.active = False
+        self.changed_at = None
+
+    def on_value(self, signal, value, now, latest):
+        return None
+
+    def on_tick(self, now, latest):
+        return None
+
+    def _change(self, active, now, value=None):
+        """RuleEvent if the rule's state changes, else None"""
+        if active == self.active:
+            return None
+        self.active = active
+        self.changed_at = now
+        return RuleEvent(self, active, now, value)
+
+
+class Sustained(Rule):
+    """Active once a signal has met a condition for for_ms milliseconds.
+
+    The condition is equals (value == equals) or a range: above
+    (value > above) and/or at_most (value <= at_most). With phases, it
+    only holds while the traffic phase is one of them. The rule clears
+    once the condition has failed for clear_after_ms, so a one-sample
+    blip stays visible for at least that long.
+    """
+
+    def __init__(self, name, signal, above=None, at_most=None, equals=None, for_ms=0, clear_after_ms=0,
+                 phases=None, topic=None):
+        super().__init__(name, topic)
+        if above is None and at_most is None and equals is None:
+            raise ValueError("needs above, at_most or equals")
+        self.signal = signal
+        self.above = float(above) if above is not None else None
+        self.at_most = float(at_most) if at_most is not None else None
+        self.equals = equals
+        self.hold = float(for_ms) / 1000.0
+        self.release = float(clear_after_ms) / 1000.0
+        self.phases = frozenset(phases) if phases else None
+        self.signals = (signal, 'phase') if self.phases else (signal,)
+        self.timed = self.hold > 0 or self.release > 0
+        self._met_since = None
+        self._failed_since = None
+        self._value = None
+
+    def _holds(self, value, latest):
+        if value is None or self.phases is not None and latest.get('phase') not in self.phases:
+            return False
+        if self.equals is not None:
+            return value == self.equals
+        return (self.above is None or value > self.above) and (self.at_most is None or value <= self.at_most)
+
+    def on_value(self, signal, value, now, latest):
+        self._value = latest.get(self.signal)
+        if self._holds(self._value, latest):
+            self._failed_since = None
+            if self._met_since is None:
+                self._met_since = now
+        else:
+            self._met_since = None
+            if self._failed_since is None:
+                self._failed_since = now
+        return self.on_tick(now, latest)
+
+    def on_tick(self, now, latest):
+        if self.active:
+            if self._failed_since is not None and now - self._failed_since >= self.release:
+                return self._change(False, now, self._value)
+        elif self._met_since is not None and now - self._met_since >= self.hold:
+            return self._change(True, now, self._value)
+        return None
+
+
+class Count(Rule):
+    """Active while more than more_than values of a signal arrived within the last window_s seconds"""
+
+    timed = True
+
+    def __init__(self, name, more_than, window_s, signal='violation', topic=None):
+        super().__init__(name, topic)
+        self.more_than = int(more_than)
+        self.window = float(window_s)
+        self.signals = (signal,)
+        self._times = collections.deque()
+
+    def on_value(self, signal, value, now, latest):
+        self._times.append(now)
+        return self.on_tick(now, latest)
+
+    def on_tick(self, now, latest):
+        cutoff = now - self.window
+        while self._times and self._times[0] <= cutoff:
+            self._times.popleft()
+        return self._change(len(self._times) > self.more_than, now, len(self._times))
+
+
+RULE_TYPES = {
+    'sustained': Sustained,
+    'count': Count,
+}
+
+
+def load_plugins(modules):
+    """Import rule plugin modules so they can register their rule types"""
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            raise ConfigError(f"Cannot load rule plugin {name!r}: {str(e)}") from None
+
+
+def build_rule(definition):
+    options = dict(definition)
+    name = options['name']
+    kind = options.pop('type')
+    cls = RULE_TYPES.get(kind)
+    if cls is None:
+        raise ConfigError(f"Rule {name!r} has unknown type {kind!r} (known: {', '.join(RULE_TYPES)})")
+    try:
+        return cls(**options)
+    except (TypeError, ValueError) as e:
+        raise ConfigError(f"Invalid rule {name!r}: {str(e)}") from None
+
+
+class RuleEngine:
+    """Evaluates rules incrementally as messages arrive.
+
+    on_message() and tick() return the RuleEvents they caused; they may be
+    called from different threads.
+    """
+
+    def __init__(self, definitions=(), signals=None):
+        self.signals = signals if signals is not None else default_signals()
+        self.latest = {}
+        self.rules = {}
+        self._watchers = {}  # signal -> rules evaluated on it
+        self._timed = []
+        self._definitions = {}
+        self._lock = threading.Lock()
+        self.evaluations = 0
+        self.configure(definitions)
+
+    def configure(self, definitions):
+        """Replace the rule set; rules whose definition is unchanged keep their state"""
+        rules = {}
+        for definition in definitions:
+            name = definition['name']
+            if self._definitions.get(name) == definition:
+                rules[name] = self.rules[name]
+            else:
+                rules[name] = build_rule(definition)
+        watchers = collections.defaultdict(list)
+        for rule in rules.values():
+            for signal in rule.signals:
+                watchers[signal].append(rule)
+        with self._lock:
+            self.rules = rules
+            self._watchers = dict(watchers)
+            self._timed = [rule for rule in rules.values() if rule.timed]
+            self._definitions = {definition['name']: dict(definition) for definition in definitions}
+
+    def on_message(self, topic, payload, now):
+        parsers = self.signals.get(topic)
+        if parsers is None:
+            return []
+        events = []
+        with self._lock:
+            for signal, parse in parsers:
+                value = parse(payload)
+                if value is None:
+                    continue
+                self.latest[signal] = value
+                for rule in self._watchers.get(signal, ()):
+                    self.evaluations += 1
+                    event = rule.on_value(signal, value, now, self.latest)
+                    if event is not None:
+                        events.append(event)
+        return events
+
+    def tick(self, now):
+        """Step the rules that depend on time passing"""
+        events = []
+        with self._lock:
+            for rule in self._timed:
+                self.evaluations += 1
+                event = rule.on_tick(now, self.latest)
+                if event is not None:
+                    events.append(event)
+        return events
+
+    def active(self, name):
+        rule = self.rules.get(name)
+        return rule is not None and rule.active
+
+    def active_rules(self):
+        return [name for name, rule in self.rules.items() if rule.active]
@@ -1,204 +1,169 @@
+"""Tk dashboard for the smart traffic light system.
+
+A thin front end over traffic_core.TrafficEngine, which does all MQTT,
+camera and violation work and can also run headless.
+"""
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
+from tkinter import ttk, messagebox
 import cv2
-import numpy as np
-import os
-import paho.mqtt.client as mqtt
-import firebase_admin
-from firebase_admin import credentials, firestore
-from datetime import datetime
-import threading
-import json
+import queue
 from PIL import Image, ImageTk
+import sys
 import time
+import traffic_core
+from diagnostics_panel import DiagnosticsPanel
+from fleet_panel import FleetPanel
+from metrics import REGISTRY
+from violation_browser import ViolationBrowser
+
+
+# Light colors for each phase; any light not listed is gray
+PHASE_LIGHTS = {
+    "H_GREEN": {'h_green': "green", 'v_red': "red"},
+    "H_YELLOW": {'h_yellow': "yellow", 'v_red': "red"},
+    "V_GREEN": {'v_green': "green", 'h_red': "red"},
+    "V_YELLOW": {'v_yellow': "yellow", 'h_red': "red"},
+}
+LIGHT_NAMES = ('h_red', 'h_yellow', 'h_green', 'v_red', 'v_yellow', 'v_green')
+PHASE_LIGHT_COLORS = {
+    phase: tuple(lights.get(name, "gray") for name in LIGHT_NAMES)
+    for phase, lights in PHASE_LIGHTS.items()
+}
+ALL_GRAY = ("gray",) * len(LIGHT_NAMES)
+
+CONVERT_SECONDS = REGISTRY.histogram('traffic_ui_frame_convert_seconds',
+                                     "Resize + convert + paste time of one preview frame", labels=('camera',))
+RENDER_SECONDS = REGISTRY.histogram('traffic_ui_render_seconds', "Time of one dashboard state refresh")
+
+# How often engine events are picked up on the Tk thread
+EVENT_POLL_MS = 50
 
-# Firebase setup
-cred = credentials.Certificate("traffic-light-system-23d76-firebase-adminsdk-fbsvc-8e9cd5da24.json")
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+# Refresh period while showing another intersection (its state arrives with fleet reports, not engine events)
+SITE_REFRESH_MS = 1000
 
-# MQTT Configuration
-MQTT_BROKER = '172.20.10.4'
-MQTT_PORT = 1883
+class CameraTile:
+    """Preview tile for one camera source; used from the Tk thread only"""
+    def __init__(self, parent, source):
+        self.source = source
+        self.frame = ttk.Frame(parent)
+        ttk.Label(self.frame, text=source.name).pack(anchor=tk.W)
+        self.label = ttk.Label(self.frame)
+        self.label.pack(fill=tk.BOTH, expand=True)
+        self.photo = None
+        self.frames_displayed = 0
+        self.convert_ms = 0.0  # Moving average of resize + convert + paste time
+
+    def show(self, size):
+        """Display the newest frame of the source, if there is one"""
+        frame = self.source.display.take()
+        if frame is None:
+            if self.photo is not None and not self.source.is_open():
+                self.clear()
+            return
+        start = time.perf_counter()
+        
+        # Resize frame for display and convert to RGB for tkinter
+        frame_resized = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        img = Image.fromarray(cv2.cvtColor(frame_resized, cv2.COLOR_BGR2RGB))
+        
+        if self.photo is None or (self.photo.width(), self.photo.height()) != size:
+            self.photo = ImageTk.PhotoImage(image=img)
+            self.label.configure(image=self.photo)
+        else:
+            # Reuse the existing PhotoImage instead of allocating a new one
+            self.photo.paste(img)
+        
+        elapsed = time.perf_counter() - start
+        if REGISTRY.enabled:
+            CONVERT_SECONDS.observe(elapsed, self.source.name)
+        elapsed_ms = elapsed * 1000.0
+        self.convert_ms = elapsed_ms if self.frames_displayed == 0 else 0.9 * self.convert_ms + 0.1 * elapsed_ms
+        self.frames_displayed += 1
+
+    def clear(self):
+        """Remove the camera image from the tile"""
+        self.label.configure(image="")
+        self.photo = None
 
-# Create violations folder if not exists
-if not os.path.exists("violations"):
-    os.makedirs("violations")
 
 class TrafficSystemUI:
-    def __init__(self, root):
+    def __init__(self, root, engine):
         self.root = root
         self.root.title("Smart Traffic Light System")
         self.root.geometry("1400x900")
         self.root.resizable(True, True)
         
-        # Initialize camera to None first
-        self.cam = None
-        self.camera_index = 0 # Default camera index
-        self.stop_camera_signal = threading.Event()
-        
-        # Initialize MQTT client
-        self.mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)  # Updated to VERSION2
-        self.mqtt_client.on_connect = self.on_connect
-        self.mqtt_client.on_message = self.on_message
-        
-        # Variables for storing data
-        self.traffic_phase = "Unknown"
-        self.h_density = 0
-        self.v_density = 0
-        self.last_distance = 0
-        self.crosswalk_status = "Clear"
-        self.violations = []
-        
-        # Setup camera
-        self.setup_camera(self.camera_index)
+        self.engine = engine
+        self.config = engine.config  # Display settings are read on use, so they hot-reload
+        self.capture = engine.capture
+        self.tiles = {}
+        self.tile_page = 0
+        self.tile_size = self.config.display_size
+        
+        # Last value written to each widget, so unchanged widgets are skipped
+        self._rendered = {}
+        self._render_pending = False
+        self.diagnostics = None
+        self.fleet_panel = None
+        self.view_site = None  # Another intersection shown instead of this one
+        self._site_after = None
+        self._events = queue.Queue()  # Engine events, drained on the Tk thread
         
         # Create UI
         self.create_ui()
         
-        # Connect to MQTT after UI is created
-        self.connect_mqtt()
+        # Engine callbacks arrive on engine threads; they only queue the event
+        # and poll_events() handles it on the Tk thread (Tk is not thread-safe)
+        self.engine.add_listener(self.on_engine_event)
+        self.poll_events()
+        self.layout_tiles()
         
-        # Start threads
-        self.camera_thread = threading.Thread(target=self.camera_loop, daemon=True)
-        self.camera_thread.start()
+        # Start displaying camera frames
+        self.show_camera_frame()
         
-        # Start updating UI
+        # Initial render; later renders are scheduled as new state arrives
         self.update_ui()
 
-    def setup_camera(self, camera_index):
-        """Setup the camera for capturing violations"""
-        try:
-            self.cam = cv2.VideoCapture(camera_index)
-            if not self.cam.isOpened():
-                messagebox.showerror("Error", f"Could not open camera index {camera_index}. UI will start without camera feed.")
-                self.cam = None
-                self.camera_label.configure(image=None) # Clear previous image
-                self.camera_label.imgtk = None
-            else:
-                self.camera_index = camera_index # Store the successfully opened index
-                print(f"Camera {camera_index} opened successfully.")
-        except Exception as e:
-            messagebox.showerror("Error", f"Camera error with index {camera_index}: {str(e)}")
-            self.cam = None
-            self.camera_label.configure(image=None) # Clear previous image
-            self.camera_label.imgtk = None
+    def on_engine_event(self, event, data):
+        """Called by the engine (on its threads) when its state changes or a violation is recorded"""
+        self._events.put(event)
 
-    def connect_mqtt(self):
-        """Connect to MQTT broker"""
-        try:
-            self.mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
-            self.mqtt_client.loop_start()
-            print(f"Connected to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}")
-        except Exception as e:
-            print(f"Failed to connect to MQTT broker: {str(e)}")
-            messagebox.showerror("Error", f"Failed to connect to MQTT broker: {str(e)}")
-
-    def on_connect(self, client, userdata, flags, rc, properties=None):
-        """Callback when connected to MQTT broker"""
-        print(f"Connected with result code {rc}")
-        # Subscribe to topics
-        topics = [
-            ('traffic/phase', 0),
-            ('traffic/violation', 0),
-            ('traffic/density', 0),
-            ('traffic/distance', 0),
-            ('traffic/crosswalk', 0)
-        ]
-        client.subscribe(topics)
-
-    def on_message(self, client, userdata, msg):
-        """Handle incoming MQTT messages"""
-        topic = msg.topic
-        payload = msg.payload.decode()
-        print(f"Received: {topic} - {payload}")
-        
-        if topic == 'traffic/phase':
-            self.traffic_phase = payload
-            # Update crosswalk status based on phase
-            if payload in ["H_GREEN", "H_YELLOW"]:
-                self.crosswalk_status = "Clear"
-            elif payload in ["V_GREEN", "V_YELLOW"]:
-                self.crosswalk_status = "Not Clear"
-        
-        elif topic == 'traffic/density':
-            try:
-                density_data = json.loads(payload)
-                self.h_density = density_data.get('H', 0)
-                self.v_density = density_data.get('V', 0)
-            except json.JSONDecodeError:
-                print(f"Invalid JSON in density data: {payload}")
-        
-        elif topic == 'traffic/distance':
+    def poll_events(self):
+        """Handle queued engine events on the Tk thread"""
+        events = set()
+        while True:
             try:
-                distance_data = json.loads(payload)
-                self.last_distance = distance_data.get('distance', 0)
-            except json.JSONDecodeError:
-                print(f"Invalid JSON in distance data: {payload}")
-        
-        elif topic == 'traffic/crosswalk':
-            if payload == "PEDESTRIAN_WAITING":
-                self.crosswalk_status = "Pedestrian Waiting"
-            elif payload == "CROSSWALK_CLEAR":
-                # Only update to Clear if we're in horizontal phase
-                if self.traffic_phase in ["H_GREEN", "H_YELLOW"]:
-                    self.crosswalk_status = "Clear"
-                else:
-                    self.crosswalk_status = "Not Clear"
-        
-        elif topic == 'traffic/violation':
-            if payload == 'RED_VIOLATION':
-                print("Violation detected! Handling violation...")
-                self.handle_violation()
-
-    def handle_violation(self):
-        """Handle a red light violation"""
-        if self.cam is None:
-            print("Camera not available for capturing violation")
-            return
-        
-        # Add 150ms delay before capturing
-        time.sleep(0.15)  # 150ms delay
-            
-        ret, frame = self.cam.read()
-        if not ret:
-            print("Failed to capture image for violation")
-            return
-            
-        # Save image
-        now = datetime.now()
-        filename = now.strftime("violations/violation_%Y%m%d_%H%M%S.jpg")
-        cv2.imwrite(filename, frame)
-        print(f"Saved violation image to {filename}")
-        
-        # Upload to Firebase
-        self.upload_violation(filename)
-        
-        # Update violations list
-        violation_entry = {
-            'date': now.strftime("%Y-%m-%d"),
-            'time': now.strftime("%H:%M:%S"),
-            'image_filename': filename
-        }
-        self.violations.insert(0, violation_entry)  # Insert at the beginning for newest first
-        
-        # Update the violations text area
-        self.update_violations_list()
+                events.add(self._events.get_nowait())
+            except queue.Empty:
+                break
+        if 'synced' in events:
+            # Synced records can be older than the top row; show_new() only adds newer ones
+            self.violation_browser.refresh()
+        elif 'violation' in events:
+            self.violation_browser.show_new()
+        if 'config' in events:
+            # Cameras or the tile layout may have changed
+            self.layout_tiles()
+        if events:
+            self.request_render()
+        self.root.after(EVENT_POLL_MS, self.poll_events)
 
-    def upload_violation(self, image_filename):
-        """Upload violation details to Firebase"""
-        try:
-            now = datetime.now()
-            data = {
-                'date': now.strftime("%Y-%m-%d"),
-                'time': now.strftime("%H:%M:%S"),
-                'image_filename': image_filename
-            }
-            doc_ref = db.collection('violations').document()
-            doc_ref.set(data)
-            print(f"Uploaded to Firebase: {data}")
-        except Exception as e:
-            print(f"Failed to upload to Firebase: {str(e)}")
+    def add_camera(self, name, uri, **options):
+        """Start capturing from a camera source and give it a preview tile"""
+        source = self.engine.add_camera(name, uri, **options)
+        self.layout_tiles()
+        return source
+
+    def remove_camera(self, name):
+        """Stop capturing from a camera source"""
+        self.engine.remove_camera(name)
+        self.layout_tiles()
+
+    def request_render(self):
+        """Schedule a UI refresh, at most one every render_interval_ms (Tk thread only)"""
+        if not self._render_pending:
+            self._render_pending = True
+            self.root.after(self.config.render_interval_ms, self.update_ui)
 
     def create_ui(self):
         """Create the UI components"""
@@ -227,6 +192,21 @@ class TrafficSystemUI:
         ttk.Label(status_frame, text="Vertical Density:").grid(row=2, column=0, sticky=tk.W, pady=2)
         self.v_density_label = ttk.Label(status_frame, text="0")
         self.v_density_label.grid(row=2, column=1, sticky=tk.W, pady=2)
+
+        ttk.Label(status_frame, text="Broker:").grid(row=3, column=0, sticky=tk.W, pady=2)
+        self.broker_label = ttk.Label(status_frame, text="Disconnected")
+        self.broker_label.grid(row=3, column=1, sticky=tk.W, pady=2)
+
+        # Active rules from traffic_rules (white line, pedestrian wait, ...)
+        ttk.Label(status_frame, text="Alerts:").grid(row=4, column=0, sticky=tk.W, pady=2)
+        self.alerts_label = ttk.Label(status_frame, text="None", foreground="red")
+        self.alerts_label.grid(row=4, column=1, sticky=tk.W, pady=2)
+
+        # Which intersection the panel shows; other sites come from the fleet view
+        ttk.Label(status_frame, text="Showing:").grid(row=5, column=0, sticky=tk.W, pady=2)
+        self.site_label = ttk.Label(status_frame, text=self.engine.site_id or "This intersection")
+        self.site_label.grid(row=5, column=1, sticky=tk.W, pady=2)
+        self.local_button = ttk.Button(status_frame, text="Back", width=5, command=lambda: self.show_site(None))
         
         # Vehicle Proximity Sensor section
         proximity_frame = ttk.LabelFrame(left_panel, text="Vehicle Proximity Sensor", padding="10")
@@ -279,6 +259,11 @@ class TrafficSystemUI:
         ttk.Button(control_frame, text="V_GREEN", command=lambda: self.override_phase("V_GREEN")).pack(side=tk.LEFT, padx=5)
         ttk.Button(control_frame, text="V_YELLOW", command=lambda: self.override_phase("V_YELLOW")).pack(side=tk.LEFT, padx=5)
         
+        # Metrics and profiler window
+        ttk.Button(left_panel, text="Diagnostics", command=self.open_diagnostics).pack(fill=tk.X, pady=5)
+        if self.engine.fleet is not None:
+            ttk.Button(left_panel, text="Fleet", command=self.open_fleet).pack(fill=tk.X, pady=5)
+        
         # Create right panel (camera feed and violations)
         right_panel = ttk.LabelFrame(main_frame, text="Monitoring System", padding="10")
         right_panel.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -292,234 +277,247 @@ class TrafficSystemUI:
         camera_controls.pack(fill=tk.X, pady=5)
         
         # Camera selection
-        ttk.Label(camera_controls, text="Camera Index:").pack(side=tk.LEFT, padx=(0, 5))
-        self.camera_index_entry = ttk.Entry(camera_controls, width=5)
-        self.camera_index_entry.insert(0, str(self.camera_index))
-        self.camera_index_entry.pack(side=tk.LEFT, padx=(0, 5))
-        ttk.Button(camera_controls, text="Change Camera", command=self.change_camera).pack(side=tk.LEFT, padx=(0, 10))
-        
-        # Camera feed container
+        ttk.Label(camera_controls, text="Camera:").pack(side=tk.LEFT, padx=(0, 5))
+        self.camera_select = ttk.Combobox(camera_controls, width=8, state="readonly")
+        self.camera_select.pack(side=tk.LEFT, padx=(0, 5))
+        self.camera_select.bind("<<ComboboxSelected>>", self.on_camera_selected)
+        ttk.Label(camera_controls, text="Source:").pack(side=tk.LEFT, padx=(0, 5))
+        self.camera_source_entry = ttk.Entry(camera_controls, width=24)
+        self.camera_source_entry.pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(camera_controls, text="Change Camera", command=self.change_camera).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(camera_controls, text="Add", command=self.add_camera_from_entry).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(camera_controls, text="Remove", command=self.remove_selected_camera).pack(side=tk.LEFT, padx=(0, 10))
+        
+        # Tile paging
+        ttk.Button(camera_controls, text=">", width=2, command=lambda: self.change_tile_page(1)).pack(side=tk.RIGHT)
+        self.tile_page_label = ttk.Label(camera_controls, text="")
+        self.tile_page_label.pack(side=tk.RIGHT, padx=5)
+        ttk.Button(camera_controls, text="<", width=2, command=lambda: self.change_tile_page(-1)).pack(side=tk.RIGHT)
+        
+        # Camera feed container, one tile per visible camera
         self.camera_container = ttk.Frame(camera_frame)
         self.camera_container.pack(fill=tk.BOTH, expand=True, pady=5)
         
-        self.camera_label = ttk.Label(self.camera_container)
-        self.camera_label.pack(fill=tk.BOTH, expand=True)
-        
         # Violations list
         violations_frame = ttk.LabelFrame(right_panel, text="Violations", padding="10")
         violations_frame.pack(fill=tk.BOTH, expand=True, pady=5)
         
-        self.violations_text = scrolledtext.ScrolledText(violations_frame, height=10)
-        self.violations_text.pack(fill=tk.BOTH, expand=True)
-        
-        # Fetch recent violations from Firebase
-        self.fetch_violations()
+        self.violation_browser = ViolationBrowser(violations_frame, self.engine.index)
+        self.violation_browser.pack(fill=tk.BOTH, expand=True)
         
         # Status bar
         status_bar = ttk.Label(self.root, text="Ready. Waiting for events...", relief=tk.SUNKEN, anchor=tk.W)
         status_bar.pack(side=tk.BOTTOM, fill=tk.X)
         self.status_bar = status_bar
 
-    def fetch_violations(self):
-        """Fetch recent violations from Firebase"""
-        try:
-            # Get most recent 10 violations
-            violations_ref = db.collection('violations').order_by('time', direction=firestore.Query.DESCENDING).limit(10)
-            docs = violations_ref.get()
-            
-            self.violations = []
-            for doc in docs:
-                self.violations.append(doc.to_dict())
-            
-            self.update_violations_list()
-        except Exception as e:
-            print(f"Failed to fetch violations: {str(e)}")
+    def open_diagnostics(self):
+        """Show the diagnostics window, or raise it if it is already open"""
+        if self.diagnostics is not None and self.diagnostics.window.winfo_exists():
+            self.diagnostics.window.lift()
+            return
+        self.diagnostics = DiagnosticsPanel(self.root)
 
-    def update_violations_list(self):
-        """Update the violations list in the UI"""
-        self.violations_text.delete(1.0, tk.END)
-        
-        if not self.violations:
-            self.violations_text.insert(tk.END, "No violations recorded.")
+    def open_fleet(self):
+        """Show the fleet overview, or raise it if it is already open"""
+        if self.fleet_panel is not None and self.fleet_panel.window.winfo_exists():
+            self.fleet_panel.window.lift()
             return
-            
-        for v in self.violations:
-            entry = f"Date: {v.get('date', 'Unknown')} | Time: {v.get('time', 'Unknown')}\n"
-            self.violations_text.insert(tk.END, entry)
-    
+        self.fleet_panel = FleetPanel(self.root, self.engine.fleet, self.show_site)
+
+    def show_site(self, site):
+        """Show another intersection's fleet state in the status panel, or this one again for None"""
+        if site == self.engine.site_id:
+            site = None
+        self.view_site = site
+        self.site_label.config(text=site or self.engine.site_id or "This intersection")
+        if site is None:
+            self.local_button.grid_remove()
+        else:
+            self.local_button.grid(row=5, column=2, sticky=tk.W, padx=5)
+        if self._site_after is not None:
+            self.root.after_cancel(self._site_after)
+            self._site_after = None
+        if site is not None:
+            self.poll_site()
+        self.request_render()
+
+    def poll_site(self):
+        self.request_render()
+        self._site_after = self.root.after(SITE_REFRESH_MS, self.poll_site)
+
     def override_phase(self, phase):
-        """Override the traffic light phase"""
+        """Override the traffic light phase of the intersection shown"""
         try:
-            self.mqtt_client.publish("traffic/override", phase)
-            self.status_bar.config(text=f"Override sent: {phase}")
-            print(f"Published override: {phase}")
+            self.engine.override_phase(phase, site=self.view_site)
+            self.status_bar.config(text=f"Override sent: {phase}" + (f" to {self.view_site}" if self.view_site else ""))
         except Exception as e:
             print(f"Failed to override phase: {str(e)}")
             messagebox.showerror("Error", f"Failed to override phase: {str(e)}")
 
+    def on_camera_selected(self, event=None):
+        """Show the source of the selected camera in the entry"""
+        source = self.capture.get(self.camera_select.get())
+        if source is not None:
+            self.camera_source_entry.delete(0, tk.END)
+            self.camera_source_entry.insert(0, str(source.uri))
+
     def change_camera(self):
-        """Change the active camera source"""
-        try:
-            new_index_str = self.camera_index_entry.get()
-            new_index = int(new_index_str)
-        except ValueError:
-            messagebox.showerror("Error", "Invalid camera index. Please enter a number.")
+        """Point the selected camera at a new source"""
+        name = self.camera_select.get()
+        uri = self.camera_source_entry.get().strip()
+        source = self.capture.get(name)
+        if source is None or not uri:
+            messagebox.showerror("Error", "Select a camera and enter a device index, file or URL.")
+            return
+        if str(source.uri) == uri:
+            messagebox.showinfo("Info", f"Camera {name} is already using {uri}.")
             return
+        source.reconfigure(uri=uri)
+        self.status_bar.config(text=f"Switched camera {name} to {uri}")
+        print(f"Switched camera {name} to {uri}")
 
-        if new_index == self.camera_index and self.cam and self.cam.isOpened():
-            messagebox.showinfo("Info", f"Camera index {new_index} is already active.")
+    def add_camera_from_entry(self):
+        """Add a camera for the source typed in the entry"""
+        uri = self.camera_source_entry.get().strip()
+        if not uri:
+            messagebox.showerror("Error", "Enter a device index, file or URL.")
             return
+        index = len(self.capture.names())
+        while f"cam{index}" in self.capture.names():
+            index += 1
+        self.add_camera(f"cam{index}", uri)
+        self.camera_select.set(f"cam{index}")
+        self.status_bar.config(text=f"Added camera cam{index} ({uri})")
 
-        # Signal camera loop to stop
-        self.stop_camera_signal.set()
-        if self.camera_thread and self.camera_thread.is_alive():
-            self.camera_thread.join(timeout=1.5) # Wait for the thread to finish
-
-        # Release old camera
-        if self.cam is not None:
-            self.cam.release()
-            self.cam = None
-        
-        # Clear the camera label before trying to set up a new one
-        self.camera_label.configure(image=None)
-        self.camera_label.imgtk = None
-
-        # Reset signal and setup new camera
-        self.stop_camera_signal.clear()
-        self.setup_camera(new_index) # This will update self.camera_index if successful
-
-        if self.cam and self.cam.isOpened():
-            # Update entry with the actually used index
-            self.camera_index_entry.delete(0, tk.END)
-            self.camera_index_entry.insert(0, str(self.camera_index))
-            
-            # Restart camera thread
-            self.camera_thread = threading.Thread(target=self.camera_loop, daemon=True)
-            self.camera_thread.start()
-            self.status_bar.config(text=f"Switched to camera index {self.camera_index}")
-            print(f"Successfully switched to camera index {self.camera_index}")
-        else:
-            self.status_bar.config(text=f"Failed to open camera index {new_index}. Try another.")
-            # If setup_camera failed, it already showed an error. 
-            # We might want to revert to the old index if possible or indicate no camera.
-            # For now, we just show no feed.
-            self.camera_index_entry.delete(0, tk.END)
-            self.camera_index_entry.insert(0, str(self.camera_index)) # Show last successful index
-
-    def camera_loop(self):
-        """Thread for updating the camera feed"""
-        print("Camera loop started.")
-        while not self.stop_camera_signal.is_set():
-            if self.cam is None or not self.cam.isOpened():
-                if hasattr(self, 'camera_label') and self.camera_label.winfo_exists():
-                    if self.camera_label.cget("image") != "":
-                        self.camera_label.configure(image=None)
-                        self.camera_label.imgtk = None
-                time.sleep(0.5)
-                continue
+    def remove_selected_camera(self):
+        """Remove the selected camera"""
+        name = self.camera_select.get()
+        if self.capture.get(name) is None:
+            return
+        self.remove_camera(name)
+        self.status_bar.config(text=f"Removed camera {name}")
 
-            try:
-                ret, frame = self.cam.read()
-                if ret:
-                    # Resize frame for display (increased size)
-                    frame_resized = cv2.resize(frame, (640, 480))
-                    
-                    # Convert to RGB for tkinter
-                    cv2image = cv2.cvtColor(frame_resized, cv2.COLOR_BGR2RGB)
-                    img = Image.fromarray(cv2image)
-                    imgtk = ImageTk.PhotoImage(image=img)
-                    
-                    if hasattr(self, 'camera_label') and self.camera_label.winfo_exists():
-                        self.camera_label.imgtk = imgtk
-                        self.camera_label.configure(image=imgtk)
-                else:
-                    print("Failed to read frame from camera.")
-                    if hasattr(self, 'camera_label') and self.camera_label.winfo_exists():
-                        if self.camera_label.cget("image") != "":
-                            self.camera_label.configure(image=None)
-                            self.camera_label.imgtk = None
-                    time.sleep(0.1)
-            except Exception as e:
-                print(f"Camera loop error: {str(e)}")
-                if hasattr(self, 'camera_label') and self.camera_label.winfo_exists():
-                    if self.camera_label.cget("image") != "":
-                        self.camera_label.configure(image=None)
-                        self.camera_label.imgtk = None
-                time.sleep(0.5)
-                
-            time.sleep(0.03)  # ~30 FPS
-        print("Camera loop stopped.")
+    def change_tile_page(self, step):
+        """Show the previous/next page of camera tiles"""
+        pages = max(1, -(-len(self.capture.names()) // self.config.tiles_per_page))
+        self.tile_page = (self.tile_page + step) % pages
+        self.layout_tiles()
+
+    def layout_tiles(self):
+        """Rebuild the tile grid for the current page; hidden cameras stop decoding for display"""
+        sources = self.capture.sources()
+        per_page = self.config.tiles_per_page
+        pages = max(1, -(-len(sources) // per_page))
+        self.tile_page = min(self.tile_page, pages - 1)
+        page = sources[self.tile_page * per_page:(self.tile_page + 1) * per_page]
+        
+        for source in sources:
+            source.visible = source in page
+        for name in list(self.tiles):
+            tile = self.tiles[name]
+            if tile.source not in page:
+                tile.frame.destroy()
+                del self.tiles[name]
+        
+        columns = 1 if len(page) <= 1 else self.config.tile_columns
+        rows = max(1, -(-len(page) // columns))
+        width, height = self.config.display_size
+        self.tile_size = (width // columns, height // rows)
+        for i, source in enumerate(page):
+            tile = self.tiles.get(source.name)
+            if tile is None:
+                tile = self.tiles[source.name] = CameraTile(self.camera_container, source)
+            tile.frame.grid(row=i // columns, column=i % columns, padx=2, pady=2)
+        
+        names = self.capture.names()
+        self.camera_select.configure(values=names)
+        if self.camera_select.get() not in names:
+            self.camera_select.set(names[0] if names else "")
+            self.on_camera_selected()
+        self.tile_page_label.config(text=f"{self.tile_page + 1}/{pages}")
+
+    def show_camera_frame(self):
+        """Display the newest frame of each visible camera (runs on the Tk thread)"""
+        for tile in list(self.tiles.values()):
+            tile.show(self.tile_size)
+        self.root.after(max(1, int(1000 / self.config.display_fps)), self.show_camera_frame)
+
+    def display_metrics(self):
+        """Camera preview counters, summed over the visible tiles"""
+        tiles = list(self.tiles.values())
+        return {
+            'frames_displayed': sum(t.frames_displayed for t in tiles),
+            'frames_dropped': sum(t.source.display.dropped for t in tiles),
+            'convert_ms': round(max((t.convert_ms for t in tiles), default=0.0), 2),
+        }
+
+    def snapshot(self):
+        """Current display state as {field: value}"""
+        state = self.engine.snapshot()
+        if self.view_site is not None:
+            state = self.engine.site_snapshot(self.view_site)
+        return {
+            'phase': state['phase'],
+            'h_density': str(state['h_density']),
+            'v_density': str(state['v_density']),
+            'distance': f"{state['distance']} cm",
+            'crosswalk': state['crosswalk'],
+            'broker': state['broker'],
+            'alerts': ", ".join(state['alerts']) or "None",
+            'white_line': "DANGER: Car past white line!" if state['white_line_warning'] else "",
+            'lights': PHASE_LIGHT_COLORS.get(state['phase'], ALL_GRAY),
+        }
 
     def update_ui(self):
-        """Update UI elements with current data"""
-        # Update phase label
-        self.phase_label.config(text=self.traffic_phase)
-        
-        # Update density labels
-        self.h_density_label.config(text=str(self.h_density))
-        self.v_density_label.config(text=str(self.v_density))
+        """Update UI elements whose value changed since the last render"""
+        self._render_pending = False
+        start = time.perf_counter() if REGISTRY.enabled else None
         
-        # Update distance label
-        self.distance_label.config(text=f"{self.last_distance} cm")
-        
-        # Update crosswalk label
-        self.crosswalk_label.config(text=self.crosswalk_status)
+        state = self.snapshot()
+        dirty = {field: value for field, value in state.items() if self._rendered.get(field) != value}
+        if not dirty:
+            return
         
-        # Update white line warning label - only for vertical red light
-        if (self.traffic_phase in ["H_GREEN", "H_YELLOW"] and  # Vertical lane has red light
-            self.last_distance > 0 and self.last_distance <= 15):
-            self.white_line_warning_label.config(text="DANGER: Car past white line!")
-        else:
-            self.white_line_warning_label.config(text="")
-        
-        # Update traffic light visualization
-        # Reset all lights to gray
-        self.h_red.config(foreground="gray")
-        self.h_yellow.config(foreground="gray")
-        self.h_green.config(foreground="gray")
-        self.v_red.config(foreground="gray")
-        self.v_yellow.config(foreground="gray")
-        self.v_green.config(foreground="gray")
-        
-        # Set active lights based on current phase
-        if self.traffic_phase == "H_GREEN":
-            self.h_green.config(foreground="green")
-            self.v_red.config(foreground="red")
-        elif self.traffic_phase == "H_YELLOW":
-            self.h_yellow.config(foreground="yellow")
-            self.v_red.config(foreground="red")
-        elif self.traffic_phase == "V_GREEN":
-            self.v_green.config(foreground="green")
-            self.h_red.config(foreground="red")
-        elif self.traffic_phase == "V_YELLOW":
-            self.v_yellow.config(foreground="yellow")
-            self.h_red.config(foreground="red")
-        
-        # Schedule the next update
-        self.root.after(500, self.update_ui)
+        text_widgets = {
+            'phase': self.phase_label,
+            'h_density': self.h_density_label,
+            'v_density': self.v_density_label,
+            'distance': self.distance_label,
+            'crosswalk': self.crosswalk_label,
+            'broker': self.broker_label,
+            'alerts': self.alerts_label,
+            'white_line': self.white_line_warning_label,
+        }
+        for field, value in dirty.items():
+            if field in text_widgets:
+                text_widgets[field].config(text=value)
+        
+        if 'lights' in dirty:
+            # Only recolor the individual lights that changed
+            previous = self._rendered.get('lights', (None,) * len(LIGHT_NAMES))
+            for name, old, new in zip(LIGHT_NAMES, previous, dirty['lights']):
+                if old != new:
+                    getattr(self, name).config(foreground=new)
+        
+        self._rendered.update(dirty)
+        if start is not None:
+            RENDER_SECONDS.observe(time.perf_counter() - start)
 
     def on_closing(self):
         """Handle window closing"""
         print("Closing application...")
-        self.stop_camera_signal.set() # Signal camera loop to stop
-        
-        if self.camera_thread and self.camera_thread.is_alive():
-            print("Waiting for camera thread to join...")
-            self.camera_thread.join(timeout=1.5) # Wait for camera thread to finish
-        
-        if self.cam is not None:
-            print("Releasing camera...")
-            self.cam.release()
-        
-        if self.mqtt_client:
-            print("Stopping MQTT client loop...")
-            self.mqtt_client.loop_stop()
+        self.engine.stop()
         
         print("Destroying root window...")
         self.root.destroy()
 
-if __name__ == "__main__":
+def run(engine):
+    """Start the engine and attach the Tk dashboard to it"""
     root = tk.Tk()
-    app = TrafficSystemUI(root)
+    engine.start()
+    app = TrafficSystemUI(root, engine)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
-    root.mainloop() 
\ No newline at end of file
+    root.mainloop()
+
+if __name__ == "__main__":
+    traffic_core.main(["--ui"] + sys.argv[1:])
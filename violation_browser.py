@@ -0,0 +1,196 @@
+import os
+import time
+import tkinter as tk
+from collections import OrderedDict
+from tkinter import ttk
+
+from PIL import Image, ImageTk
+
+# Rows shown per page; only the visible page exists as Treeview items
+PAGE_SIZE = 50
+
+# Decoded thumbnails kept in memory, and their size
+THUMBNAIL_CACHE_SIZE = 64
+THUMBNAIL_SIZE = (240, 180)
+
+
+class ThumbnailCache:
+    """Bounded LRU cache of violation thumbnails; used from the Tk thread only"""
+
+    def __init__(self, capacity=THUMBNAIL_CACHE_SIZE, size=THUMBNAIL_SIZE):
+        self.capacity = capacity
+        self.size = size
+        self._images = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path):
+        """PhotoImage for an image file, decoded on first use; None if it cannot be read"""
+        photo = self._images.get(path)
+        if photo is not None:
+            self._images.move_to_end(path)
+            self.hits += 1
+            return photo
+        self.misses += 1
+        try:
+            with Image.open(path) as img:
+                # Let the JPEG decoder scale down while decoding instead of after
+                img.draft('RGB', self.size)
+                img = img.convert('RGB')
+                img.thumbnail(self.size)
+                photo = ImageTk.PhotoImage(img)
+        except OSError:
+            return None
+        self._images[path] = photo
+        if len(self._images) > self.capacity:
+            self._images.popitem(last=False)
+        return photo
+
+
+class ViolationBrowser:
+    """Paginated, filterable list of violations backed by a ViolationIndex.
+
+    Pages are fetched by key, so browsing stays fast with any number of
+    violations. New violations are inserted at the top of the first page
+    without reloading the rest; records pulled in by a sync can be older than
+    the top row, so refresh() re-runs the page query instead. Thumbnails are
+    decoded only when a row is selected.
+    """
+
+    def __init__(self, parent, index, page_size=PAGE_SIZE):
+        self.index = index
+        self.page_size = page_size
+        self.thumbnails = ThumbnailCache()
+        self._rows = []  # Rows of the current page, newest first
+        self._before = None  # `before` key the current page was loaded with
+        self._page_keys = []  # `before` key of every page above the current one
+
+        self.frame = ttk.Frame(parent)
+
+        # Filters and paging
+        controls = ttk.Frame(self.frame)
+        controls.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(controls, text="Date:").pack(side=tk.LEFT, padx=(0, 5))
+        self.date_entry = ttk.Entry(controls, width=11)
+        self.date_entry.pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Label(controls, text="Approach:").pack(side=tk.LEFT, padx=(0, 5))
+        self.approach_select = ttk.Combobox(controls, width=4, state="readonly", values=("", "H", "V"))
+        self.approach_select.pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(controls, text="Filter", command=self.apply_filter).pack(side=tk.LEFT, padx=(0, 10))
+        self.count_label = ttk.Label(controls, text="")
+        self.count_label.pack(side=tk.LEFT)
+        ttk.Button(controls, text="Older", command=self.older_page).pack(side=tk.RIGHT)
+        self.page_label = ttk.Label(controls, text="")
+        self.page_label.pack(side=tk.RIGHT, padx=5)
+        ttk.Button(controls, text="Newer", command=self.newer_page).pack(side=tk.RIGHT)
+
+        # Violation rows and the thumbnail of the selected one
+        body = ttk.Frame(self.frame)
+        body.pack(fill=tk.BOTH, expand=True)
+        columns = ('date', 'time', 'camera', 'approach')
+        self.tree = ttk.Treeview(body, columns=columns, show="headings", height=8, selectmode="browse")
+        for column, width in zip(columns, (90, 90, 70, 70)):
+            self.tree.heading(column, text=column.capitalize())
+            self.tree.column(column, width=width, anchor=tk.W)
+        scrollbar = ttk.Scrollbar(body, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.LEFT, fill=tk.Y)
+        self.tree.bind("<<TreeviewSelect>>", self.on_select)
+        self.thumbnail_label = ttk.Label(body, text="No violation selected", anchor=tk.CENTER,
+                                         width=32)
+        self.thumbnail_label.pack(side=tk.LEFT, fill=tk.BOTH, padx=(10, 0))
+
+        self.load_page(None)
+
+    def pack(self, **options):
+        self.frame.pack(**options)
+
+    def filters(self):
+        return {'date': self.date_entry.get().strip() or None,
+                'approach': self.approach_select.get() or None}
+
+    def apply_filter(self):
+        """Restart from the newest page with the current filters"""
+        self._page_keys = []
+        self.load_page(None)
+
+    def older_page(self):
+        if len(self._rows) < self.page_size:
+            return
+        self._page_keys.append(self._key(self._rows[0], inclusive=True))
+        self.load_page(self._key(self._rows[-1]))
+
+    def newer_page(self):
+        if not self._page_keys:
+            return
+        self.load_page(self._page_keys.pop())
+
+    @staticmethod
+    def _key(row, inclusive=False):
+        # page() returns rows strictly before its key; nudge the key to include the row itself
+        return (row['ts'], row['id'] + "\0") if inclusive else (row['ts'], row['id'])
+
+    def load_page(self, before):
+        """Replace the visible rows with one page of violations older than `before`"""
+        self._before = before
+        self._rows = self.index.page(before, self.page_size, **self.filters())
+        self.tree.delete(*self.tree.get_children())
+        for row in self._rows:
+            self._insert(row, tk.END)
+        self._update_labels()
+
+    def refresh(self):
+        """Reload the current page from its key, keeping the selection (runs on the Tk thread).
+
+        Used after a sync, whose records may fall anywhere in the page.
+        """
+        selection = self.tree.selection()
+        self.load_page(self._before)
+        if selection and self.tree.exists(selection[0]):
+            self.tree.selection_set(selection[0])
+
+    def show_new(self):
+        """Add violations indexed since the page was loaded (runs on the Tk thread)"""
+        if self._page_keys:
+            # Not on the newest page; only the count changes
+            self._update_labels()
+            return
+        if not self._rows:
+            self.load_page(None)
+            return
+        new_rows = self.index.page_after(self._key(self._rows[0]), self.page_size, **self.filters())
+        for row in reversed(new_rows):
+            self._insert(row, 0)
+        self._rows = (new_rows + self._rows)[:self.page_size]
+        for item in self.tree.get_children()[self.page_size:]:
+            self.tree.delete(item)
+        self._update_labels()
+
+    def _insert(self, row, position):
+        stamp = time.localtime(row['ts'])
+        self.tree.insert("", position, iid=row['id'],
+                         values=(row['date'], time.strftime("%H:%M:%S", stamp),
+                                 row['camera'] or "", row['approach'] or ""))
+
+    def _update_labels(self):
+        total = self.index.count(**self.filters())
+        self.count_label.config(text=f"{total} violations" if total else "No violations recorded.")
+        first = len(self._page_keys) * self.page_size
+        if self._rows:
+            self.page_label.config(text=f"{first + 1}-{first + len(self._rows)}")
+        else:
+            self.page_label.config(text="")
+
+    def on_select(self, event=None):
+        """Show the key frame of the selected violation"""
+        selection = self.tree.selection()
+        if not selection:
+            return
+        record = self.index.get(selection[0])
+        path = record.get('image_filename') if record else None
+        photo = self.thumbnails.get(path) if path and os.path.exists(path) else None
+        if photo is None:
+            self.thumbnail_label.configure(image="", text="Image not available on this host")
+        else:
+            self.thumbnail_label.configure(image=photo, text="")
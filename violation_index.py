@@ -0,0 +1,211 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from metrics import REGISTRY
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS violations (
+    id TEXT PRIMARY KEY,
+    ts REAL NOT NULL,
+    date TEXT NOT NULL,
+    approach TEXT,
+    camera TEXT,
+    image_filename TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_violations_ts ON violations (ts, id);
+CREATE INDEX IF NOT EXISTS idx_violations_date_approach ON violations (date, approach, ts, id);
+CREATE INDEX IF NOT EXISTS idx_violations_approach ON violations (approach, ts, id);
+CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+COLUMNS = "id, ts, date, approach, camera, image_filename"
+
+READ_SECONDS = REGISTRY.histogram('traffic_backend_read_seconds', "Backend (Firestore) read time per sync query",
+                                  labels=('result',))
+
+
+def record_timestamp(record):
+    """Real timestamp of a violation record; older records only have date + time strings"""
+    if record.get('timestamp') is not None:
+        return float(record['timestamp'])
+    try:
+        return datetime.strptime(f"{record['date']} {record['time']}", "%Y-%m-%d %H:%M:%S").timestamp()
+    except (KeyError, ValueError):
+        return 0.0
+
+
+class ViolationIndex:
+    """Local SQLite index of violations, keyed on a real timestamp.
+
+    Pages are read with keyset pagination on (ts, id), so the cost of a page
+    does not depend on how deep it is or how many violations exist.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def upsert(self, records):
+        """Insert or update records; returns how many were new or changed"""
+        rows = []
+        for record in records:
+            ts = record_timestamp(record)
+            date = record.get('date') or time.strftime("%Y-%m-%d", time.localtime(ts))
+            rows.append((record['id'], ts, date, record.get('approach'), record.get('camera'),
+                         record.get('image_filename'), json.dumps(record, default=str, sort_keys=True)))
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT INTO violations (id, ts, date, approach, camera, image_filename, record) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET ts=excluded.ts, date=excluded.date, approach=excluded.approach, "
+                "camera=excluded.camera, image_filename=excluded.image_filename, record=excluded.record "
+                "WHERE record != excluded.record",
+                rows)
+            self._conn.commit()
+            return self._conn.total_changes - before
+
+    @staticmethod
+    def _filters(date, approach):
+        clauses, params = [], []
+        if date:
+            clauses.append("date = ?")
+            params.append(date)
+        if approach:
+            clauses.append("approach = ?")
+            params.append(approach)
+        return clauses, params
+
+    def _rows(self, sql, params):
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(zip(('id', 'ts', 'date', 'approach', 'camera', 'image_filename'), row)) for row in rows]
+
+    def page(self, before=None, limit=50, date=None, approach=None):
+        """Up to limit violations older than the (ts, id) key `before`, newest first"""
+        clauses, params = self._filters(date, approach)
+        if before is not None:
+            clauses.append("(ts, id) < (?, ?)")
+            params.extend(before)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._rows(f"SELECT {COLUMNS} FROM violations {where} ORDER BY ts DESC, id DESC LIMIT ?",
+                          params + [limit])
+
+    def page_after(self, after, limit=50, date=None, approach=None):
+        """Up to limit violations newer than the (ts, id) key `after`, newest first"""
+        clauses, params = self._filters(date, approach)
+        clauses.append("(ts, id) > (?, ?)")
+        params.extend(after)
+        rows = self._rows(f"SELECT {COLUMNS} FROM violations WHERE {' AND '.join(clauses)} "
+                          f"ORDER BY ts ASC, id ASC LIMIT ?", params + [limit])
+        return rows[::-1]
+
+    def count(self, date=None, approach=None):
+        clauses, params = self._filters(date, approach)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM violations {where}", params).fetchone()[0]
+
+    def get(self, violation_id):
+        with self._lock:
+            row = self._conn.execute("SELECT record FROM violations WHERE id = ?", (violation_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_state(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, str(value)))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ViolationSync:
+    """Pulls violations from the backend into the local index incrementally.
+
+    The first run backfills everything (including records that predate the
+    timestamp field); after that only records newer than the stored
+    watermark are fetched. Each sync re-reads `overlap` seconds before the
+    watermark so records uploaded late from another host's spool are still
+    picked up; upserts make the re-read harmless.
+    """
+
+    def __init__(self, index, backend, interval=30.0, batch_size=500, overlap=300.0):
+        self.index = index
+        self.backend = backend
+        self.interval = interval
+        self.batch_size = batch_size
+        self.overlap = overlap
+        self.on_synced = None  # Optional callback(count) after new records arrived
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="violation-sync")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.5)
+
+    def sync_once(self):
+        """Fetch new records; returns how many were indexed"""
+        total = 0
+        if self.index.get_state('backfilled') is None:
+            records = self._read(lambda: list(self.backend.all()))
+            total += self.index.upsert(records)
+            watermark = max((record_timestamp(r) for r in records), default=0.0)
+            self.index.set_state('watermark', watermark)
+            self.index.set_state('backfilled', 1)
+        watermark = float(self.index.get_state('watermark', 0.0))
+        since = max(0.0, watermark - self.overlap)
+        while True:
+            records = self._read(lambda: self.backend.since(since, self.batch_size))
+            if not records:
+                break
+            total += self.index.upsert(records)
+            since = max(record_timestamp(r) for r in records)
+            if since > watermark:
+                watermark = since
+                self.index.set_state('watermark', watermark)
+            if len(records) < self.batch_size:
+                break
+        return total
+
+    def _read(self, query):
+        """Run one backend query, with timing when metrics are on"""
+        if not REGISTRY.enabled:
+            return query()
+        start = time.perf_counter()
+        try:
+            records = query()
+        except Exception:
+            READ_SECONDS.observe(time.perf_counter() - start, 'error')
+            raise
+        READ_SECONDS.observe(time.perf_counter() - start, 'ok')
+        return records
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                count = self.sync_once()
+                if count and self.on_synced is not None:
+                    self.on_synced(count)
+            except Exception as e:
+                print(f"Violation sync failed: {str(e)}")
+            self._stop.wait(self.interval)
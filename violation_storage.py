@@ -0,0 +1,386 @@
+"""Lifecycle of the evidence files in the violations directory.
+
+Every image and clip is tracked in a small SQLite database next to the
+spool, together with whether its record has reached the backend. A
+low-priority background worker keeps the directory within its disk
+budget: it removes near-identical frames from bursts, recompresses older
+images, and deletes evidence past its retention age or when the disk
+budget is exceeded, oldest and already uploaded first.
+"""
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+
+import cv2
+
+from metrics import REGISTRY
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg')
+CLIP_EXTENSIONS = ('.mp4', '.avi', '.mkv')
+
+# A file still missing this long after its violation is never coming
+# (dropped by a full queue, failed encode or a clip cut short)
+WRITE_GRACE = 120.0
+
+# Files are only hashed or rewritten once they have been left alone this long
+SETTLE_SECONDS = 2.0
+
+# Share of wall time the worker spends working while it has work to do
+WORKER_DUTY_CYCLE = 0.25
+
+# Rows handled per database round trip
+BATCH_SIZE = 50
+
+# Burst frames of adopted files: <stem>_NN.jpg
+BURST_NAME = re.compile(r'^(.*)_\d+$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    path TEXT PRIMARY KEY,
+    violation_id TEXT,
+    kind TEXT NOT NULL,
+    seq INTEGER NOT NULL DEFAULT 0,
+    key_frame INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    upload TEXT NOT NULL,
+    state TEXT NOT NULL,
+    phash TEXT,
+    duplicate_of TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_artifacts_state ON artifacts (state, created);
+CREATE INDEX IF NOT EXISTS idx_artifacts_violation ON artifacts (violation_id, seq);
+"""
+
+# Artifact states: written files are 'original' or 'compressed'; 'expected'
+# ones have not been written yet; the rest are gone from disk
+LIVE_STATES = ('original', 'compressed')
+
+STORAGE_BYTES = REGISTRY.gauge('traffic_storage_bytes', "Evidence kept in the violations directory",
+                               labels=('upload',))
+STORAGE_FREED = REGISTRY.counter('traffic_storage_freed_bytes', "Evidence bytes freed by the storage manager",
+                                 labels=('reason',))
+
+
+def dhash(image):
+    """64-bit difference hash of a grayscale image, as 16 hex digits"""
+    small = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA)
+    value = 0
+    for bit in (small[:, 1:] > small[:, :-1]).flatten():
+        value = value << 1 | int(bit)
+    return f"{value:016x}"
+
+
+def hash_distance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def lower_thread_priority():
+    """Give the calling thread the lowest CPU priority where the OS allows it (Linux)"""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+
+class RetentionPolicy:
+    """Disk budget and evidence ageing; None turns a rule off"""
+
+    __slots__ = ('quota_bytes', 'min_free_bytes', 'max_age_days', 'recompress_after_days',
+                 'recompress_quality', 'recompress_max_width', 'dedupe_distance')
+
+    def __init__(self, quota_bytes=None, min_free_bytes=None, max_age_days=None, recompress_after_days=None,
+                 recompress_quality=60, recompress_max_width=None, dedupe_distance=None):
+        self.quota_bytes = quota_bytes
+        self.min_free_bytes = min_free_bytes
+        self.max_age_days = max_age_days
+        self.recompress_after_days = recompress_after_days
+        self.recompress_quality = recompress_quality
+        self.recompress_max_width = recompress_max_width
+        self.dedupe_distance = dedupe_distance
+
+
+class StorageManager:
+    """Tracks violation evidence files and keeps their directory within budget.
+
+    track() registers a violation's files before they are written and
+    mark_uploaded() records that its record reached the backend. Files
+    already in the directory when tracking starts are adopted with an
+    unknown upload state. Every `interval` seconds the worker:
+
+      - notes which expected files were written (or never will be)
+      - deletes burst frames whose perceptual hash is within
+        dedupe_distance bits of the previous kept frame; key frames stay
+      - deletes uploaded (or adopted) evidence older than max_age_days
+      - re-encodes images older than recompress_after_days at a lower
+        JPEG quality and at most recompress_max_width wide, in place
+      - while over quota_bytes or under min_free_bytes of free disk,
+        deletes the oldest evidence, uploaded first
+
+    Records keep their file names; a deleted file simply stops showing.
+    The worker runs at the lowest thread priority and sleeps between
+    files so capture and encoding keep the CPU and the SD card.
+    """
+
+    def __init__(self, root, db_path, policy=None, interval=60.0):
+        self.root = root
+        self.policy = policy or RetentionPolicy()
+        self.interval = interval
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._adopted = False
+
+    # Bookkeeping, called from engine threads
+
+    def track(self, record):
+        """Register the files of a violation record before they are written"""
+        rows = [(filename, record['id'], 'image', i, int(filename == record.get('image_filename')),
+                 record['timestamp'])
+                for i, filename in enumerate(record.get('burst_filenames') or [record['image_filename']])]
+        if record.get('clip_filename'):
+            rows.append((record['clip_filename'], record['id'], 'clip', len(rows), 0, record['timestamp']))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO artifacts (path, violation_id, kind, seq, key_frame, created, upload, state) "
+                "VALUES (?, ?, ?, ?, ?, ?, 'pending', 'expected')", rows)
+            self._conn.commit()
+
+    def mark_uploaded(self, records):
+        """Note that these records were committed to the backend"""
+        with self._lock:
+            self._conn.executemany("UPDATE artifacts SET upload = 'uploaded' WHERE violation_id = ?",
+                                   [(record['id'],) for record in records])
+            self._conn.commit()
+
+    def usage(self):
+        """Bytes on disk per upload state ('pending', 'uploaded', 'unknown')"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT upload, SUM(bytes) FROM artifacts WHERE state IN {LIVE_STATES} GROUP BY upload").fetchall()
+        return {upload: total or 0 for upload, total in rows}
+
+    def stats(self):
+        """Artifact counts per state plus bytes kept per upload state"""
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM artifacts GROUP BY state").fetchall()
+        stats = dict(rows)
+        stats['bytes'] = self.usage()
+        return stats
+
+    # Background maintenance
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="violation-storage")
+        self._thread.start()
+
+    def stop(self):
+        """Stop the worker after the file it is on; tracking keeps working until close()"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _loop(self):
+        lower_thread_priority()
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Storage maintenance failed: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def run_once(self, now=None):
+        """One maintenance pass; returns {reason: bytes freed}"""
+        now = time.time() if now is None else now
+        policy = self.policy
+        freed = {}
+        if not self._adopted:
+            self._adopt()
+            self._adopted = True
+        self._settle(now)
+        if policy.dedupe_distance is not None:
+            freed['duplicate'] = self._dedupe(policy.dedupe_distance)
+        if policy.max_age_days is not None:
+            freed['expired'] = self._expire_older_than(now - policy.max_age_days * 86400)
+        if policy.recompress_after_days is not None:
+            freed['recompressed'] = self._recompress(now - policy.recompress_after_days * 86400, policy)
+        freed['over_quota'] = self._enforce_quota(policy)
+        freed = {reason: amount for reason, amount in freed.items() if amount}
+        if freed:
+            if REGISTRY.enabled:
+                for reason, amount in freed.items():
+                    STORAGE_FREED.inc(reason, amount=amount)
+            details = ", ".join(f"{amount / 2 ** 20:.1f} MB {reason}" for reason, amount in freed.items())
+            print(f"Violation storage: freed {details}; {sum(self.usage().values()) / 2 ** 20:.1f} MB kept")
+        return freed
+
+    def _pace(self, started):
+        """Sleep so the worker stays near WORKER_DUTY_CYCLE; False once stopping"""
+        busy = time.perf_counter() - started
+        return not self._stop.wait(busy * (1.0 / WORKER_DUTY_CYCLE - 1.0))
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _update(self, sql, rows):
+        with self._lock:
+            self._conn.executemany(sql, rows)
+            self._conn.commit()
+
+    def _adopt(self):
+        """Track evidence written before tracking existed (or by another run without it)"""
+        known = {path for (path,) in self._query("SELECT path FROM artifacts")}
+        rows = []
+        for entry in os.scandir(self.root):
+            stem, ext = os.path.splitext(entry.name)
+            ext = ext.lower()
+            if (not entry.is_file() or stem.endswith('.part') or entry.path in known
+                    or ext not in IMAGE_EXTENSIONS + CLIP_EXTENSIONS):
+                continue
+            stat = entry.stat()
+            match = BURST_NAME.match(stem)
+            rows.append((entry.path, match.group(1) if match else stem,
+                         'image' if ext in IMAGE_EXTENSIONS else 'clip', stat.st_mtime, stat.st_size))
+        if rows:
+            self._update("INSERT OR IGNORE INTO artifacts (path, violation_id, kind, created, bytes, upload, state) "
+                         "VALUES (?, ?, ?, ?, ?, 'unknown', 'original')", rows)
+            print(f"Violation storage: tracking {len(rows)} existing file(s)")
+
+    def _settle(self, now):
+        """Record the size of expected files that were written; give up on overdue ones"""
+        written, missing = [], []
+        for (path,) in self._query("SELECT path FROM artifacts WHERE state = 'expected'"):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+            if stat is not None and now - stat.st_mtime >= SETTLE_SECONDS:
+                written.append((stat.st_size, path))
+            elif stat is None:
+                missing.append((path, now - WRITE_GRACE))
+        self._update("UPDATE artifacts SET state = 'original', bytes = ? WHERE path = ?", written)
+        self._update("UPDATE artifacts SET state = 'missing' WHERE path = ? AND created < ?", missing)
+
+    def _dedupe(self, distance):
+        """Delete burst frames that look the same as the frame kept before them"""
+        freed = 0
+        # Only bursts whose frames have all been written, and only once per burst
+        violations = self._query(
+            "SELECT violation_id FROM artifacts WHERE kind = 'image' AND phash IS NULL AND state = 'original' "
+            "AND upload != 'unknown' GROUP BY violation_id HAVING violation_id NOT IN "
+            "(SELECT violation_id FROM artifacts WHERE state = 'expected' AND violation_id IS NOT NULL) "
+            "LIMIT ?", (BATCH_SIZE,))
+        for (violation_id,) in violations:
+            frames = self._query("SELECT path, key_frame, bytes FROM artifacts WHERE violation_id = ? "
+                                 "AND kind = 'image' AND state = 'original' ORDER BY seq", (violation_id,))
+            kept_path, kept_hash = None, None
+            for path, key_frame, size in frames:
+                started = time.perf_counter()
+                image = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+                if image is None:
+                    self._update("UPDATE artifacts SET state = 'missing', bytes = 0 WHERE path = ?", [(path,)])
+                    continue
+                phash = dhash(image)
+                if not key_frame and kept_hash is not None and hash_distance(phash, kept_hash) <= distance:
+                    self._remove(path)
+                    self._update("UPDATE artifacts SET state = 'duplicate', bytes = 0, phash = ?, duplicate_of = ? "
+                                 "WHERE path = ?", [(phash, kept_path, path)])
+                    freed += size
+                else:
+                    self._update("UPDATE artifacts SET phash = ? WHERE path = ?", [(phash, path)])
+                    kept_path, kept_hash = path, phash
+                if not self._pace(started):
+                    return freed
+        return freed
+
+    def _recompress(self, before, policy):
+        """Re-encode images captured before `before` smaller, keeping their names"""
+        freed = 0
+        params = [cv2.IMWRITE_JPEG_QUALITY, policy.recompress_quality]
+        rows = self._query("SELECT path, bytes FROM artifacts WHERE kind = 'image' AND state = 'original' "
+                           "AND created < ? ORDER BY created LIMIT ?", (before, BATCH_SIZE))
+        for path, size in rows:
+            started = time.perf_counter()
+            image = cv2.imread(path)
+            if image is None:
+                self._update("UPDATE artifacts SET state = 'missing', bytes = 0 WHERE path = ?", [(path,)])
+                continue
+            width = image.shape[1]
+            if policy.recompress_max_width and width > policy.recompress_max_width:
+                height = round(image.shape[0] * policy.recompress_max_width / width)
+                image = cv2.resize(image, (policy.recompress_max_width, height), interpolation=cv2.INTER_AREA)
+            ok, buf = cv2.imencode('.jpg', image, params)
+            new_size = size
+            if ok and buf.size < size:
+                # Written under a temporary name so the evidence is never half-written
+                root, ext = os.path.splitext(path)
+                partial = f"{root}.part{ext}"
+                buf.tofile(partial)
+                os.replace(partial, path)
+                new_size = buf.size
+                freed += size - new_size
+            self._update("UPDATE artifacts SET state = 'compressed', bytes = ? WHERE path = ?", [(new_size, path)])
+            if not self._pace(started):
+                break
+        return freed
+
+    def _expire_older_than(self, before):
+        """Delete uploaded and adopted evidence captured before `before`"""
+        rows = self._query(f"SELECT path, bytes FROM artifacts WHERE state IN {LIVE_STATES} "
+                           f"AND upload != 'pending' AND created < ?", (before,))
+        return self._delete(rows)
+
+    def _enforce_quota(self, policy):
+        """Delete the oldest evidence while over quota or short of free disk"""
+        excess = 0
+        if policy.quota_bytes is not None:
+            excess = sum(self.usage().values()) - policy.quota_bytes
+        if policy.min_free_bytes is not None:
+            excess = max(excess, policy.min_free_bytes - shutil.disk_usage(self.root).free)
+        freed = 0
+        warned = False
+        while excess > 0 and not self._stop.is_set():
+            # Uploaded and adopted evidence goes first; un-uploaded only when nothing else is left
+            rows = self._query(f"SELECT path, bytes, upload FROM artifacts WHERE state IN {LIVE_STATES} "
+                               f"ORDER BY upload = 'pending', created, path LIMIT ?", (BATCH_SIZE,))
+            if not rows:
+                break
+            batch = []
+            for path, size, upload in rows:
+                if excess <= 0:
+                    break
+                if upload == 'pending' and not warned:
+                    print("Violation storage over budget with only un-uploaded evidence left; deleting the oldest")
+                    warned = True
+                batch.append((path, size))
+                excess -= size
+            freed += self._delete(batch)
+        return freed
+
+    def _delete(self, rows):
+        """Remove files and mark them expired; returns the bytes freed"""
+        for path, _ in rows:
+            self._remove(path)
+        self._update("UPDATE artifacts SET state = 'expired', bytes = 0 WHERE path = ?", [(path,) for path, _ in rows])
+        return sum(size for _, size in rows)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
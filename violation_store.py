@@ -0,0 +1,294 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+import cv2
+
+from metrics import REGISTRY
+
+# Firestore rejects batches with more than 500 writes
+FIRESTORE_MAX_BATCH = 500
+
+ENCODE_SECONDS = REGISTRY.histogram('traffic_violation_encode_seconds', "JPEG encode and write time per image")
+COMMIT_SECONDS = REGISTRY.histogram('traffic_backend_commit_seconds', "Backend (Firestore) batch commit time",
+                                    labels=('result',))
+PERSIST_LATENCY = REGISTRY.histogram('traffic_violation_persist_latency_seconds',
+                                     "Time from the violation event to its record being committed",
+                                     buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 3600.0))
+
+
+class FirestoreBackend:
+    """Writes violation records to Firestore using batched commits"""
+
+    def __init__(self, db, collection='violations'):
+        self.db = db
+        self.collection = collection
+
+    def commit(self, records):
+        batch = self.db.batch()
+        collection = self.db.collection(self.collection)
+        for record in records:
+            # The record id doubles as the document id so replays are idempotent
+            batch.set(collection.document(record['id']), record)
+        batch.commit()
+
+    def all(self):
+        """Every violation document, including ones written before records had a timestamp"""
+        return [doc.to_dict() for doc in self.db.collection(self.collection).stream()]
+
+    def since(self, timestamp, limit=500):
+        """Up to limit violations with a timestamp after the given one, oldest first"""
+        from google.cloud.firestore_v1.base_query import FieldFilter
+        query = (self.db.collection(self.collection)
+                 .where(filter=FieldFilter('timestamp', '>', timestamp))
+                 .order_by('timestamp')
+                 .limit(limit))
+        return [doc.to_dict() for doc in query.get()]
+
+
+class FakeBackend:
+    """In-memory stand-in for Firestore, for running the pipeline offline"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.online = True
+        self.documents = {}
+        self.commits = 0
+        self._lock = threading.Lock()
+
+    def commit(self, records):
+        if self.latency:
+            time.sleep(self.latency)
+        if not self.online:
+            raise ConnectionError("Fake backend is offline")
+        with self._lock:
+            for record in records:
+                self.documents[record['id']] = dict(record)
+            self.commits += 1
+
+    def all(self):
+        if not self.online:
+            raise ConnectionError("Fake backend is offline")
+        with self._lock:
+            return [dict(r) for r in self.documents.values()]
+
+    def since(self, timestamp, limit=500):
+        if not self.online:
+            raise ConnectionError("Fake backend is offline")
+        with self._lock:
+            records = [dict(r) for r in self.documents.values() if r.get('timestamp', 0) > timestamp]
+        records.sort(key=lambda r: r['timestamp'])
+        return records[:limit]
+
+
+class Spool:
+    """Append-only SQLite spool for records that could not be uploaded"""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS spool (seq INTEGER PRIMARY KEY AUTOINCREMENT, record TEXT NOT NULL)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def append(self, records):
+        with self._lock:
+            self._conn.executemany("INSERT INTO spool (record) VALUES (?)",
+                                   [(json.dumps(r),) for r in records])
+            self._conn.commit()
+
+    def peek(self, limit):
+        """Return up to limit [(seq, record), ...], oldest first"""
+        with self._lock:
+            rows = self._conn.execute("SELECT seq, record FROM spool ORDER BY seq LIMIT ?", (limit,)).fetchall()
+        return [(seq, json.loads(record)) for seq, record in rows]
+
+    def remove(self, seqs):
+        with self._lock:
+            self._conn.executemany("DELETE FROM spool WHERE seq = ?", [(s,) for s in seqs])
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ViolationPersister:
+    """Background pipeline that encodes violation images and uploads records.
+
+    submit() never blocks: jobs go into a bounded queue, a small pool of
+    encoder threads writes the JPEGs, and a single writer thread groups
+    records into batched backend commits. Records that cannot be committed
+    are spooled to disk and replayed, in order, once the backend is back.
+    on_committed(records), if set, runs on the writer thread after every
+    successful commit.
+    """
+
+    def __init__(self, backend, spool_path, queue_size=100, encode_workers=2,
+                 batch_size=20, flush_interval=1.0, retry_interval=5.0, jpeg_quality=90):
+        self.backend = backend
+        self.spool = Spool(spool_path)
+        self.batch_size = min(batch_size, FIRESTORE_MAX_BATCH)
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.jpeg_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+
+        self._jobs = queue.Queue(maxsize=queue_size)
+        self._records = queue.Queue()
+        self._stop = threading.Event()
+        self._closing = threading.Event()  # Set by stop(): encoders exit once the job queue is empty
+        self._next_retry = 0.0
+        self.dropped = 0
+        self.uploaded = 0
+        self.on_committed = None
+
+        self._encoders = [threading.Thread(target=self._encode_loop, daemon=True, name=f"violation-encoder-{i}")
+                          for i in range(encode_workers)]
+        self._writer = threading.Thread(target=self._write_loop, daemon=True, name="violation-writer")
+        for t in self._encoders:
+            t.start()
+        self._writer.start()
+
+    @staticmethod
+    def new_record(timestamp, image_filename, burst_filenames=None, **extra):
+        """Build a violation record with a unique id and a real timestamp"""
+        stamp = time.localtime(timestamp)
+        record = {
+            'id': uuid.uuid4().hex,
+            'timestamp': timestamp,
+            'date': time.strftime("%Y-%m-%d", stamp),
+            'time': time.strftime("%H:%M:%S", stamp),
+            'image_filename': image_filename,
+            'burst_filenames': burst_filenames or [image_filename]
+        }
+        record.update(extra)
+        return record
+
+    def submit(self, record, images):
+        """Queue a record plus [(filename, frame), ...] for persistence.
+
+        Returns False if the queue is full and the violation was dropped.
+        """
+        try:
+            self._jobs.put_nowait((record, images))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            print(f"Persistence queue full, dropped violation {record['id']}")
+            return False
+
+    def queue_depth(self):
+        return self._jobs.qsize() + self._records.qsize()
+
+    def _encode_loop(self):
+        while not (self._closing.is_set() and self._jobs.empty()):
+            try:
+                record, images = self._jobs.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            for filename, frame in images:
+                start = time.perf_counter() if REGISTRY.enabled else None
+                try:
+                    ok, buf = cv2.imencode('.jpg', frame, self.jpeg_params)
+                    if ok:
+                        buf.tofile(filename)
+                    else:
+                        print(f"Failed to encode violation image {filename}")
+                except Exception as e:
+                    print(f"Failed to save violation image {filename}: {str(e)}")
+                if start is not None:
+                    ENCODE_SECONDS.observe(time.perf_counter() - start)
+            self._records.put(record)
+
+    def _write_loop(self):
+        while not (self._stop.is_set() and self._records.empty()):
+            batch = self._collect_batch()
+            if batch:
+                if len(self.spool):
+                    # Keep upload order: new records queue behind the spooled ones
+                    self.spool.append(batch)
+                else:
+                    self._commit_or_spool(batch)
+            if len(self.spool) and time.monotonic() >= self._next_retry:
+                self._replay_spool()
+
+    def _collect_batch(self):
+        """Gather up to batch_size records, waiting at most flush_interval"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._records.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _commit(self, records):
+        """backend.commit() with timing when metrics are on"""
+        if not REGISTRY.enabled:
+            self.backend.commit(records)
+        else:
+            start = time.perf_counter()
+            try:
+                self.backend.commit(records)
+            except Exception:
+                COMMIT_SECONDS.observe(time.perf_counter() - start, 'error')
+                raise
+            COMMIT_SECONDS.observe(time.perf_counter() - start, 'ok')
+            now = time.time()
+            for record in records:
+                PERSIST_LATENCY.observe(now - record['timestamp'])
+        if self.on_committed is not None:
+            try:
+                self.on_committed(records)
+            except Exception as e:
+                print(f"Commit callback failed: {str(e)}")
+
+    def _commit_or_spool(self, batch):
+        try:
+            self._commit(batch)
+            self.uploaded += len(batch)
+            print(f"Uploaded {len(batch)} violation(s)")
+        except Exception as e:
+            print(f"Backend unavailable, spooling {len(batch)} violation(s): {str(e)}")
+            self.spool.append(batch)
+            self._next_retry = time.monotonic() + self.retry_interval
+
+    def _replay_spool(self):
+        while not self._stop.is_set():
+            rows = self.spool.peek(self.batch_size)
+            if not rows:
+                return
+            try:
+                self._commit([record for _, record in rows])
+            except Exception as e:
+                print(f"Spool replay failed, retrying in {self.retry_interval:.0f}s: {str(e)}")
+                self._next_retry = time.monotonic() + self.retry_interval
+                return
+            self.spool.remove([seq for seq, _ in rows])
+            self.uploaded += len(rows)
+            print(f"Replayed {len(rows)} spooled violation(s)")
+
+    def stop(self, timeout=5.0):
+        """Finish queued work and stop the worker threads"""
+        # Encoders drain the job queue, then exit; nothing here blocks on a full queue
+        self._closing.set()
+        for t in self._encoders:
+            t.join(timeout=timeout)
+        self._stop.set()
+        self._writer.join(timeout=timeout)
+        if self._writer.is_alive():
+            # A slow commit is still running; the spool must stay open for it
+            print("Violation writer did not finish in time; leaving the spool open")
+            return
+        self.spool.close()